@@ -7,7 +7,9 @@ from flask_httpauth import HTTPBasicAuth
 
 from .backends import base as mbe_base
 from .common import APPLICATION_INSTANCE
+from .credentials import CREDENTIAL_CACHE, check_credentials
 from .exceptions import BackendError, InitializationError, ProcessingError
+from .instrumentation import INSTRUMENTATION
 from .version import __version__  # noqa
 from .views import MEDIA_TYPE_TAXII_V21
 
@@ -31,6 +33,14 @@ def set_config(flask_application_instance, prop_name, config):
             flask_application_instance.taxii_config = {'max_page_size': 100}
         if "interop_requirements" not in flask_application_instance.taxii_config:
             flask_application_instance.taxii_config["interop_requirements"] = False
+        CREDENTIAL_CACHE.configure(
+            flask_application_instance.taxii_config.get("credential_cache_ttl"),
+            flask_application_instance.taxii_config.get("credential_cache_size"),
+        )
+        INSTRUMENTATION.configure(
+            flask_application_instance.taxii_config.get("server_timing", False),
+            flask_application_instance.taxii_config.get("metrics", False),
+        )
     elif prop_name == "users":
         try:
             flask_application_instance.users_config = config[prop_name]
@@ -40,6 +50,8 @@ def set_config(flask_application_instance, prop_name, config):
             log.warning("User = user")
             log.warning("Pass = pass")
             flask_application_instance.users_config = {"user": "pass"}
+        check_credentials(flask_application_instance.users_config)
+        CREDENTIAL_CACHE.clear()
     elif prop_name == "backend":
         if prop_name in config:
             flask_application_instance.backend_config = config[prop_name]
@@ -91,14 +103,18 @@ def connect_to_backend(config_info, clear_db=False):
     # Finally, instantiate the backend class with the configuration passed in
     try:
         config_info["clear_db"] = clear_db
-        return backend_cls(**config_info)
+        backend = backend_cls(**config_info)
     except BaseException as exc:
         log.error("Failed to instantiate %r: %s", backend_cls_name, exc)
         raise exc
+    # the back-end methods are timed when the taxii configuration enables instrumentation
+    return INSTRUMENTATION.wrap(backend)
 
 
 def register_blueprints(flask_application_instance):
-    from medallion.views import collections, discovery, manifest, objects
+    from medallion.views import (
+        collections, discovery, manifest, metrics, objects
+    )
 
     with flask_application_instance.app_context():
         log.debug("Registering medallion blueprints into {}".format(current_app))
@@ -106,15 +122,34 @@ def register_blueprints(flask_application_instance):
         current_app.register_blueprint(discovery.discovery_bp)
         current_app.register_blueprint(manifest.manifest_bp)
         current_app.register_blueprint(objects.objects_bp)
+        current_app.register_blueprint(metrics.metrics_bp)
 
 
-@auth.get_password
 def get_pwd(username):
     if username in current_app.users_config:
         return current_app.users_config.get(username)
     return None
 
 
+@auth.verify_password
+def verify_pwd(username, password):
+    with INSTRUMENTATION.phase("auth"):
+        credential = get_pwd(username)
+        if credential is not None and CREDENTIAL_CACHE.verify(username, password, credential):
+            return username
+    return None
+
+
+@APPLICATION_INSTANCE.before_request
+def start_timing():
+    INSTRUMENTATION.start_request()
+
+
+@APPLICATION_INSTANCE.after_request
+def report_timing(response):
+    return INSTRUMENTATION.finish_request(response)
+
+
 @APPLICATION_INSTANCE.errorhandler(500)
 def handle_error(error):
     e = {
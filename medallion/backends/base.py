@@ -2,9 +2,11 @@ import logging
 from urllib.parse import urlparse
 
 from ..common import (
-    APPLICATION_INSTANCE, TaskChecker, get_application_instance_config_values
+    APPLICATION_INSTANCE, MAINTENANCE_SCHEDULER,
+    get_application_instance_config_values
 )
-from ..exceptions import InitializationError
+from ..exceptions import InitializationError, ProcessingError
+from .sessions import MemorySessionStore
 
 # Module-level logger
 log = logging.getLogger(__name__)
@@ -46,26 +48,41 @@ class BackendRegistry(type):
 class Backend(object, metaclass=BackendRegistry):
 
     def __init__(self, **kwargs):
-        self.next = {}
+        if getattr(self, "next", None) is None:
+            self.next = MemorySessionStore()
+        self.maintenance_jobs = []
 
         interop_requirements_enforced = get_application_instance_config_values(APPLICATION_INSTANCE, "taxii", "interop_requirements")
         if kwargs.get("run_cleanup_threads", True):
+            MAINTENANCE_SCHEDULER.configure(kwargs.get("maintenance_jitter"), kwargs.get("maintenance_workers"))
             self.timeout = kwargs.get("session_timeout", 30)
-            checker = TaskChecker(kwargs.get("check_interval", 10), self._pop_expired_sessions)
-            checker.start()
+            if self.next.needs_sweeping:
+                self._schedule_maintenance(kwargs.get("check_interval", 10), self._pop_expired_sessions)
 
             self.status_retention = kwargs.get("status_retention", SECONDS_IN_24_HOURS)
             if self.status_retention != -1:
                 if self.status_retention < SECONDS_IN_24_HOURS and interop_requirements_enforced:
                     # interop MUST requirement
                     raise InitializationError("Status retention interval must be more than 24 hours", 408)
-                status_checker = TaskChecker(kwargs.get("check_interval", 10), self._pop_old_statuses)
-                status_checker.start()
+                self._schedule_maintenance(kwargs.get("check_interval", 10), self._pop_old_statuses)
         else:
             if interop_requirements_enforced:
                 # interop MUST requirement
                 raise InitializationError("Status retention interval must be more than 24 hours", 408)
 
+    def _schedule_maintenance(self, interval, target_function):
+        job = MAINTENANCE_SCHEDULER.schedule(
+            interval, target_function, name="{}.{}".format(type(self).__name__, target_function.__name__),
+        )
+        self.maintenance_jobs.append(job)
+        MAINTENANCE_SCHEDULER.start()
+
+    def close(self):
+        """Cancels the maintenance jobs of this backend"""
+        for job in self.maintenance_jobs:
+            MAINTENANCE_SCHEDULER.cancel(job)
+        self.maintenance_jobs = []
+
     def _get_all_api_roots(self):
         discovery_info = self.server_discovery()
         if discovery_info:
@@ -228,6 +245,24 @@ class Backend(object, metaclass=BackendRegistry):
         """
         raise NotImplementedError()
 
+    def get_changes(self, api_root, collection_id, since, timeout):
+        """
+        Waits up to ``timeout`` seconds for objects to be added to the collection
+        after the change feed sequence number ``since``.
+
+        Args:
+            api_root (str): the name of the api_root.
+            collection_id (str): the id of the collection
+            since (int): the last sequence number seen by the client
+            timeout (float): the maximum number of seconds to wait
+
+        Returns:
+            tuple of the last sequence number of the collection and the objects
+            added after ``since``, or None if they are no longer available
+
+        """
+        raise NotImplementedError()
+
     def get_object(self, api_root, collection_id, object_id, filter_args, allowed_filters, limit):
         """
         Fill:
@@ -269,6 +304,67 @@ class Backend(object, metaclass=BackendRegistry):
         """
         raise NotImplementedError()
 
+    def fetch_objects(self, api_root, collection_id, entries):
+        """
+        Returns several objects of a collection, for the bulk fetch extension
+        endpoint. Each entry selects the versions of an object a Get Object
+        request with that ``match[version]`` would return. This implementation
+        makes one ``get_object`` call per entry; backends override it with a
+        batched lookup.
+
+        Args:
+            api_root (str): the name of the api_root.
+            collection_id (str): the id of the collection
+            entries (list): (object id, match[version] value or None) tuples
+
+        Returns:
+            tuple of the list of objects found and the list of the ids of the
+            entries which matched nothing
+
+        """
+        objects = []
+        missing = []
+        for object_id, match_version in entries:
+            filter_args = {"match[version]": match_version} if match_version else {}
+            try:
+                resource, _ = self.get_object(api_root, collection_id, object_id, filter_args, ("version", "spec_version"), None)
+            except ProcessingError as e:
+                if e.status != 404:
+                    raise
+                resource = {}
+            if resource.get("objects"):
+                objects.extend(resource["objects"])
+            else:
+                missing.append(object_id)
+        return objects, missing
+
+    def delete_objects(self, api_root, collection_id, entries):
+        """
+        Deletes several objects of a collection, for the bulk delete extension
+        endpoint. Entries select versions as in ``fetch_objects``. This
+        implementation makes one ``delete_object`` call per entry; backends
+        override it with a batched removal.
+
+        Args:
+            api_root (str): the name of the api_root.
+            collection_id (str): the id of the collection
+            entries (list): (object id, match[version] value or None) tuples
+
+        Returns:
+            list of the ids of the entries which matched nothing
+
+        """
+        missing = []
+        for object_id, match_version in entries:
+            filter_args = {"match[version]": match_version} if match_version else {}
+            try:
+                self.delete_object(api_root, collection_id, object_id, filter_args, ("version", "spec_version"))
+            except ProcessingError as e:
+                if e.status != 404:
+                    raise
+                missing.append(object_id)
+        return missing
+
     def get_object_versions(self, api_root, collection_id, object_id, filter_args, allowed_filters, limit):
         """
         Fill:
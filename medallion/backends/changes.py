@@ -0,0 +1,105 @@
+import collections
+import logging
+import threading
+
+from ..exceptions import ProcessingError
+
+# Module-level logger
+log = logging.getLogger(__name__)
+
+
+def create_change_feed(config):
+    """
+    Creates the change feed of the Memory backend from its ``change_feed_size``
+    and ``workers`` options. The feed lives in the memory of one process, so it
+    is refused when the backend is served by several worker processes: a
+    ``since`` sequence handed out by one worker means nothing to the others.
+    """
+    workers = config.get("workers") or 1
+    if workers > 1:
+        log.info("The change feed is disabled, the backend is served by %s worker processes", workers)
+        return DisabledChangeFeed()
+    return ChangeFeed(config.get("change_feed_size", 1000))
+
+
+class ChangeFeed(object):
+    """
+    Per-collection record of the objects added to the backend by this process,
+    for the change feed extension endpoint. Each ``add_objects`` call which
+    stores new objects gets the next sequence number of the collection, and
+    clients waiting for a sequence later than the one they have seen are woken
+    up when it arrives, so idle clients do not run any query. The sequence
+    numbers are only known to this process.
+
+    Only the last batches of each collection holding up to ``size`` objects
+    are kept, and always the latest batch; clients which fall further behind
+    must resynchronize with a regular Get Objects request.
+    """
+
+    def __init__(self, size=1000):
+        self.size = size
+        self.condition = threading.Condition()
+        self.sequences = collections.defaultdict(int)
+        self.batches = collections.defaultdict(collections.deque)
+        self.counts = collections.defaultdict(int)
+
+    def sequence(self, api_root, collection_id):
+        """Returns the last sequence number of the collection, 0 if nothing was added"""
+        with self.condition:
+            return self.sequences[(api_root, collection_id)]
+
+    def publish(self, api_root, collection_id, objects):
+        """Records a batch of newly stored objects and wakes up the waiting clients"""
+        key = (api_root, collection_id)
+        with self.condition:
+            self.sequences[key] += 1
+            batches = self.batches[key]
+            batches.append((self.sequences[key], objects))
+            self.counts[key] += len(objects)
+            while len(batches) > 1 and self.counts[key] > self.size:
+                self.counts[key] -= len(batches.popleft()[1])
+            self.condition.notify_all()
+            return self.sequences[key]
+
+    def wait(self, api_root, collection_id, since, timeout):
+        """
+        Waits up to ``timeout`` seconds for batches later than ``since``. A
+        ``since`` of None returns the current sequence number right away.
+
+        Returns:
+            the last sequence number and the objects added after ``since``, or
+            None as the objects when the batches after ``since`` are no longer
+            kept (or were never produced by this process)
+
+        """
+        key = (api_root, collection_id)
+        with self.condition:
+            if since is None:
+                return self.sequences[key], []
+            if since > self.sequences[key]:
+                return self.sequences[key], None
+            self.condition.wait_for(lambda: self.sequences[key] > since, timeout)
+            batches = self.batches[key]
+            sequence = self.sequences[key]
+            if sequence == since:
+                return sequence, []
+            if not batches or batches[0][0] > since + 1:
+                return sequence, None
+            objects = []
+            for batch_sequence, batch in batches:
+                if batch_sequence > since:
+                    objects.extend(batch)
+            return sequence, objects
+
+
+class DisabledChangeFeed(object):
+    """Change feed of backends served by several processes, which refuses every request"""
+
+    def sequence(self, api_root, collection_id):
+        return 0
+
+    def publish(self, api_root, collection_id, objects):
+        pass
+
+    def wait(self, api_root, collection_id, since, timeout):
+        raise ProcessingError("The change feed is not available when the server runs several worker processes", 501)
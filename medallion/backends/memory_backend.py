@@ -1,32 +1,91 @@
-import copy
 import io
 import json
 import logging
+import operator
 import os
-import uuid
+import threading
 
 import environ
 from six import string_types
 
 from ..common import (
-    APPLICATION_INSTANCE, create_resource, datetime_to_float,
-    datetime_to_string, determine_spec_version, determine_version, find_att,
-    generate_status, generate_status_details,
+    APPLICATION_INSTANCE, ExpiryHeap, ManifestRecord, create_resource,
+    datetime_to_float, datetime_to_string, determine_spec_version,
+    determine_version, find_att, generate_status, generate_status_details,
     get_application_instance_config_values, get_timestamp, iterpath,
     string_to_datetime
 )
 from ..exceptions import InitializationError, ProcessingError
 from ..filters.basic_filter import BasicFilter
 from .base import Backend
+from .changes import create_change_feed
 
 # Module-level logger
 log = logging.getLogger(__name__)
 
 
-def remove_hidden_field(objs):
-    for obj in objs:
-        if "_date_added" in obj:
-            del obj["_date_added"]
+# Keys of the stored collections which are not part of the collection resource
+COLLECTION_HIDDEN_FIELDS = ("manifest", "responses", "objects")
+
+
+def without_hidden_field(objs):
+    """
+    Shallow copies of the objects of a response page without the fields only
+    used by the backend. The stored objects are not modified, so filters can
+    work on them directly rather than on a copy of the whole collection.
+    """
+    return [
+        {key: value for key, value in obj.items() if key != "_date_added"} if "_date_added" in obj else obj
+        for obj in objs
+    ]
+
+
+class CollectionEntries(object):
+    """
+    The objects or manifest records of a collection, in ingest order. Removed
+    entries are replaced by a None tombstone found through their position, so
+    removing some of them touches only those entries; the list is compacted
+    once half of it is tombstones. Readers iterate over it as over the list it
+    replaces, and appends while they iterate are safe as they are for a list;
+    writers hold a lock so concurrent requests keep the positions right.
+    """
+
+    __slots__ = ("items", "positions", "removed", "lock")
+
+    def __init__(self, items=()):
+        self.items = list(items)
+        self.positions = {id(item): i for i, item in enumerate(self.items)}
+        self.removed = 0
+        self.lock = threading.Lock()
+
+    def __iter__(self):
+        return (item for item in self.items if item is not None)
+
+    def __len__(self):
+        return len(self.items) - self.removed
+
+    def append(self, item):
+        with self.lock:
+            self.positions[id(item)] = len(self.items)
+            self.items.append(item)
+
+    def remove(self, item):
+        with self.lock:
+            self.items[self.positions.pop(id(item))] = None
+            self.removed += 1
+            if self.removed * 2 > len(self.items):
+                self.items = [item for item in self.items if item is not None]
+                self.positions = {id(item): i for i, item in enumerate(self.items)}
+                self.removed = 0
+
+
+def manifest_to_serializable(obj):
+    """``default`` hook for ``json.dump()`` so manifest records are written in TAXII form"""
+    if isinstance(obj, ManifestRecord):
+        return obj.to_dict()
+    if isinstance(obj, CollectionEntries):
+        return list(obj)
+    raise TypeError("Object of type {} is not JSON serializable".format(obj.__class__.__name__))
 
 
 def find_headers(headers, manifest, obj):
@@ -48,9 +107,10 @@ class MemoryBackend(Backend):
         filename = environ.var(None)
 
     def __init__(self, **kwargs):
-        # Refuse to run under a WSGI server since this is an internal backend
+        # Refuse to run under a WSGI server since this is an internal backend,
+        # the server option is set by medallion.serving
         if (
-            "SERVER_SOFTWARE" in os.environ and
+            (kwargs.get("server") or "SERVER_SOFTWARE" in os.environ) and
             kwargs.get("force_wsgi", False) is not True
         ):
             raise RuntimeError(
@@ -63,30 +123,32 @@ class MemoryBackend(Backend):
             self.collections_manifest_check()
         else:
             self.data = {}
+            self.status_deadlines = ExpiryHeap()
+            self.object_index = {}
+        self.changes = create_change_feed(kwargs)
         super(MemoryBackend, self).__init__(**kwargs)
 
     def _pop_expired_sessions(self):
-        expired_ids = []
-        boundary = datetime_to_float(get_timestamp())
-        for next_id, record in self.next.items():
-            if boundary - record["request_time"] > self.timeout:
-                expired_ids.append(next_id)
-
-        for item in expired_ids:
-            self.next.pop(item)
+        self.next.expire(self.timeout)
 
     def _pop_old_statuses(self):
-        api_roots = self._get_all_api_roots()
-        boundary = datetime_to_float(get_timestamp())
-        for ar in api_roots:
-            statuses_of_api_root = copy.copy(self._get_api_root_statuses(ar))
+        boundary = datetime_to_float(get_timestamp()) - self.status_retention
+        expired = {}
+        for _, (ar, status) in list(self.status_deadlines.pop_older_than(boundary)):
+            expired.setdefault(ar, set()).add(id(status))
+        # each status list is rebuilt once, whatever the number of statuses expiring
+        for ar, status_ids in expired.items():
+            statuses_of_api_root = self.data.get(ar, {}).get("status", [])
             for s in statuses_of_api_root:
-                if boundary - datetime_to_float(string_to_datetime(s["request_timestamp"])) > self.status_retention:
-                    self._get_api_root_statuses(ar).remove(s)
+                if id(s) in status_ids:
                     log.info("Status {} was deleted from {} because it was older than the status retention time".format(s['id'], ar))
+            statuses_of_api_root[:] = [s for s in statuses_of_api_root if id(s) not in status_ids]
+
+    def _track_status(self, api_root, status):
+        """Schedules the removal of a status once it is older than the status retention"""
+        self.status_deadlines.push(datetime_to_float(string_to_datetime(status["request_timestamp"])), (api_root, status))
 
     def set_next(self, objects, args):
-        u = str(uuid.uuid4())
         if "limit" in args:
             del args["limit"]
         for arg in args:
@@ -94,22 +156,22 @@ class MemoryBackend(Backend):
             new_list.sort()
             args[arg] = new_list
         d = {"objects": objects, "args": args, "request_time": datetime_to_float(get_timestamp())}
-        self.next[u] = d
-        return u
+        return self.next.save(None, d)
 
     def get_next(self, filter_args, allowed, manifest, lim):
         n = filter_args["next"]
-        if n in self.next:
+        record = self.next.get(n)
+        if record is not None:
             for arg in filter_args:
                 new_list = filter_args[arg].split(',')
                 new_list.sort()
                 filter_args[arg] = new_list
             del filter_args["next"]
             del filter_args["limit"]
-            if filter_args != self.next[n]["args"]:
+            if filter_args != record["args"]:
                 raise ProcessingError("The server did not understand the request or filter parameters: params changed over subsequent transaction", 400)
-            t = self.next[n]["objects"]
-            length = len(self.next[n]["objects"])
+            t = record["objects"]
+            length = len(t)
             headers = {}
             ret = []
             if length <= lim:
@@ -167,9 +229,57 @@ class MemoryBackend(Backend):
                 self.data = json.load(infile)
         else:
             self.data = json.load(filename)
+        self._prepare_collections()
+        self._build_object_index()
+        self.status_deadlines = ExpiryHeap()
+        for key, api_root in self.data.items():
+            if key != "/discovery":
+                for status in api_root.get("status", []):
+                    self._track_status(key, status)
+
+    def _prepare_collections(self):
+        """
+        Replaces the manifest dicts loaded from file with ManifestRecord instances,
+        in date_added order, and holds the objects and manifest records of each
+        collection in CollectionEntries. ``_update_manifest`` appends to these, so
+        their order is the ingest order of the collection from then on.
+        """
+        for key, api_root in self.data.items():
+            if key == "/discovery":
+                continue
+            for collection in api_root.get("collections", []):
+                if "manifest" in collection:
+                    collection["manifest"] = CollectionEntries(sorted(
+                        (ManifestRecord.from_dict(man) for man in collection["manifest"]),
+                        key=operator.attrgetter("date_added"),
+                    ))
+                if "objects" in collection:
+                    collection["objects"] = CollectionEntries(collection["objects"])
+
+    def _build_object_index(self):
+        """
+        Indexes the objects and manifest records of each collection by object id,
+        so requests for a single object do not scan the whole collection. The
+        lists of each id hold references to the entries of the collection, in
+        the same order.
+        """
+        self.object_index = {}
+        for key, api_root in self.data.items():
+            if key == "/discovery":
+                continue
+            for collection in api_root.get("collections", []):
+                for obj in collection.get("objects", []):
+                    self._index_entry(key, collection["id"], obj["id"])[0].append(obj)
+                for man in collection.get("manifest", []):
+                    self._index_entry(key, collection["id"], man["id"])[1].append(man)
+
+    def _index_entry(self, api_root, collection_id, object_id):
+        """The (objects, manifest records) lists of an object id, created if needed"""
+        return self.object_index.setdefault((api_root, collection_id), {}).setdefault(object_id, ([], []))
 
     def save_data_to_file(self, filename, **kwargs):
         """The kwargs are passed to ``json.dump()`` if provided."""
+        kwargs.setdefault("default", manifest_to_serializable)
         if isinstance(filename, string_types):
             with io.open(filename, "w", encoding="utf-8") as outfile:
                 json.dump(self.data, outfile, **kwargs)
@@ -177,6 +287,10 @@ class MemoryBackend(Backend):
             json.dump(self.data, filename, **kwargs)
 
     def _get(self, key):
+        if key in self.data:
+            # api roots and the discovery information are top level entries,
+            # found without walking the data of the api roots sorted before them
+            return self.data[key]
         for ancestors, item in iterpath(self.data):
             if key in ancestors:
                 return item
@@ -192,18 +306,17 @@ class MemoryBackend(Backend):
         for collection in collections:
             if collection_id == collection["id"]:
                 version = determine_version(new_obj, request_time)
-                request_time = datetime_to_string(request_time)
                 media_type = media_type_fmt.format(determine_spec_version(new_obj))
 
                 # version is a single value now, therefore a new manifest is always created
-                collection["manifest"].append(
-                    {
-                        "id": new_obj["id"],
-                        "date_added": request_time,
-                        "version": version,
-                        "media_type": media_type,
-                    },
+                record = ManifestRecord(
+                    new_obj["id"],
+                    datetime_to_float(request_time),
+                    datetime_to_float(string_to_datetime(version)),
+                    media_type,
                 )
+                collection["manifest"].append(record)
+                self._index_entry(api_root, collection_id, new_obj["id"])[1].append(record)
 
                 # if the media type is new, attach it to the collection
                 if media_type not in collection["media_types"]:
@@ -217,13 +330,11 @@ class MemoryBackend(Backend):
             return None  # must return None so 404 is raised
 
         api_info = self._get(api_root)
-        collections = copy.deepcopy(api_info.get("collections", []))
-
         # Remove data that is not part of the response.
-        for collection in collections:
-            collection.pop("manifest", None)
-            collection.pop("responses", None)
-            collection.pop("objects", None)
+        collections = [
+            {key: value for key, value in collection.items() if key not in COLLECTION_HIDDEN_FIELDS}
+            for collection in api_info.get("collections", [])
+        ]
         # interop wants results sorted by id
         if get_application_instance_config_values(APPLICATION_INSTANCE, "taxii", "interop_requirements"):
             collections = sorted(collections, key=lambda o: o["id"])
@@ -234,14 +345,10 @@ class MemoryBackend(Backend):
             return None  # must return None so 404 is raised
 
         api_info = self._get(api_root)
-        collections = copy.deepcopy(api_info.get("collections", []))
 
-        for collection in collections:
+        for collection in api_info.get("collections", []):
             if collection_id == collection["id"]:
-                collection.pop("manifest", None)
-                collection.pop("responses", None)
-                collection.pop("objects", None)
-                return collection
+                return {key: value for key, value in collection.items() if key not in COLLECTION_HIDDEN_FIELDS}
 
     def get_object_manifest(self, api_root, collection_id, filter_args, allowed_filters, limit):
         more = False
@@ -268,6 +375,7 @@ class MemoryBackend(Backend):
                             more = True
                             n = self.set_next(next_save, filter_args)
                         break
+            manifest = [man.to_dict() for man in manifest]
             return create_resource("objects", manifest, more, n), headers
 
     def get_api_root_information(self, api_root):
@@ -304,7 +412,7 @@ class MemoryBackend(Backend):
                     if "next" in filter_args:
                         objs, more, headers, n = self.get_next(filter_args, allowed_filters, manifest, limit)
                     else:
-                        objs = copy.deepcopy(collection.get("objects", []))
+                        objs = collection.get("objects", [])
                         full_filter = BasicFilter(filter_args)
                         objs, next_save, headers = full_filter.process_filter(
                             objs,
@@ -317,11 +425,12 @@ class MemoryBackend(Backend):
                             more = True
                             n = self.set_next(next_save, filter_args)
                         break
-            remove_hidden_field(objs)
+            objs = without_hidden_field(objs)
             return create_resource("objects", objs, more, n), headers
 
     def _add_status(self, api_root_name, status):
         self._get_api_root_statuses(api_root_name).append(status)
+        self._track_status(api_root_name, status)
 
     def add_objects(self, api_root, collection_id, objs, request_time):
         if api_root in self.data:
@@ -332,11 +441,12 @@ class MemoryBackend(Backend):
             pending = 0
             successes = []
             failures = []
+            added = []
 
             for collection in collections:
                 if collection_id == collection["id"]:
                     if "objects" not in collection:
-                        collection["objects"] = []
+                        collection["objects"] = CollectionEntries()
                     try:
                         for new_obj in objs["objects"]:
                             version = determine_version(new_obj, request_time)
@@ -357,9 +467,11 @@ class MemoryBackend(Backend):
 
                             else:
                                 message = None
+                                added.append(dict(new_obj))
                                 if "modified" not in new_obj and "created" not in new_obj:
                                     new_obj["_date_added"] = version
                                 collection["objects"].append(new_obj)
+                                self._index_entry(api_root, collection_id, new_obj["id"])[0].append(new_obj)
                                 self._update_manifest(new_obj, api_root, collection["id"], request_time)
 
                             # else: we already have the object, so this is a
@@ -380,8 +492,14 @@ class MemoryBackend(Backend):
                 failures=failures,
             )
             api_info["status"].append(status)
+            self._track_status(api_root, status)
+            if added:
+                self.changes.publish(api_root, collection_id, added)
             return status
 
+    def get_changes(self, api_root, collection_id, since, timeout):
+        return self.changes.wait(api_root, collection_id, since, timeout)
+
     def get_object(self, api_root, collection_id, object_id, filter_args, allowed_filters, limit):
         more = False
         n = None
@@ -396,9 +514,9 @@ class MemoryBackend(Backend):
                     if "next" in filter_args:
                         objs, more, headers, n = self.get_next(filter_args, allowed_filters, manifests, limit)
                     else:
-                        for obj in collection.get("objects", []):
-                            if object_id == obj["id"]:
-                                objs.append(copy.deepcopy(obj))
+                        # only the versions of this object and their manifest records are filtered
+                        indexed_objs, manifests = self.object_index.get((api_root, collection_id), {}).get(object_id, ([], []))
+                        objs = indexed_objs
                         if len(objs) == 0:
                             raise ProcessingError("Object '{}' not found".format(object_id), 404)
                         full_filter = BasicFilter(filter_args)
@@ -412,24 +530,13 @@ class MemoryBackend(Backend):
                             more = True
                             n = self.set_next(next_save, filter_args)
                         break
-            remove_hidden_field(objs)
+            objs = without_hidden_field(objs)
             return create_resource("objects", objs, more, n), headers
 
     def delete_object(self, api_root, collection_id, obj_id, filter_args, allowed_filters):
         if api_root in self.data:
-            api_info = self._get(api_root)
-            collections = api_info.get("collections", [])
-            objs = []
-            manifests = []
-            for collection in collections:
-                if "id" in collection and collection_id == collection["id"]:
-                    coll = collection.get("objects", [])
-                    for obj in coll:
-                        if obj_id == obj["id"]:
-                            objs.append(obj)
-                    manifests = collection.get("manifest", [])
-                    break
-
+            # only the versions of this object and their manifest records are filtered
+            objs, manifests = self.object_index.get((api_root, collection_id), {}).get(obj_id, ([], []))
             full_filter = BasicFilter(filter_args)
             objs, nex, headers = full_filter.process_filter(
                 objs,
@@ -441,14 +548,73 @@ class MemoryBackend(Backend):
             if len(objs) == 0:
                 raise ProcessingError("Object '{}' not found".format(obj_id), 404)
 
+            self._remove_objects(api_root, collection_id, objs)
+
+    def _select_requested_objects(self, api_root, collection_id, entries):
+        """
+        Runs the version selection of each bulk request entry on the versions of
+        its object from the object index.
+
+        Returns:
+            tuple of the stored objects selected, without duplicates, and the
+            ids of the entries which matched nothing
+
+        """
+        entries_by_id = self.object_index.get((api_root, collection_id), {})
+        selected = {}
+        missing = []
+        for object_id, match_version in entries:
+            objs, manifests = entries_by_id.get(object_id, ([], []))
+            filter_args = {"match[version]": match_version} if match_version else {}
+            objs, _, _ = BasicFilter(filter_args).process_filter(objs, ("version", "spec_version"), manifests, None)
+            if not objs:
+                missing.append(object_id)
             for obj in objs:
-                if obj in coll:
-                    coll.remove(obj)
-                    obj_time = find_att(obj)
-                    for man in manifests:
-                        if obj["id"] == man["id"] and obj_time == find_att(man):
-                            manifests.remove(man)
-                            break
+                selected[id(obj)] = obj
+        return list(selected.values()), missing
+
+    def fetch_objects(self, api_root, collection_id, entries):
+        if api_root not in self.data:
+            return [], [object_id for object_id, _ in entries]
+        objs, missing = self._select_requested_objects(api_root, collection_id, entries)
+        return without_hidden_field(objs), missing
+
+    def delete_objects(self, api_root, collection_id, entries):
+        if api_root not in self.data:
+            return [object_id for object_id, _ in entries]
+        objs, missing = self._select_requested_objects(api_root, collection_id, entries)
+        if objs:
+            self._remove_objects(api_root, collection_id, objs)
+        return missing
+
+    def _remove_objects(self, api_root, collection_id, objs):
+        """
+        Removes stored objects, given as the dicts held by the collection, and
+        their manifest records. The records are found through the object index
+        and removed by identity from the CollectionEntries of the collection,
+        so only the versions of the objects removed are looked at.
+        """
+        entries = self.object_index[(api_root, collection_id)]
+        removed = set()
+        records = []
+        for obj in objs:
+            removed.add(id(obj))
+            obj_time = find_att(obj)
+            for man in entries[obj["id"]][1]:
+                if id(man) not in removed and obj_time == find_att(man):
+                    removed.add(id(man))
+                    records.append(man)
+                    break
+
+        for object_id in {obj["id"] for obj in objs}:
+            for entry in entries[object_id]:
+                entry[:] = [item for item in entry if id(item) not in removed]
+        for collection in self._get(api_root).get("collections", []):
+            if collection_id == collection["id"]:
+                for key, items in (("objects", objs), ("manifest", records)):
+                    for item in items:
+                        collection[key].remove(item)
+                break
 
     def get_object_versions(self, api_root, collection_id, object_id, filter_args, allowed_filters, limit):
         more = False
@@ -1,16 +1,23 @@
 import io
+import itertools
 import json
 import logging
+import time
 import uuid
 
 import environ
-from pymongo import ASCENDING, IndexModel, MongoClient
+from pymongo import (
+    ASCENDING, IndexModel, MongoClient, ReturnDocument, UpdateOne
+)
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo.read_preferences import (
+    make_read_preference, read_pref_mode_from_name
+)
 from six import string_types
 
 # from ..config import get_application_instance_config_values
 from ..common import (
-    APPLICATION_INSTANCE, create_resource, datetime_to_float,
+    APPLICATION_INSTANCE, JSONStreamReader, create_resource, datetime_to_float,
     datetime_to_string, datetime_to_string_stix, determine_spec_version,
     determine_version, float_to_datetime, generate_status,
     generate_status_details, get_application_instance_config_values,
@@ -20,12 +27,72 @@ from ..common import (
 from ..exceptions import (
     InitializationError, MongoBackendError, ProcessingError
 )
-from ..filters.mongodb_filter import MongoDBFilter
-from .base import Backend
+from ..filters.mongodb_filter import PIPELINE_PROFILER, MongoDBFilter
+from .base import SECONDS_IN_24_HOURS, Backend
+from .sessions import (
+    MemorySessionStore, SessionStore, SignedTokenStore, args_fingerprint
+)
 
 # Module-level logger
 log = logging.getLogger(__name__)
 
+# Number of documents sent to MongoDB in each insert_many call when loading data
+DEFAULT_BATCH_SIZE = 1000
+
+# Backend configuration options passed on to MongoClient, with their MongoClient names
+CLIENT_OPTIONS = {
+    "max_pool_size": "maxPoolSize",
+    "min_pool_size": "minPoolSize",
+    "max_idle_time_ms": "maxIdleTimeMS",
+    "wait_queue_timeout_ms": "waitQueueTimeoutMS",
+    "server_selection_timeout_ms": "serverSelectionTimeoutMS",
+    "connect_timeout_ms": "connectTimeoutMS",
+    "socket_timeout_ms": "socketTimeoutMS",
+    "compressors": "compressors",
+    "write_concern": "w",
+    "read_concern": "readConcernLevel",
+    "app_name": "appname",
+}
+
+# Indexes expected in the discovery database, keyed by MongoDB collection name
+DISCOVERY_INDEXES = {
+    "api_root_info": [
+        IndexModel([("_name", ASCENDING)]),
+    ],
+}
+
+# Key of the TTL index expiring statuses, its expireAfterSeconds is the status_retention
+STATUS_EXPIRY_KEY = [("_request_date", ASCENDING)]
+
+# Indexes of the pagination sessions collection used by MongoSessionStore
+SESSION_INDEXES = [
+    IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+]
+
+# Indexes expected in each api root database, keyed by MongoDB collection name
+API_ROOT_INDEXES = {
+    "objects": [
+        IndexModel([("id", ASCENDING)]),
+        IndexModel([("type", ASCENDING)]),
+        IndexModel([("_manifest.date_added", ASCENDING)]),
+        IndexModel([("_manifest.version", ASCENDING)]),
+        IndexModel([("_manifest.media_type", ASCENDING), ("_manifest.date_added", ASCENDING)]),
+        IndexModel([("_manifest.media_type", ASCENDING), ("_manifest.version", ASCENDING)]),
+        # the collection filter and added_after range of the get_objects/manifest pipelines
+        IndexModel([("_collection_id", ASCENDING), ("_manifest.date_added", ASCENDING)]),
+        # the ingest order results are sorted and paginated by
+        IndexModel([("_collection_id", ASCENDING), ("_sequence", ASCENDING)]),
+        # object lookups by id: _validate_object_id, delete_object and add_objects dedup
+        IndexModel([("_collection_id", ASCENDING), ("id", ASCENDING), ("_manifest.version", ASCENDING)]),
+    ],
+    "collections": [
+        IndexModel([("id", ASCENDING)]),
+    ],
+    "status": [
+        IndexModel([("id", ASCENDING)]),
+    ],
+}
+
 
 def catch_mongodb_error(func):
     """Catch mongodb availability error"""
@@ -39,31 +106,822 @@ def catch_mongodb_error(func):
     return api_wrapper
 
 
-def find_manifest_entries_for_id(obj, manifest):
-    for m in manifest:
-        if m["id"] == obj["id"]:
-            if "modified" in obj:
-                if m["version"] == obj["modified"]:
-                    return m
+def _optional_int(value):
+    return int(value) if value else value
+
+
+def _optional_float(value):
+    return float(value) if value else value
+
+
+def _optional_bool(value):
+    return value.strip().lower() in ("1", "true", "yes") if isinstance(value, str) else value
+
+
+def _write_concern(value):
+    # "majority" and tag set names are strings, node counts are integers
+    return int(value) if isinstance(value, str) and value.isdigit() else value
+
+
+def get_client_options(config):
+    """Builds the MongoClient keyword arguments from the backend configuration"""
+    return {
+        client_name: config[name]
+        for name, client_name in CLIENT_OPTIONS.items()
+        if config.get(name) is not None
+    }
+
+
+def get_read_preference(name):
+    """Returns the pymongo read preference for a mode name such as 'secondaryPreferred'"""
+    if name is None:
+        return None
+    try:
+        return make_read_preference(read_pref_mode_from_name(name), None)
+    except ValueError:
+        raise InitializationError("Unknown MongoDB read preference {!r}".format(name), 408)
+
+
+def prepare_seed_object(obj, collection_id, manifest_entry):
+    """Converts an object and its manifest entry from a seed file into the document stored in MongoDB"""
+    obj["_collection_id"] = collection_id
+    obj["_manifest"] = manifest_entry
+    obj["_manifest"]["date_added"] = datetime_to_float(string_to_datetime(obj["_manifest"]["date_added"]))
+    obj["_manifest"]["version"] = datetime_to_float(string_to_datetime(obj["_manifest"]["version"]))
+    # the Memory back-end versions SCOs by the time they were added, the manifest has it here
+    obj.pop("_date_added", None)
+    if "created" in obj:
+        # not for SCOs
+        obj["created"] = datetime_to_float(string_to_datetime(obj["created"]))
+    if "modified" in obj:
+        # not for data markings
+        obj["modified"] = datetime_to_float(string_to_datetime(obj["modified"]))
+    return obj
+
+
+def prepare_new_object(new_obj, collection_id, request_time):
+    """Converts an object received in a bundle into the document stored in MongoDB"""
+    media_type = "application/stix+json;version={}".format(determine_spec_version(new_obj))
+    obj_version = determine_version(new_obj, request_time)
+    new_obj.update({"_collection_id": collection_id})
+    if "modified" in new_obj:
+        new_obj["modified"] = datetime_to_float(string_to_datetime(new_obj["modified"]))
+    if "created" in new_obj:
+        new_obj["created"] = datetime_to_float(string_to_datetime(new_obj["created"]))
+    _manifest = {
+        "id": new_obj["id"],
+        "date_added": datetime_to_float(request_time),
+        "version": datetime_to_float(string_to_datetime(obj_version)),
+        "media_type": media_type,
+    }
+    new_obj.update({"_manifest": _manifest})
+    return new_obj
+
+
+def is_plain_object_request(filter_args):
+    """True for a Get Object request without filters or pagination, which ``latest_object_resource`` can answer"""
+    return set(filter_args) <= {"limit"}
+
+
+def select_object_versions(docs, match_version=None):
+    """
+    Selects among all the stored documents of one object those a request for
+    it with the given ``match[version]`` value and no other filter returns, as
+    the MongoDBFilter pipelines do: the versions asked for within the latest
+    spec version, in ingest order.
+    """
+    media_type = max(doc["_manifest"]["media_type"] for doc in docs)
+    docs = [doc for doc in docs if doc["_manifest"]["media_type"] == media_type]
+    indicators = (match_version or "last").split(",")
+    if "all" not in indicators:
+        versions = sorted({doc["_manifest"]["version"] for doc in docs})
+        dates = {datetime_to_float(string_to_datetime(x)) for x in indicators if x not in ("first", "last")}
+        if dates and not dates.intersection(versions):
+            return []
+        if "first" in indicators:
+            dates.add(versions[0])
+        if "last" in indicators:
+            dates.add(versions[-1])
+        docs = [doc for doc in docs if doc["_manifest"]["version"] in dates]
+    return sorted(docs, key=lambda doc: doc.get("_sequence", 0))
+
+
+def object_resource(docs):
+    """Builds an objects resource and its date-added headers from stored documents"""
+    manifests = []
+    for doc in docs:
+        manifests.append({"date_added": datetime_to_string(float_to_datetime(doc.pop("_manifest")["date_added"]))})
+        doc.pop("_sequence", None)
+        doc.pop("_id", None)
+        doc.pop("_collection_id", None)
+        if "modified" in doc:
+            doc["modified"] = datetime_to_string_stix(float_to_datetime(doc["modified"]))
+        if "created" in doc:
+            doc["created"] = datetime_to_string_stix(float_to_datetime(doc["created"]))
+    return create_resource("objects", docs), get_custom_headers({"objects": manifests})
+
+
+def latest_object_resource(docs, limit):
+    """
+    Builds the response of a Get Object request without filters from all the
+    stored documents of the object, fetched with a single query: the latest
+    version in the latest spec version, with the headers of its manifest entry.
+
+    Returns:
+        tuple of the resource and headers, or None if more documents than
+        ``limit`` match and the request needs the paginated path
+
+    """
+    docs = select_object_versions(docs)
+    if limit and len(docs) > limit:
+        return None
+    return object_resource(docs)
+
+
+# Fields select_object_versions needs, for queries which do not return the objects
+VERSION_SELECTION_PROJECTION = {"id": 1, "_manifest.version": 1, "_manifest.media_type": 1, "_sequence": 1}
+
+
+def group_by_object(docs):
+    """Groups the documents returned by a query on several object ids by id"""
+    grouped = {}
+    for doc in docs:
+        grouped.setdefault(doc["id"], []).append(doc)
+    return grouped
+
+
+def select_requested_objects(grouped, entries):
+    """
+    Selects the documents of a bulk request from the documents of its objects,
+    grouped by ``group_by_object``.
+
+    Args:
+        grouped (dict): object ids mapped to all their stored documents
+        entries (list): (object id, match[version] value or None) tuples
+
+    Returns:
+        tuple of the selected documents, without duplicates, and the ids of the
+        entries which matched nothing
+
+    """
+    selected = {}
+    missing = []
+    for object_id, match_version in entries:
+        docs = select_object_versions(grouped[object_id], match_version) if object_id in grouped else []
+        if not docs:
+            missing.append(object_id)
+        for doc in docs:
+            selected[doc["_id"]] = doc
+    return list(selected.values()), missing
+
+
+def insert_in_batches(mongo_collection, documents, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Inserts the documents produced by an iterable using one insert_many call per batch,
+    so the documents do not need to be held in memory at once.
+
+    Returns:
+        the number of documents inserted
+
+    """
+    inserted = 0
+    batch = []
+    for doc in documents:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            mongo_collection.insert_many(batch, ordered=False)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        mongo_collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
+
+
+def create_missing_indexes(db, expected_indexes):
+    """
+    Creates the indexes of ``expected_indexes`` which are not present in the database.
+    Indexes are compared by their key pattern, so indexes created under other names
+    are not duplicated.
+
+    Args:
+        db: a pymongo Database
+        expected_indexes (dict): MongoDB collection names mapped to lists of IndexModel
+
+    Returns:
+        list of the names of the indexes created
+
+    """
+    created = []
+    for collection_name, indexes in expected_indexes.items():
+        existing = {tuple(info["key"]) for info in db[collection_name].index_information().values()}
+        missing = [index for index in indexes if tuple(index.document["key"].items()) not in existing]
+        if missing:
+            created.extend(db[collection_name].create_indexes(missing))
+    return created
+
+
+def status_document(status):
+    """Copy of a status with the native ``_request_date`` its TTL expiry is based on"""
+    return dict(status, _request_date=string_to_datetime(status["request_timestamp"]))
+
+
+def reserve_sequences(db, collection_id, count=1):
+    """
+    Reserves ``count`` consecutive ingest sequence numbers for a collection
+    from its counter in the ``sequences`` collection of the api root database.
+    The counter is updated atomically, so concurrent writers never share a number.
+
+    The numbers are reserved before the objects are inserted, so a concurrent
+    writer may insert objects with higher numbers first. A client paginating
+    in between is past them when the lower numbers appear, and does not see
+    those objects; they remain visible to ``added_after`` queries.
+
+    Returns:
+        the first sequence number reserved
+
+    """
+    counter = db["sequences"].find_one_and_update(
+        {"_id": collection_id}, {"$inc": {"value": count}}, upsert=True, return_document=ReturnDocument.AFTER,
+    )
+    return counter["value"] - count + 1
+
+
+def ingest_order(doc):
+    """Sort key ordering documents without a sequence number as they were before sequences existed"""
+    return doc["_manifest"]["date_added"], doc.get("created", 0), doc.get("modified", 0)
+
+
+def ensure_object_sequences(db, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Gives the objects of an api root database without an ingest sequence
+    number (stored by older versions of medallion or by other tools) one,
+    following their date_added order after the objects already numbered.
+
+    Returns:
+        the number of objects updated
+
+    """
+    objects_info = db["objects"]
+    missing = {}
+    for doc in objects_info.find(
+        {"_sequence": {"$exists": False}}, {"_collection_id": 1, "_manifest.date_added": 1, "created": 1, "modified": 1},
+    ):
+        missing.setdefault(doc["_collection_id"], []).append(doc)
+    for collection_id, docs in missing.items():
+        docs.sort(key=ingest_order)
+        first = reserve_sequences(db, collection_id, len(docs))
+        updates = [UpdateOne({"_id": doc["_id"]}, {"$set": {"_sequence": first + i}}) for i, doc in enumerate(docs)]
+        for start in range(0, len(updates), batch_size):
+            objects_info.bulk_write(updates[start:start + batch_size], ordered=False)
+    return sum(len(docs) for docs in missing.values())
+
+
+def migrate_object_sequences(client, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Numbers the objects without an ingest sequence in every api root database,
+    see ``ensure_object_sequences``. This scans the objects collections, so it
+    is run once, by ``medallion-migrate``, after upgrading a database written
+    by an older version of medallion, rather than by every server process.
+
+    Returns:
+        dict of the number of objects updated in each api root database
+
+    """
+    database_names = client.list_database_names()
+    if "discovery_database" not in database_names:
+        return {}
+    numbered = {}
+    for info in client["discovery_database"]["api_root_info"].find({}, {"_name": 1}):
+        if info["_name"] in database_names:
+            numbered[info["_name"]] = ensure_object_sequences(client[info["_name"]], batch_size)
+    return numbered
+
+
+def find_unnumbered_collections(client, api_roots):
+    """
+    Lists the collections holding objects without an ingest sequence number,
+    which ``migrate_object_sequences`` has yet to number. A missing
+    ``_sequence`` is matched as null on the ``(_collection_id, _sequence)``
+    index, so each collection costs a single index lookup.
+
+    Returns:
+        list of (api root, collection id) tuples
+
+    """
+    database_names = client.list_database_names()
+    unnumbered = []
+    for api_root in api_roots or []:
+        if api_root in database_names:
+            api_root_db = client[api_root]
+            for collection_id in api_root_db["collections"].distinct("id"):
+                if api_root_db["objects"].find_one({"_collection_id": collection_id, "_sequence": None}, {"_id": 1}):
+                    unnumbered.append((api_root, collection_id))
+    return unnumbered
+
+
+def ensure_status_expiry(db, retention):
+    """
+    Makes MongoDB expire the statuses of an api root database ``retention``
+    seconds after their request, through a TTL index on ``_request_date``. The
+    index is created, its expiry updated, or dropped when ``retention`` is -1.
+    Statuses stored before the ``_request_date`` field existed are given one.
+    """
+    status_info = db["status"]
+    for doc in status_info.find({"_request_date": {"$exists": False}}, {"request_timestamp": 1}):
+        status_info.update_one(
+            {"_id": doc["_id"]},
+            {"$set": {"_request_date": string_to_datetime(doc["request_timestamp"])}},
+        )
+
+    existing = None
+    for name, info in status_info.index_information().items():
+        if info["key"] == STATUS_EXPIRY_KEY:
+            existing = name, info
+    if retention == -1:
+        if existing:
+            status_info.drop_index(existing[0])
+    elif existing is None:
+        status_info.create_index(STATUS_EXPIRY_KEY, expireAfterSeconds=retention)
+    elif existing[1].get("expireAfterSeconds") != retention:
+        db.command("collMod", "status", index={"keyPattern": dict(STATUS_EXPIRY_KEY), "expireAfterSeconds": retention})
+
+
+def load_json_file(filename):
+    """Reads a seed file, given either its path or an open file object"""
+    try:
+        if isinstance(filename, string_types):
+            with io.open(filename, "r", encoding="utf-8") as infile:
+                return json.load(infile)
+        else:
+            return json.load(filename)
+    except Exception as e:
+        raise InitializationError("Problem loading initialization data from {0}".format(filename), 408, e)
+
+
+def check_object_manifests(client):
+    """
+    Checks for manifests in each object, throws an error if not present.
+    """
+    objects_exists = False
+    for api_root in client.list_database_names():
+        cols = client[api_root].list_collection_names()
+        if "objects" not in cols:
+            continue
+        objects_exists = True
+        api_root_db = client[api_root]
+        objects = api_root_db["objects"]
+        for result in objects.find({}):
+            if "_manifest" not in result:
+                field_to_use = 'created'
+                if "modified" in result:
+                    field_to_use = 'modified'
+                raise InitializationError("Object {} from {} is missing a manifest".format(result['id'], result[field_to_use]), 408)
+            if not result['_manifest']:
+                field_to_use = 'created'
+                if "modified" in result:
+                    field_to_use = 'modified'
+                raise InitializationError("Object {} from {} has a null manifest".format(result['id'], result[field_to_use]), 408)
+    if not objects_exists:
+        raise InitializationError("Could not find any objects in database", 408)
+
+
+def ensure_database_indexes(client, api_roots):
+    """
+    Checks the discovery database and the given api root databases for the indexes
+    in DISCOVERY_INDEXES and API_ROOT_INDEXES, creating the ones missing. This
+    covers databases created by other tools or by older versions of medallion,
+    whose objects are numbered once by ``migrate_object_sequences``.
+
+    Returns:
+        list of the names of the indexes created
+
+    """
+    database_names = client.list_database_names()
+    if "discovery_database" not in database_names:
+        return []
+    created = create_missing_indexes(client["discovery_database"], DISCOVERY_INDEXES)
+    for api_root in api_roots or []:
+        if api_root in database_names:
+            created.extend(create_missing_indexes(client[api_root], API_ROOT_INDEXES))
+    if created:
+        log.info("Created missing MongoDB indexes: {}".format(", ".join(created)))
+    return created
+
+
+def create_session_store(config, client=None):
+    """
+    Creates the pagination session store named by the ``session_store`` backend
+    option: ``signed`` for stateless tokens signed with ``session_secret``,
+    ``mongo`` for a shared MongoDB collection or ``memory`` for the process
+    memory. It defaults to ``signed`` when a ``session_secret`` is configured,
+    and to ``memory`` otherwise.
+    """
+    secret = config.get("session_secret")
+    store = config.get("session_store") or ("signed" if secret else "memory")
+    timeout = config.get("session_timeout", 30)
+    if store == "signed":
+        if not secret:
+            # a secret of each process would make the tokens of the other workers invalid
+            raise InitializationError("The signed pagination session store needs a session_secret", 408)
+        return SignedTokenStore(secret, timeout)
+    if store == "mongo" and client is not None:
+        return MongoSessionStore(client["discovery_database"]["pagination_sessions"], timeout)
+    if store == "memory":
+        return MemorySessionStore()
+    raise InitializationError("Unsupported pagination session store {!r}".format(store), 408)
+
+
+def clear_database(client):
+    """Drops the discovery database and every api root database, then creates an empty discovery database"""
+    if "discovery_database" in client.list_database_names():
+        log.info("Clearing database")
+        client.drop_database("discovery_database")
+    discovery_db = client["discovery_database"]
+    api_root_info = discovery_db["api_root_info"]
+    for api_info in api_root_info.find({}):
+        client.drop_database(api_info["_name"])
+    client.drop_database("discovery_database")
+    # db with empty tables
+    log.info("Creating empty database")
+    discovery_db = client.get_database("discovery_database")
+    discovery_db.create_collection("discovery_information")
+    discovery_db.create_collection("api_root_info")
+    return discovery_db
+
+
+def load_seed_data(client, json_data, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Populates an empty MongoDB server with the content of a medallion seed file
+    (the same layout used by the MemoryBackend). Objects are inserted in batches
+    and the indexes of each api root are built once its objects are loaded.
+
+    Returns:
+        the number of objects inserted
+
+    """
+    if "/discovery" in json_data:
+        db = client["discovery_database"]
+        db["discovery_information"].insert_one(json_data["/discovery"])
+    else:
+        raise InitializationError("No discovery information provided when initializing the Mongo DB", 408)
+    inserted = 0
+    for api_root_name, api_root_data in json_data.items():
+        if api_root_name == "/discovery":
+            continue
+        api_db = create_seed_api_root(client, api_root_name, api_root_data, json_data["/discovery"])
+        for collection in api_root_data["collections"]:
+            collection_id = collection["id"]
+            objects = collection.pop("objects")
+            manifest = collection.pop("manifest")
+            # these are not in the collections mongodb collection (both TAXII and Mongo DB use the term collection)
+            api_db["collections"].insert_one(collection)
+            manifest_index = {(m["id"], m["version"]): m for m in manifest}
+            documents = [
+                prepare_seed_object(obj, collection_id, manifest_index.get((obj["id"], obj.get("modified", obj.get("created")))))
+                for obj in objects
+            ]
+            documents.sort(key=ingest_order)
+            if documents:
+                first = reserve_sequences(api_db, collection_id, len(documents))
+                for i, doc in enumerate(documents):
+                    doc["_sequence"] = first + i
+            inserted += insert_in_batches(api_db["objects"], documents, batch_size)
+        create_missing_indexes(api_db, API_ROOT_INDEXES)
+    create_missing_indexes(db, DISCOVERY_INDEXES)
+    return inserted
+
+
+def create_seed_api_root(client, api_root_name, api_root_data, discovery):
+    """
+    Records an api root of a seed file in the discovery database and creates
+    its database, with the statuses of the seed file and empty collections and
+    objects collections.
+
+    Returns:
+        the api root database
+
+    """
+    url = list(filter(lambda a: api_root_name in a, discovery["api_roots"]))[0]
+    api_root_data["information"]["_url"] = url
+    api_root_data["information"]["_name"] = api_root_name
+    client["discovery_database"]["api_root_info"].insert_one(api_root_data["information"])
+    client.drop_database(api_root_name)
+    api_db = client[api_root_name]
+    if api_root_data["status"]:
+        api_db["status"].insert_many([status_document(status) for status in api_root_data["status"]])
+    else:
+        api_db.create_collection("status")
+    api_db.create_collection("collections")
+    api_db.create_collection("objects")
+    return api_db
+
+
+def _read_seed_collection(reader):
+    """
+    First pass over a collection of a seed file: returns the collection with
+    its manifest, and instead of its objects the manifest key and creation and
+    modification times of each of them, in file order.
+    """
+    collection = {}
+    object_keys = []
+    for name in reader.members():
+        if name == "objects":
+            for obj in reader.values():
+                object_keys.append((
+                    (obj["id"], obj.get("modified", obj.get("created"))),
+                    datetime_to_float(string_to_datetime(obj["created"])) if "created" in obj else 0,
+                    datetime_to_float(string_to_datetime(obj["modified"])) if "modified" in obj else 0,
+                ))
+        else:
+            collection[name] = reader.value()
+    collection.setdefault("manifest", [])
+    return collection, object_keys
+
+
+def _read_seed_outline(infile):
+    """
+    First pass over a seed file: everything it holds but the objects, see
+    ``_read_seed_collection``. The collections of each api root are
+    (collection, object keys) tuples.
+    """
+    reader = JSONStreamReader(infile)
+    seed = {}
+    for api_root_name in reader.members():
+        if api_root_name == "/discovery":
+            seed[api_root_name] = reader.value()
+            continue
+        api_root_data = {}
+        for name in reader.members():
+            if name == "collections":
+                api_root_data[name] = [_read_seed_collection(reader) for _ in reader.items()]
+            else:
+                api_root_data[name] = reader.value()
+        seed[api_root_name] = api_root_data
+    return seed
+
+
+def _iter_seed_objects(infile, api_root_name, collection_position):
+    """Second pass over a seed file: yields the objects of one of its collections, one at a time"""
+    reader = JSONStreamReader(infile)
+    for name in reader.members():
+        if name != api_root_name:
+            reader.skip()
+            continue
+        for api_root_member in reader.members():
+            if api_root_member != "collections":
+                reader.skip()
+                continue
+            for position in reader.items():
+                if position != collection_position:
+                    reader.skip()
+                    continue
+                for collection_member in reader.members():
+                    if collection_member == "objects":
+                        yield from reader.values()
+                    else:
+                        reader.skip()
+
+
+def load_seed_file(client, path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Same as ``load_seed_data`` for a seed file too large to be read whole.
+    A first streaming pass keeps everything but the objects, with the manifest
+    key and times of each object to number them in ingest order; the objects
+    of each collection are then streamed again and inserted in batches, so no
+    more than a batch of them is held in memory.
+
+    Returns:
+        the number of objects inserted
+
+    """
+    with io.open(path, "r", encoding="utf-8") as infile:
+        seed = _read_seed_outline(infile)
+    if "/discovery" not in seed:
+        raise InitializationError("No discovery information provided when initializing the Mongo DB", 408)
+    db = client["discovery_database"]
+    db["discovery_information"].insert_one(seed["/discovery"])
+    inserted = 0
+    for api_root_name, api_root_data in seed.items():
+        if api_root_name == "/discovery":
+            continue
+        api_db = create_seed_api_root(client, api_root_name, api_root_data, seed["/discovery"])
+        for position, (collection, object_keys) in enumerate(api_root_data["collections"]):
+            collection_id = collection["id"]
+            manifest = collection.pop("manifest")
+            api_db["collections"].insert_one(collection)
+            manifest_index = {(m["id"], m["version"]): m for m in manifest}
+
+            # the ingest_order of each object, from its manifest entry
+            order = sorted(
+                range(len(object_keys)),
+                key=lambda i: (
+                    datetime_to_float(string_to_datetime(manifest_index[object_keys[i][0]]["date_added"])),
+                ) + object_keys[i][1:],
+            )
+            sequences = [0] * len(object_keys)
+            if object_keys:
+                first = reserve_sequences(api_db, collection_id, len(object_keys))
+                for rank, i in enumerate(order):
+                    sequences[i] = first + rank
+
+            with io.open(path, "r", encoding="utf-8") as infile:
+                documents = (
+                    dict(prepare_seed_object(obj, collection_id, manifest_index.get(key)), _sequence=sequence)
+                    for obj, (key, _, _), sequence in zip(_iter_seed_objects(infile, api_root_name, position), object_keys, sequences)
+                )
+                inserted += insert_in_batches(api_db["objects"], documents, batch_size)
+        create_missing_indexes(api_db, API_ROOT_INDEXES)
+    create_missing_indexes(db, DISCOVERY_INDEXES)
+    return inserted
+
+
+def check_collection_exists(client, api_root, collection_id):
+    """Raises a ProcessingError unless the api root and its collection exist"""
+    if not client["discovery_database"]["api_root_info"].find_one({"_name": api_root}, {"_id": 1}):
+        raise ProcessingError("API root '{}' not found".format(api_root), 404)
+    if not client[api_root]["collections"].find_one({"id": collection_id}, {"_id": 1}):
+        raise ProcessingError("Collection '{}' not found in API root '{}'".format(collection_id, api_root), 404)
+
+
+def load_bundle_objects(client, api_root, collection_id, objects, request_time, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Adds the objects of a bundle to a collection using insert_many batches. Objects
+    already present in the collection (same id, version and media type) are skipped
+    with a single lookup per batch rather than one query per object. ``objects``
+    may be any iterable, only a batch of it is held in memory at a time.
+
+    Raises a ProcessingError before anything is inserted when the api root or
+    the collection does not exist.
+
+    Returns:
+        tuple containing the number of objects inserted and the number skipped
+
+    """
+    check_collection_exists(client, api_root, collection_id)
+    api_root_db = client[api_root]
+    objects_info = api_root_db["objects"]
+    media_types = set()
+    inserted = 0
+    skipped = 0
+
+    objects = iter(objects)
+    while True:
+        batch = list(itertools.islice(objects, batch_size))
+        if not batch:
+            break
+        present = set()
+        for doc in objects_info.find(
+            {"_collection_id": collection_id, "id": {"$in": [obj["id"] for obj in batch]}},
+            {"_id": 0, "id": 1, "_manifest.version": 1, "_manifest.media_type": 1},
+        ):
+            present.add((doc["id"], doc["_manifest"]["media_type"]))
+            present.add((doc["id"], doc["_manifest"]["media_type"], doc["_manifest"]["version"]))
+
+        documents = []
+        for new_obj in batch:
+            doc = prepare_new_object(new_obj, collection_id, request_time)
+            key = (doc["id"], doc["_manifest"]["media_type"])
+            if "modified" in doc:
+                key += (doc["_manifest"]["version"],)
+            if key in present:
+                skipped += 1
+                continue
+            present.add((doc["id"], doc["_manifest"]["media_type"]))
+            present.add((doc["id"], doc["_manifest"]["media_type"], doc["_manifest"]["version"]))
+            media_types.add(doc["_manifest"]["media_type"])
+            documents.append(doc)
+        if documents:
+            first = reserve_sequences(api_root_db, collection_id, len(documents))
+            for i, doc in enumerate(documents):
+                doc["_sequence"] = first + i
+        inserted += insert_in_batches(objects_info, documents, batch_size)
+
+    if media_types:
+        api_root_db["collections"].update_one(
+            {"id": collection_id},
+            {"$addToSet": {"media_types": {"$each": sorted(media_types)}}},
+        )
+    return inserted, skipped
+
+
+class MongoSessionStore(SessionStore):
+    """
+    Pagination sessions kept in a MongoDB collection, so a ``next`` id issued by
+    one server process can be used with any other. A TTL index on ``expires_at``
+    lets MongoDB remove abandoned sessions; ``get`` checks it as well since the
+    TTL monitor only runs once a minute.
+    """
+
+    needs_sweeping = False
+
+    def __init__(self, collection, timeout):
+        self.collection = collection
+        self.timeout = timeout
+        create_missing_indexes(collection.database, {collection.name: SESSION_INDEXES})
+
+    def get(self, next_id):
+        now = float_to_datetime(datetime_to_float(get_timestamp()))
+        return self.collection.find_one({"_id": next_id, "expires_at": {"$gt": now}}, {"_id": 0, "expires_at": 0})
+
+    def save(self, next_id, record):
+        if next_id is None:
+            next_id = str(uuid.uuid4())
+        doc = dict(record, expires_at=float_to_datetime(record["request_time"] + self.timeout))
+        self.collection.replace_one({"_id": next_id}, doc, upsert=True)
+        return next_id
+
+    def pop(self, next_id):
+        self.collection.delete_one({"_id": next_id})
+
+    def expire(self, timeout):
+        # done by the TTL index
+        pass
+
+
+class MongoPagination(object):
+    """
+    Pagination state shared by the MongoDB backends. A session records the
+    skip/limit of the request and a fingerprint of the filter arguments it was
+    issued for, kept by the ``SessionStore`` selected by the ``session_store``
+    option. Sessions are only stored once a request has more pages to serve.
+    """
+
+    def _process_params(self, filter_args, limit):
+        next_id = filter_args.get("next")
+        if limit and next_id is None:
+            fingerprint = args_fingerprint(parse_request_parameters(filter_args))
+            record = {"skip": 0, "limit": limit, "after": None, "fingerprint": fingerprint, "request_time": datetime_to_float(get_timestamp())}
+        elif limit and next_id:
+            record = self.next.get(next_id)
+            if record is None:
+                raise ProcessingError("The server did not understand the request or filter parameters: 'next' not valid", 400)
+            if record["fingerprint"] != args_fingerprint(parse_request_parameters(filter_args)):
+                raise ProcessingError("The server did not understand the request or filter parameters: params changed over subsequent transaction", 400)
+            record["limit"] = limit
+            record["request_time"] = datetime_to_float(get_timestamp())
+        else:
+            record = {}
+        return next_id, record
+
+    def _update_record(self, next_id, record, count, internal=False, last_sequence=None):
+        more = False
+        if record:
+            if internal is False:
+                record["skip"] += record["limit"]
+                record["after"] = last_sequence
+            if record["skip"] >= count:
+                if next_id and internal is False:
+                    self.next.pop(next_id)
+                next_id = None
             else:
-                # handle data markings
-                if m["version"] == obj["created"]:
-                    return m
+                more = True
+                if internal is False:
+                    next_id = self.next.save(next_id, record)
+        return next_id, more
+
+    def _expire_pages(self):
+        self.next.expire(self.timeout)
 
 
-class MongoBackend(Backend):
+class MongoBackend(MongoPagination, Backend):
 
     # access control is handled at the views level
 
     @environ.config(prefix="MONGO")
     class Config(object):
         uri = environ.var()
+        max_pool_size = environ.var(None, converter=_optional_int)
+        min_pool_size = environ.var(None, converter=_optional_int)
+        max_idle_time_ms = environ.var(None, converter=_optional_int)
+        wait_queue_timeout_ms = environ.var(None, converter=_optional_int)
+        server_selection_timeout_ms = environ.var(None, converter=_optional_int)
+        connect_timeout_ms = environ.var(None, converter=_optional_int)
+        socket_timeout_ms = environ.var(None, converter=_optional_int)
+        compressors = environ.var(None)
+        write_concern = environ.var(None, converter=_write_concern)
+        read_concern = environ.var(None)
+        read_preference = environ.var(None)
+        app_name = environ.var(None)
+        session_store = environ.var(None)
+        session_secret = environ.var(None)
+        profile_pipelines = environ.var(None, converter=_optional_bool)
+        explain_pipelines = environ.var(None, converter=_optional_bool)
+        slow_pipeline_ms = environ.var(None, converter=_optional_int)
+        change_feed_size = environ.var(None, converter=_optional_int)
+        change_feed_poll_interval = environ.var(None, converter=_optional_float)
 
     def __init__(self, **kwargs):
         try:
 
-            self.pages = {}
-            self.client = MongoClient(kwargs.get("uri"))
+            self.client = MongoClient(kwargs.get("uri"), **get_client_options(kwargs))
+            PIPELINE_PROFILER.configure(
+                kwargs.get("profile_pipelines"), kwargs.get("explain_pipelines"), kwargs.get("slow_pipeline_ms"),
+            )
+            # writes always go to the primary, GET requests may be served by secondaries
+            self.read_preference = get_read_preference(kwargs.get("read_preference"))
+            self.change_feed_size = kwargs.get("change_feed_size") or 1000
+            self.change_feed_poll_interval = kwargs.get("change_feed_poll_interval") or 1.0
 
             # unless clearing the db has been explicitly specified, don't initialize if the discovery_database exits
             # the discovery_databases is a minimally viable database,
@@ -73,49 +931,48 @@ class MongoBackend(Backend):
                     log.info("Initializing Mongo DB backend using " + kwargs.get("filename"))
                     self.initialize_mongodb_with_data(kwargs.get("filename"))
                     self.object_manifest_check()
+            self.ensure_indexes()
+            self.check_object_sequences()
+            self.next = create_session_store(kwargs, self.client)
 
             super(MongoBackend, self).__init__(**kwargs)
+            # set once the interop checks on status_retention have passed, the
+            # TTL index expires statuses whether or not the cleanup threads run
+            self.ensure_status_expiry(kwargs.get("status_retention", SECONDS_IN_24_HOURS))
 
         except ConnectionFailure:
             log.error("Unable to establish a connection to MongoDB server {}".format(kwargs.get("uri")))
 
+    def _get_read_database(self, name):
+        """Database handle used to serve GET requests, honouring the configured read preference"""
+        return self.client.get_database(name, read_preference=self.read_preference)
+
     def database_established(self):
         """
         Checks to see if a medallion database exists
         """
         return "discovery_database" in self.client.list_database_names()
 
-    def _process_params(self, filter_args, limit):
-        next_id = filter_args.get("next")
-        if limit and next_id is None:
-            client_params = parse_request_parameters(filter_args)
-            record = {"skip": 0, "limit": limit, "args": client_params, "request_time": datetime_to_float(get_timestamp())}
-            next_id = str(uuid.uuid4())
-            self.pages[next_id] = record
-        elif limit and next_id:
-            if next_id not in self.pages:
-                raise ProcessingError("The server did not understand the request or filter parameters: 'next' not valid", 400)
-            client_params = parse_request_parameters(filter_args)
-            if self.pages[next_id]["args"] != client_params:
-                raise ProcessingError("The server did not understand the request or filter parameters: params changed over subsequent transaction", 400)
-            self.pages[next_id]["limit"] = limit
-            self.pages[next_id]["request_time"] = datetime_to_float(get_timestamp())
-            record = self.pages[next_id]
-        else:
-            record = {}
-        return next_id, record
+    def ensure_indexes(self):
+        """
+        Creates the expected indexes missing from the medallion databases, see
+        ``ensure_database_indexes``.
+        """
+        return ensure_database_indexes(self.client, self._get_all_api_roots())
 
-    def _update_record(self, next_id, count, internal=False):
-        more = False
-        if next_id:
-            if internal is False:
-                self.pages[next_id]["skip"] += self.pages[next_id]["limit"]
-            if self.pages[next_id]["skip"] >= count:
-                self.pages.pop(next_id, None)
-                next_id = None
-            else:
-                more = True
-        return next_id, more
+    def check_object_sequences(self):
+        """
+        Warns about the collections with objects stored without an ingest
+        sequence number, see ``find_unnumbered_collections``.
+        """
+        unnumbered = find_unnumbered_collections(self.client, self._get_all_api_roots())
+        if unnumbered:
+            log.warning(
+                "Objects of the collections %s have no ingest sequence number: they are listed first and left out of "
+                "later pages and of the change feed until medallion-migrate is run",
+                ", ".join("{}/{}".format(api_root, collection_id) for api_root, collection_id in unnumbered),
+            )
+        return unnumbered
 
     def _validate_object_id(self, manifest_info, collection_id, object_id):
         result = list(manifest_info.find({"_collection_id": collection_id, "id": object_id}).limit(1))
@@ -123,53 +980,29 @@ class MongoBackend(Backend):
             raise ProcessingError("Object '{}' not found".format(object_id), 404)
 
     def _pop_expired_sessions(self):
-        expired_ids = []
-        boundary = datetime_to_float(get_timestamp())
-        for next_id, record in self.pages.items():
-            if boundary - record["request_time"] > self.timeout:
-                expired_ids.append(next_id)
-
-        for item in expired_ids:
-            self.pages.pop(item)
+        self._expire_pages()
 
     def _pop_old_statuses(self):
+        # MongoDB expires statuses through the TTL index, this only covers the
+        # time until its monitor runs
         if "discovery_database" in self.client.list_database_names():
             api_roots = self._get_all_api_roots()
             if api_roots:
-                status_retention_in_milliseconds = self.status_retention * 1000
+                boundary = float_to_datetime(datetime_to_float(get_timestamp()) - self.status_retention)
                 for ar in api_roots:
-                    statuses_of_api_root = self._get_api_root_statuses(ar)
-                    result = statuses_of_api_root.aggregate([
-                            {
-                                "$project": {
-                                    "id": 1,
-                                    "date_difference": {
-                                        "$subtract": [
-                                            "$$NOW",
-                                            {
-                                                "$dateFromString": {
-                                                    "dateString": "$request_timestamp"
-                                                }
-                                            }
-                                        ]
-                                    },
-                                }
-                            },
-                            {
-                                "$match": {
-                                    "date_difference": {
-                                        "$gt": status_retention_in_milliseconds
-                                    }
-                                }
-                            }
-                        ]
-                    )
-                    for doc in result:
-                        log.info("Status {} was deleted from {} because it was older than the status retention time".format(doc["id"], ar))
-                        statuses_of_api_root.delete_one({"_id": doc["_id"]})
+                    result = self._get_api_root_statuses(ar).delete_many({"_request_date": {"$lt": boundary}})
+                    if result.deleted_count:
+                        log.info("{} statuses were deleted from {} because they were older than the status retention time".format(result.deleted_count, ar))
+
+    def ensure_status_expiry(self, retention):
+        """Sets the status expiry of every api root database, see ``ensure_status_expiry``"""
+        database_names = self.client.list_database_names()
+        for api_root in self._get_all_api_roots() or []:
+            if api_root in database_names:
+                ensure_status_expiry(self.client[api_root], retention)
 
     def _get_object_manifest(self, api_root, collection_id, filter_args, allowed_filters, limit, internal=False):
-        api_root_db = self.client[api_root]
+        api_root_db = self._get_read_database(api_root)
         objects_info = api_root_db["objects"]
         next_id, record = self._process_params(filter_args, limit)
 
@@ -189,7 +1022,7 @@ class MongoBackend(Backend):
             obj["date_added"] = datetime_to_string(float_to_datetime(obj["date_added"]))
             obj["version"] = datetime_to_string_stix(float_to_datetime(obj["version"]))
 
-        next_id, more = self._update_record(next_id, count, internal)
+        next_id, more = self._update_record(next_id, record, count, internal, full_filter.last_sequence)
         manifest_resource = create_resource("objects", objects_found, more, next_id)
         if internal:
             return manifest_resource
@@ -201,28 +1034,7 @@ class MongoBackend(Backend):
         """
         Checks for manifests in each object, throws an error if not present.
         """
-        db = self.client
-        objects_exists = False
-        for api_root in db.list_database_names():
-            cols = db[api_root].list_collection_names()
-            if "objects" not in cols:
-                continue
-            objects_exists = True
-            api_root_db = db[api_root]
-            objects = api_root_db["objects"]
-            for result in objects.find({}):
-                if "_manifest" not in result:
-                    field_to_use = 'created'
-                    if "modified" in result:
-                        field_to_use = 'modified'
-                    raise InitializationError("Object {} from {} is missing a manifest".format(result['id'], result[field_to_use]), 408)
-                if not result['_manifest']:
-                    field_to_use = 'created'
-                    if "modified" in result:
-                        field_to_use = 'modified'
-                    raise InitializationError("Object {} from {} has a null manifest".format(result['id'], result[field_to_use]), 408)
-        if not objects_exists:
-            raise InitializationError("Could not find any objects in database", 408)
+        check_object_manifests(self.client)
 
     @catch_mongodb_error
     def _update_manifest(self, api_root, collection_id, media_type):
@@ -240,7 +1052,7 @@ class MongoBackend(Backend):
 
     @catch_mongodb_error
     def server_discovery(self):
-        discovery_db = self.client["discovery_database"]
+        discovery_db = self._get_read_database("discovery_database")
         discovery_info = discovery_db["discovery_information"]
         info = discovery_info.find_one()
         if info:
@@ -252,7 +1064,7 @@ class MongoBackend(Backend):
         if api_root not in self.client.list_database_names():
             return None  # must return None, so 404 is raised
 
-        api_root_db = self.client[api_root]
+        api_root_db = self._get_read_database(api_root)
         collection_info = api_root_db["collections"]
         collections = list(collection_info.find({}, {"_id": 0}))
         # interop wants results sorted by id - no need to check for interop option
@@ -265,7 +1077,7 @@ class MongoBackend(Backend):
         if api_root not in self.client.list_database_names():
             return None  # must return None, so 404 is raised
 
-        api_root_db = self.client[api_root]
+        api_root_db = self._get_read_database(api_root)
         collection_info = api_root_db["collections"]
         info = collection_info.find_one({"id": collection_id}, {"_id": 0})
         return info
@@ -276,7 +1088,7 @@ class MongoBackend(Backend):
 
     @catch_mongodb_error
     def get_api_root_information(self, api_root_name):
-        db = self.client["discovery_database"]
+        db = self._get_read_database("discovery_database")
         api_root_info = db["api_root_info"]
         info = api_root_info.find_one(
             {"_name": api_root_name},
@@ -291,17 +1103,17 @@ class MongoBackend(Backend):
 
     @catch_mongodb_error
     def get_status(self, api_root, status_id):
-        api_root_db = self.client[api_root]
+        api_root_db = self._get_read_database(api_root)
         status_info = api_root_db["status"]
         result = status_info.find_one(
             {"id": status_id},
-            {"_id": 0}
+            {"_id": 0, "_request_date": 0}
         )
         return result
 
     @catch_mongodb_error
     def get_objects(self, api_root, collection_id, filter_args, allowed_filters, limit):
-        api_root_db = self.client[api_root]
+        api_root_db = self._get_read_database(api_root)
         objects_info = api_root_db["objects"]
         next_id, record = self._process_params(filter_args, limit)
 
@@ -328,13 +1140,13 @@ class MongoBackend(Backend):
         manifest_resource = self._get_object_manifest(api_root, collection_id, filter_args, allowed_filters, limit, True)
         headers = get_custom_headers(manifest_resource)
 
-        next_id, more = self._update_record(next_id, count)
+        next_id, more = self._update_record(next_id, record, count, last_sequence=full_filter.last_sequence)
         return create_resource("objects", objects_found, more, next_id), headers
 
     @catch_mongodb_error
     def _add_status(self, api_root_name, status):
         api_root_db = self.client[api_root_name]
-        api_root_db["status"].insert_one(status)
+        api_root_db["status"].insert_one(status_document(status))
 
     @catch_mongodb_error
     def add_objects(self, api_root, collection_id, objs, request_time):
@@ -346,35 +1158,31 @@ class MongoBackend(Backend):
         successes = []
         failures = []
         media_fmt = "application/stix+json;version={}"
+        # the documents to insert, and the (id, media type[, version]) keys they hold
+        documents = []
+        new_keys = set()
+        media_types = set()
 
         try:
             for new_obj in objs["objects"]:
                 media_type = media_fmt.format(determine_spec_version(new_obj))
                 mongo_query = {"_collection_id": collection_id, "id": new_obj["id"], "_manifest.media_type": media_type}
+                key = (new_obj["id"], media_type)
                 if "modified" in new_obj:
                     mongo_query["_manifest.version"] = datetime_to_float(string_to_datetime(new_obj["modified"]))
-                existing_entry = objects_info.find_one(mongo_query)
+                    key += (mongo_query["_manifest.version"],)
                 obj_version = determine_version(new_obj, request_time)
 
-                if existing_entry:
+                if key in new_keys or objects_info.find_one(mongo_query):
                     message = "Object already added"
 
                 else:
                     message = None
-                    new_obj.update({"_collection_id": collection_id})
-                    if "modified" in new_obj:
-                        new_obj["modified"] = datetime_to_float(string_to_datetime(new_obj["modified"]))
-                    if "created" in new_obj:
-                        new_obj["created"] = datetime_to_float(string_to_datetime(new_obj["created"]))
-                    _manifest = {
-                        "id": new_obj["id"],
-                        "date_added": datetime_to_float(request_time),
-                        "version": datetime_to_float(string_to_datetime(obj_version)),
-                        "media_type": media_type,
-                    }
-                    new_obj.update({"_manifest": _manifest})
-                    objects_info.insert_one(new_obj)
-                    self._update_manifest(api_root, collection_id, media_type)
+                    doc = prepare_new_object(new_obj, collection_id, request_time)
+                    new_keys.add((doc["id"], media_type))
+                    new_keys.add((doc["id"], media_type, doc["_manifest"]["version"]))
+                    media_types.add(media_type)
+                    documents.append(doc)
 
                 # else: we already have the object, so this is a
                 # no-op.
@@ -384,6 +1192,15 @@ class MongoBackend(Backend):
                 )
                 successes.append(status_detail)
                 succeeded += 1
+
+            if documents:
+                # one block of sequence numbers for the whole request
+                first = reserve_sequences(api_root_db, collection_id, len(documents))
+                for i, doc in enumerate(documents):
+                    doc["_sequence"] = first + i
+                objects_info.insert_many(documents)
+                for media_type in sorted(media_types):
+                    self._update_manifest(api_root, collection_id, media_type)
         except Exception as e:
             # log.exception(e)
             raise ProcessingError("While processing supplied content, an error occurred", 422, e)
@@ -392,14 +1209,54 @@ class MongoBackend(Backend):
             datetime_to_string(request_time), "complete", succeeded, failed,
             pending, successes=successes, failures=failures,
         )
-        api_root_db["status"].insert_one(status)
-        status.pop("_id", None)
+        api_root_db["status"].insert_one(status_document(status))
         return status
 
     @catch_mongodb_error
-    def get_object(self, api_root, collection_id, object_id, filter_args, allowed_filters, limit):
+    def get_changes(self, api_root, collection_id, since, timeout):
+        """
+        Answers from the ingest sequence numbers of the stored objects, so
+        every process serving the database sees the objects added by all of
+        them. The current sequence of a collection is its counter in the
+        ``sequences`` collection; a waiting client polls the
+        ``(_collection_id, _sequence)`` index every ``change_feed_poll_interval``
+        seconds, and at most ``change_feed_size`` objects are returned at once,
+        with the sequence number of the last of them.
+        """
         api_root_db = self.client[api_root]
+        counter = api_root_db["sequences"].find_one({"_id": collection_id})
+        last_sequence = counter["value"] if counter else 0
+        if since is None:
+            return last_sequence, []
+        if since > last_sequence:
+            return last_sequence, None
+
+        query = {"_collection_id": collection_id, "_sequence": {"$gt": since}}
+        deadline = time.monotonic() + timeout
+        while True:
+            docs = list(api_root_db["objects"].find(query).sort("_sequence", ASCENDING).limit(self.change_feed_size))
+            remaining = deadline - time.monotonic()
+            if docs or remaining <= 0:
+                break
+            time.sleep(min(self.change_feed_poll_interval, remaining))
+        if not docs:
+            return since, []
+        sequence = docs[-1]["_sequence"]
+        return sequence, object_resource(docs)[0]["objects"]
+
+    @catch_mongodb_error
+    def get_object(self, api_root, collection_id, object_id, filter_args, allowed_filters, limit):
+        api_root_db = self._get_read_database(api_root)
         objects_info = api_root_db["objects"]
+        if is_plain_object_request(filter_args):
+            # a single lookup on the (_collection_id, id) index
+            docs = list(objects_info.find({"_collection_id": collection_id, "id": object_id}, {"_id": 0, "_collection_id": 0}))
+            if not docs:
+                raise ProcessingError("Object '{}' not found".format(object_id), 404)
+            result = latest_object_resource(docs, limit)
+            if result is not None:
+                return result
+
         # set manually to properly retrieve manifests, and early to not break the pagination checks
         filter_args["match[id]"] = object_id
         next_id, record = self._process_params(filter_args, limit)
@@ -427,7 +1284,7 @@ class MongoBackend(Backend):
         manifest_resource = self._get_object_manifest(api_root, collection_id, filter_args, ("id", "type", "version", "spec_version"), limit, True)
         headers = get_custom_headers(manifest_resource)
 
-        next_id, more = self._update_record(next_id, count)
+        next_id, more = self._update_record(next_id, record, count, last_sequence=full_filter.last_sequence)
         return create_resource("objects", objects_found, more, next_id), headers
 
     @catch_mongodb_error
@@ -435,31 +1292,50 @@ class MongoBackend(Backend):
         api_root_db = self.client[api_root]
         objects_info = api_root_db["objects"]
 
-        self._validate_object_id(objects_info, collection_id, object_id)
-
-        # Currently it will delete the object and the matching manifest from the backend
+        # Currently it will delete the object and the matching manifest from the backend.
+        # An unknown id matches nothing, so the filter pass doubles as the validation.
         full_filter = MongoDBFilter(
             filter_args,
             {"_collection_id": {"$eq": collection_id}, "id": {"$eq": object_id}},
             allowed_filters,
         )
-        count, objects_found = full_filter.process_filter(
+        _, objects_found = full_filter.process_filter(
             objects_info,
             allowed_filters,
-            "raw"
+            "raw",
+            with_count=False,
         )
-        if objects_found:
-            for obj in objects_found:
-                obj_version = obj["_manifest"]["version"]
-                objects_info.delete_one(
-                    {"_collection_id": collection_id, "id": object_id, "_manifest.version": obj_version}
-                )
-        else:
+        if not objects_found:
             raise ProcessingError("Object '{}' not found".format(object_id), 404)
+        # every matched version in one round trip
+        objects_info.delete_many({"_id": {"$in": [obj["_id"] for obj in objects_found]}})
+
+    @catch_mongodb_error
+    def fetch_objects(self, api_root, collection_id, entries):
+        objects_info = self._get_read_database(api_root)["objects"]
+        # all the versions of all the requested objects in one query
+        grouped = group_by_object(objects_info.find(
+            {"_collection_id": collection_id, "id": {"$in": sorted({object_id for object_id, _ in entries})}},
+        ))
+        docs, missing = select_requested_objects(grouped, entries)
+        resource, _ = object_resource(docs)
+        return resource.get("objects", []), missing
+
+    @catch_mongodb_error
+    def delete_objects(self, api_root, collection_id, entries):
+        objects_info = self.client[api_root]["objects"]
+        grouped = group_by_object(objects_info.find(
+            {"_collection_id": collection_id, "id": {"$in": sorted({object_id for object_id, _ in entries})}},
+            VERSION_SELECTION_PROJECTION,
+        ))
+        docs, missing = select_requested_objects(grouped, entries)
+        if docs:
+            objects_info.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        return missing
 
     @catch_mongodb_error
     def get_object_versions(self, api_root, collection_id, object_id, filter_args, allowed_filters, limit):
-        api_root_db = self.client[api_root]
+        api_root_db = self._get_read_database(api_root)
         objects_info = api_root_db["objects"]
         # set manually to properly retrieve manifests, and early to not break the pagination checks
         filter_args["match[id]"] = object_id
@@ -484,85 +1360,19 @@ class MongoBackend(Backend):
         headers = get_custom_headers(manifest_resource)
 
         manifests_found = list(map(lambda x: datetime_to_string_stix(float_to_datetime(x["version"])), manifests_found))
-        next_id, more = self._update_record(next_id, count)
+        next_id, more = self._update_record(next_id, record, count, last_sequence=full_filter.last_sequence)
         return create_resource("versions", manifests_found, more, next_id), headers
 
     def load_data_from_file(self, filename):
-        try:
-            if isinstance(filename, string_types):
-                with io.open(filename, "r", encoding="utf-8") as infile:
-                    self.json_data = json.load(infile)
-            else:
-                self.json_data = json.load(filename)
-        except Exception as e:
-            raise InitializationError("Problem loading initialization data from {0}".format(filename), 408, e)
+        self.json_data = load_json_file(filename)
 
-    def initialize_mongodb_with_data(self, filename):
+    def initialize_mongodb_with_data(self, filename, batch_size=DEFAULT_BATCH_SIZE):
         self.load_data_from_file(filename)
-        if "/discovery" in self.json_data:
-            db = self.client["discovery_database"]
-            db["discovery_information"].insert_one(self.json_data["/discovery"])
-        else:
-            raise InitializationError("No discovery information provided when initializing the Mongo DB")
-        api_root_info_db = db["api_root_info"]
-        for api_root_name, api_root_data in self.json_data.items():
-            if api_root_name == "/discovery":
-                continue
-            url = list(filter(lambda a: api_root_name in a, self.json_data["/discovery"]["api_roots"]))[0]
-            api_root_data["information"]["_url"] = url
-            api_root_data["information"]["_name"] = api_root_name
-            api_root_info_db.insert_one(api_root_data["information"])
-            self.client.drop_database(api_root_name)
-            api_db = self.client[api_root_name]
-            if api_root_data["status"]:
-                api_db["status"].insert_many(api_root_data["status"])
-            else:
-                api_db.create_collection("status")
-            api_db.create_collection("collections")
-            api_db.create_collection("objects")
-            for collection in api_root_data["collections"]:
-                collection_id = collection["id"]
-                objects = collection["objects"]
-                manifest = collection["manifest"]
-                # these are not in the collections mongodb collection (both TAXII and Mongo DB use the term collection)
-                collection.pop("objects")
-                collection.pop("manifest")
-                api_db["collections"].insert_one(collection)
-                for obj in objects:
-                    obj["_collection_id"] = collection_id
-                    obj["_manifest"] = find_manifest_entries_for_id(obj, manifest)
-                    obj["_manifest"]["date_added"] = datetime_to_float(string_to_datetime(obj["_manifest"]["date_added"]))
-                    obj["_manifest"]["version"] = datetime_to_float(string_to_datetime(obj["_manifest"]["version"]))
-                    obj["created"] = datetime_to_float(string_to_datetime(obj["created"]))
-                    if "modified" in obj:
-                        # not for data markings
-                        obj["modified"] = datetime_to_float(string_to_datetime(obj["modified"]))
-                    api_db["objects"].insert_one(obj)
-                id_index = IndexModel([("id", ASCENDING)])
-                type_index = IndexModel([("type", ASCENDING)])
-                collection_index = IndexModel([("_collection_id", ASCENDING)])
-                date_index = IndexModel([("_manifest.date_added", ASCENDING)])
-                version_index = IndexModel([("_manifest.version", ASCENDING)])
-                date_and_spec_index = IndexModel([("_manifest.media_type", ASCENDING), ("_manifest.date_added", ASCENDING)])
-                version_and_spec_index = IndexModel([("_manifest.media_type", ASCENDING), ("_manifest.version", ASCENDING)])
-                collection_and_date_index = IndexModel([("_collection_id", ASCENDING), ("_manifest.date_added", ASCENDING)])
-                api_db["objects"].create_indexes(
-                    [id_index, type_index, date_index, version_index, collection_index, date_and_spec_index,
-                     version_and_spec_index, collection_and_date_index]
-                )
+        return load_seed_data(self.client, self.json_data, batch_size)
+
+    def load_bundle(self, api_root, collection_id, bundle, request_time, batch_size=DEFAULT_BATCH_SIZE):
+        """Bulk version of add_objects which does not record a status, see ``load_bundle_objects``"""
+        return load_bundle_objects(self.client, api_root, collection_id, bundle["objects"], request_time, batch_size)
 
     def clear_db(self):
-        if "discovery_database" in self.client.list_database_names():
-            log.info("Clearing database")
-            self.client.drop_database("discovery_database")
-        discovery_db = self.client["discovery_database"]
-        api_root_info = discovery_db["api_root_info"]
-        for api_info in api_root_info.find({}):
-            self.client.drop_database(api_info["_name"])
-        self.client.drop_database("discovery_database")
-        # db with empty tables
-        log.info("Creating empty database")
-        discovery_db = self.client.get_database("discovery_database")
-        discovery_db.create_collection("discovery_information")
-        discovery_db.create_collection("api_root_info")
-        return discovery_db
+        return clear_database(self.client)
@@ -0,0 +1,185 @@
+import base64
+import hashlib
+import hmac
+import json
+import uuid
+
+from ..common import ExpiryHeap, datetime_to_float, get_timestamp
+
+
+def args_fingerprint(args):
+    """
+    Digest of the filter arguments of a paginated request, as returned by
+    ``parse_request_parameters``, used to detect parameters changing between pages.
+    """
+    canonical = json.dumps({key: sorted(values) for key, values in args.items()}, sort_keys=True)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class SessionStore(object):
+    """
+    Storage for pagination sessions, the state behind the ``next`` ids handed
+    to clients. Records are dicts which carry a ``request_time`` float, updated
+    by the backend each time the session is used.
+    """
+
+    # False for stores which expire sessions without the backend sweeping them
+    needs_sweeping = True
+
+    def get(self, next_id):
+        """
+        Fill:
+            Return the record stored for ``next_id``
+
+        Args:
+            next_id (str): the ``next`` id given to the client
+
+        Returns:
+            the session record, or None if it is unknown or expired
+
+        """
+        raise NotImplementedError()
+
+    def save(self, next_id, record):
+        """
+        Fill:
+            Store or replace the record for ``next_id``
+
+        Args:
+            next_id (str): the ``next`` id given to the client, or None for a
+                new session
+            record (dict): the session record
+
+        Returns:
+            the ``next`` id to give to the client for this record
+
+        """
+        raise NotImplementedError()
+
+    def pop(self, next_id):
+        """
+        Fill:
+            Remove the record for ``next_id``, if present
+
+        Args:
+            next_id (str): the ``next`` id given to the client
+
+        Returns:
+            None
+
+        """
+        raise NotImplementedError()
+
+    def expire(self, timeout):
+        """
+        Fill:
+            Remove the records not used for more than ``timeout`` seconds
+
+        Args:
+            timeout (int): the session timeout in seconds
+
+        Returns:
+            None
+
+        """
+        raise NotImplementedError()
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Sessions kept in a dict, only visible to the process which created them.
+    Each session has one entry in a heap ordered by request time, so expiring
+    sessions only looks at the sessions old enough to expire.
+    """
+
+    def __init__(self):
+        self.records = {}
+        self.deadlines = ExpiryHeap()
+
+    def __contains__(self, next_id):
+        return next_id in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, next_id):
+        return self.records.get(next_id)
+
+    def save(self, next_id, record):
+        if next_id is None:
+            next_id = str(uuid.uuid4())
+        if next_id not in self.records:
+            self.deadlines.push(record["request_time"], next_id)
+        self.records[next_id] = record
+        return next_id
+
+    def pop(self, next_id):
+        # the heap entry is dropped when it comes up
+        self.records.pop(next_id, None)
+
+    def expire(self, timeout):
+        boundary = datetime_to_float(get_timestamp()) - timeout
+        for _, next_id in list(self.deadlines.pop_older_than(boundary)):
+            record = self.records.get(next_id)
+            if record is None:
+                continue
+            if record["request_time"] < boundary:
+                del self.records[next_id]
+            else:
+                # used since the entry was pushed
+                self.deadlines.push(record["request_time"], next_id)
+
+
+class SignedTokenStore(SessionStore):
+    """
+    Keeps no state at all: the ``next`` id is the session record itself (skip,
+    limit, sequence number of the last object returned, filter fingerprint and
+    request time) followed by an HMAC-SHA256 signature, so clients cannot alter
+    it. Any server process configured with the same secret accepts the tokens
+    of the others.
+
+    Only records with those five fields can be stored.
+    """
+
+    needs_sweeping = False
+
+    def __init__(self, secret, timeout):
+        if isinstance(secret, str):
+            secret = secret.encode("utf-8")
+        self.secret = secret
+        self.timeout = timeout
+
+    def _sign(self, payload):
+        digest = hmac.new(self.secret, payload.encode("utf-8"), hashlib.sha256).digest()[:16]
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+    def get(self, next_id):
+        payload, _, signature = next_id.rpartition(".")
+        if not payload or not hmac.compare_digest(signature.encode("utf-8"), self._sign(payload).encode("ascii")):
+            return None
+        try:
+            skip, limit, after, fingerprint, request_time = payload.split(".")
+            record = {
+                "skip": int(skip, 16),
+                "limit": int(limit, 16),
+                "after": int(after, 16) or None,
+                "fingerprint": fingerprint,
+                "request_time": int(request_time, 16),
+            }
+        except ValueError:
+            return None
+        if datetime_to_float(get_timestamp()) - record["request_time"] > self.timeout:
+            return None
+        return record
+
+    def save(self, next_id, record):
+        payload = "{:x}.{:x}.{:x}.{}.{:x}".format(
+            record["skip"], record["limit"], record.get("after") or 0, record["fingerprint"], int(record["request_time"]),
+        )
+        return payload + "." + self._sign(payload)
+
+    def pop(self, next_id):
+        pass
+
+    def expire(self, timeout):
+        pass
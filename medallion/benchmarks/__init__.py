@@ -0,0 +1,19 @@
+import statistics
+import time
+
+
+def measure(function, iterations, repeat=5):
+    """
+    Times ``iterations`` calls of ``function``, ``repeat`` times.
+
+    Returns:
+        dict of the median and best time per call, in nanoseconds
+
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(iterations):
+            function()
+        timings.append((time.perf_counter_ns() - start) / iterations)
+    return {"median_ns": statistics.median(timings), "best_ns": min(timings), "iterations": iterations}
@@ -0,0 +1,3 @@
+from .endpoints import main
+
+main()
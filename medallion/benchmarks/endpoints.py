@@ -0,0 +1,405 @@
+"""
+Benchmark of the TAXII endpoints, served by the Memory and Mongo DB back-ends
+from synthetic collections and driven through the Flask test client, so the
+numbers cover medallion itself rather than a network stack.
+
+Each scenario sends the same kind of request repeatedly and reports its
+throughput and latency percentiles, counting as errors the responses which do
+not hold the resource expected. Results are written as JSON, and a previous
+result file given to ``--compare`` flags the scenarios which got slower, so
+regressions show up between commits. Results are labelled with the engine
+serving them, and mongomock runs are never compared with MongoDB ones.
+"""
+import argparse
+import base64
+import collections
+import contextlib
+import datetime as dt
+import inspect
+import itertools
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
+
+from .. import __version__, connect_to_backend, register_blueprints, set_config
+from ..common import (
+    APPLICATION_INSTANCE, datetime_to_string,
+    get_application_instance_config_values
+)
+from ..scripts.generate import (
+    DEFAULT_COLLECTION_ID, DEFAULT_END, DEFAULT_START, CorpusGenerator,
+    write_seed_file
+)
+from ..views import MEDIA_TYPE_TAXII_V21
+
+log = logging.getLogger(__name__)
+
+USERNAME = "bench"
+PASSWORD = "bench"
+MONGOMOCK_URI = "mongomock://"
+
+API_ROOT = "bench"
+COLLECTION_ID = DEFAULT_COLLECTION_ID
+
+# members, with their types, of the resource each scenario expects in its responses
+ENVELOPE = {"more": bool, "objects": list}
+STATUS = {
+    "id": str, "status": str, "total_count": int, "success_count": int, "failure_count": int, "pending_count": int,
+}
+EXPECTED_RESOURCES = {
+    "discovery": {"title": str, "api_roots": list},
+    "api_root": {"title": str, "versions": list, "max_content_length": int},
+    "collections": {"collections": list},
+    "collection": {"id": str, "title": str, "can_read": bool, "can_write": bool},
+    "status": STATUS,
+    "objects": ENVELOPE,
+    "objects_paged": ENVELOPE,
+    "objects_match_type": ENVELOPE,
+    "objects_added_after": ENVELOPE,
+    "objects_all_versions": ENVELOPE,
+    "object": ENVELOPE,
+    "object_versions": {"more": bool, "versions": list},
+    "manifest": ENVELOPE,
+    "manifest_paged": ENVELOPE,
+    "bulk_fetch": {"objects": list},
+    "add_objects": STATUS,
+}
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def summarize(latencies, elapsed, errors):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors.values()),
+        "error_kinds": dict(errors),
+        "throughput": len(latencies) / elapsed if elapsed else None,
+        "latency_ms": {
+            "mean": sum(latencies) / len(latencies) * 1000,
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p90": percentile(latencies, 0.90) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "max": latencies[-1] * 1000,
+        },
+    }
+
+
+def response_error(response, resource):
+    """
+    Tells why a response does not hold the resource expected, the members of
+    ``resource`` with their types, or returns None when it does
+    """
+    if response.status_code >= 400:
+        return str(response.status_code)
+    body = response.json
+    if not isinstance(body, dict):
+        return "not a JSON object"
+    for member, kind in resource.items():
+        if not isinstance(body.get(member), kind):
+            return "no {} {}".format(kind.__name__, member)
+    if body.get("more") and not body.get("next"):
+        return "more without next"
+    return None
+
+
+def run_scenario(request, requests, warmup, resource=None):
+    """
+    Times ``requests`` calls of a scenario, after ``warmup`` untimed ones. The
+    responses of the timed calls are checked against ``resource``, see
+    ``response_error``; without it only their status is.
+    """
+    for _ in range(warmup):
+        request()
+    latencies = []
+    errors = collections.Counter()
+    start = time.perf_counter()
+    for _ in range(requests):
+        before = time.perf_counter()
+        response = request()
+        latencies.append(time.perf_counter() - before)
+        error = response_error(response, resource or {})
+        if error:
+            errors[error] += 1
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+def make_scenarios(client, object_ids, page_size, seed):
+    """
+    Returns the scenarios, as (name, function sending one request) pairs,
+    covering every endpoint.
+    """
+    token = base64.b64encode("{}:{}".format(USERNAME, PASSWORD).encode("utf-8")).decode("ascii")
+    headers = {"Accept": MEDIA_TYPE_TAXII_V21, "Authorization": "Basic " + token}
+    post_headers = dict(headers, **{"Content-Type": MEDIA_TYPE_TAXII_V21})
+    api_root = "/{}/".format(API_ROOT)
+    collection = "{}collections/{}/".format(api_root, COLLECTION_ID)
+    ids = itertools.cycle(object_ids)
+    # the objects are added evenly over the year of the corpus, about half of them after this
+    added_after = datetime_to_string(DEFAULT_START + (DEFAULT_END - DEFAULT_START) / 2)
+
+    def get(path):
+        return lambda: client.get(path, headers=headers)
+
+    def each_object(suffix):
+        return lambda: client.get("{}objects/{}/{}".format(collection, next(ids), suffix), headers=headers)
+
+    def paged(path):
+        # follows the next links, starting over after the last page
+        state = {"next": None}
+
+        def request():
+            if state["next"]:
+                response = client.get("{}&next={}".format(path, state["next"]), headers=headers)
+            else:
+                response = client.get(path, headers=headers)
+            state["next"] = response.json.get("next") if response.status_code == 200 and response.json.get("more") else None
+            return response
+        return request
+
+    def bulk_fetch():
+        body = {"objects": [next(ids) for _ in range(min(50, len(object_ids)))]}
+        return client.post(collection + "bulk/fetch/", data=json.dumps(body), headers=post_headers)
+
+    new_objects = (obj for obj, _ in CorpusGenerator(seed=seed + 1).objects(sys.maxsize))
+
+    def add_objects():
+        bundle = {"objects": list(itertools.islice(new_objects, 10))}
+        return client.post(collection + "objects/", data=json.dumps(bundle), headers=post_headers)
+
+    status_id = add_objects().json["id"]
+
+    return [
+        ("discovery", get("/taxii2/")),
+        ("api_root", get(api_root)),
+        ("collections", get(api_root + "collections/")),
+        ("collection", get(collection)),
+        ("status", get("{}status/{}/".format(api_root, status_id))),
+        ("objects", get(collection + "objects/")),
+        ("objects_paged", paged("{}objects/?limit={}".format(collection, page_size))),
+        ("objects_match_type", get(collection + "objects/?match[type]=indicator")),
+        ("objects_added_after", get("{}objects/?added_after={}".format(collection, added_after))),
+        ("objects_all_versions", get(collection + "objects/?match[version]=all")),
+        ("object", each_object("")),
+        ("object_versions", each_object("versions/")),
+        ("manifest", get(collection + "manifest/")),
+        ("manifest_paged", paged("{}manifest/?limit={}".format(collection, page_size))),
+        ("bulk_fetch", bulk_fetch),
+        ("add_objects", add_objects),
+    ]
+
+
+def engine(backend, mongo_uri):
+    """Names what serves the back-end: memory, mongomock or mongodb"""
+    if backend == "memory":
+        return "memory"
+    return "mongomock" if mongo_uri == MONGOMOCK_URI else "mongodb"
+
+
+@contextlib.contextmanager
+def benchmark_client(backend, seed_file, page_size, mongo_uri):
+    """Sets the application up with a back-end loaded from the seed file"""
+    if backend == "memory":
+        backend_config = {"module_class": "MemoryBackend", "filename": seed_file}
+    else:
+        backend_config = {"module_class": "MongoBackend", "uri": mongo_uri, "filename": seed_file}
+    configuration = {
+        "backend": backend_config,
+        "users": {USERNAME: PASSWORD},
+        "taxii": {"max_page_size": page_size},
+    }
+
+    with contextlib.ExitStack() as stack:
+        if engine(backend, mongo_uri) == "mongomock":
+            try:
+                import mongomock
+            except ImportError:
+                raise ImportError("The mongomock package is needed to benchmark the Mongo DB back-end without a server")
+            client = mongomock.MongoClient()
+            stack.enter_context(mock.patch("medallion.backends.mongodb_backend.MongoClient", lambda *args, **kwargs: client))
+        stack.enter_context(APPLICATION_INSTANCE.app_context())
+        for section in ("users", "taxii", "backend"):
+            set_config(APPLICATION_INSTANCE, section, configuration)
+        APPLICATION_INSTANCE.backend_config["run_cleanup_threads"] = False
+        if not APPLICATION_INSTANCE.blueprints:
+            register_blueprints(APPLICATION_INSTANCE)
+        APPLICATION_INSTANCE.medallion_backend = connect_to_backend(
+            get_application_instance_config_values(APPLICATION_INSTANCE, "backend"), clear_db=True,
+        )
+        yield APPLICATION_INSTANCE.test_client()
+
+
+def run(backends=("memory",), sizes=(10000,), versions=1, spec_versions=("2.1",), requests=200,
+        warmup=10, page_size=100, seed=0, mongo_uri=MONGOMOCK_URI, scenarios=None):
+    """
+    Runs the scenarios against each back-end and collection size.
+
+    Returns:
+        the list of results, one per back-end and size
+
+    """
+    results = []
+    for size in sizes:
+        generator = CorpusGenerator(
+            versions=(versions, versions), spec_versions={spec_version: 1 for spec_version in spec_versions}, seed=seed,
+        )
+        object_ids = set()
+
+        def pairs():
+            for obj, entry in generator.objects(size):
+                object_ids.add(obj["id"])
+                yield obj, entry
+
+        with tempfile.TemporaryDirectory() as directory:
+            seed_file = os.path.join(directory, "seed.json")
+            with open(seed_file, "w", encoding="utf-8") as f:
+                write_seed_file(f, pairs(), API_ROOT, COLLECTION_ID)
+            object_ids = sorted(object_ids)
+            for backend in backends:
+                log.info("Benchmarking the %s back-end with %d objects", backend, size)
+                with benchmark_client(backend, seed_file, page_size, mongo_uri) as client:
+                    timings = {}
+                    for name, request in make_scenarios(client, object_ids, page_size, seed):
+                        if scenarios and name not in scenarios:
+                            continue
+                        timings[name] = run_scenario(request, requests, warmup, EXPECTED_RESOURCES.get(name))
+                results.append({
+                    "backend": backend,
+                    "engine": engine(backend, mongo_uri),
+                    "objects": size,
+                    "versions": versions,
+                    "spec_versions": list(spec_versions),
+                    "scenarios": timings,
+                })
+    return results
+
+
+def environment():
+    """Describes where the benchmark ran, to tell result files apart"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+        ).stdout.decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "medallion": __version__,
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": dt.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+
+
+def compare(baseline, results, tolerance=0.1):
+    """
+    Compares results with those of a baseline run, matching the back-end and
+    the engine serving it, the collection and the scenario. Results without an
+    engine, from older runs, are not compared.
+
+    Returns:
+        list of (result key, scenario, baseline p50, p50, ratio) tuples for the
+        scenarios whose median latency grew by more than ``tolerance``
+
+    """
+    def key(result):
+        return result.get("engine"), result["objects"], result["versions"], tuple(result["spec_versions"])
+
+    baseline_results = {key(result): result for result in baseline["results"] if "engine" in result}
+    regressions = []
+    for result in results:
+        before = baseline_results.get(key(result))
+        if before is None:
+            continue
+        for name, timing in result["scenarios"].items():
+            if name not in before["scenarios"]:
+                continue
+            old = before["scenarios"][name]["latency_ms"]["p50"]
+            new = timing["latency_ms"]["p50"]
+            if old and new / old > 1 + tolerance:
+                regressions.append((key(result), name, old, new, new / old))
+    return regressions
+
+
+def _get_argparser():
+    parser = argparse.ArgumentParser(
+        description=inspect.cleandoc(__doc__),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--backend", action="append", choices=("memory", "mongo"),
+        help="Back-end to benchmark, may be repeated (default: memory).",
+    )
+    parser.add_argument(
+        "--objects", default="10000",
+        help="Comma separated numbers of objects of the synthetic collection (default: 10000).",
+    )
+    parser.add_argument("--versions", type=int, default=1, help="Versions of each object (default: 1).")
+    parser.add_argument(
+        "--spec-versions", default="2.1",
+        help="Comma separated STIX spec versions drawn evenly for the objects (default: 2.1).",
+    )
+    parser.add_argument("--requests", type=int, default=200, help="Timed requests per scenario (default: 200).")
+    parser.add_argument("--warmup", type=int, default=10, help="Untimed requests per scenario (default: 10).")
+    parser.add_argument("--page-size", type=int, default=100, help="max_page_size of the server (default: 100).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data (default: 0).")
+    parser.add_argument(
+        "--mongo-uri", default=MONGOMOCK_URI,
+        help="MongoDB server for the mongo back-end, whose databases are replaced (default: mongomock).",
+    )
+    parser.add_argument("--scenario", action="append", help="Only run this scenario, may be repeated.")
+    parser.add_argument("--output", help="File the JSON results are written to (default: standard output).")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare with.")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.1,
+        help="Median latency growth over the compared run reported as a regression (default: 0.1).",
+    )
+    return parser
+
+
+def main():
+    args = _get_argparser().parse_args()
+    logging.getLogger("medallion").setLevel(logging.INFO)
+
+    results = run(
+        backends=args.backend or ("memory",),
+        sizes=[int(size) for size in args.objects.split(",")],
+        versions=args.versions,
+        spec_versions=args.spec_versions.split(","),
+        requests=args.requests,
+        warmup=args.warmup,
+        page_size=args.page_size,
+        seed=args.seed,
+        mongo_uri=args.mongo_uri,
+        scenarios=args.scenario,
+    )
+    report = {"environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        for (engine_name, size, _, _), name, old, new, ratio in regressions:
+            log.warning("%s, %d objects, %s: median %.3f ms -> %.3f ms (x%.2f)", engine_name, size, name, old, new, ratio)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Micro-benchmark of the Accept and Content-Type header checks every request
+goes through, with the parsed header cache and without it.
+
+Run with ``python -m medallion.benchmarks.headers``.
+"""
+import argparse
+import json
+
+from medallion.common import APPLICATION_INSTANCE
+from medallion.views import (
+    parse_taxii_media_type, validate_version_parameter_in_accept_header
+)
+from medallion.views.objects import (
+    validate_version_parameter_in_content_type_header
+)
+
+from . import measure
+
+HEADERS = {
+    "plain": "application/taxii+json;version=2.1",
+    "spaced": "application/taxii+json; version=2.1",
+    "list": "application/json, text/html, application/taxii+json;version=2.1, */*",
+}
+
+
+def run(iterations=100000, repeat=5):
+    results = {}
+    for name, value in HEADERS.items():
+        headers = {"Accept": value, "Content-Type": value}
+        with APPLICATION_INSTANCE.test_request_context(headers=headers):
+            results[name] = {
+                "parse": measure(lambda: parse_taxii_media_type(value), iterations, repeat),
+                "parse_uncached": measure(lambda: parse_taxii_media_type.__wrapped__(value), iterations, repeat),
+                "accept": measure(validate_version_parameter_in_accept_header, iterations, repeat),
+                "content_type": measure(validate_version_parameter_in_content_type_header, iterations, repeat),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=100000, help="Calls per timing.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timings per check.")
+    args = parser.parse_args()
+    print(json.dumps(run(args.iterations, args.repeat), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+"""
+Load generation against a TAXII server, to measure how many clients one
+medallion node sustains.
+
+Each simulated client runs on its own thread and repeatedly picks an action
+according to the configured mix: reading the discovery resource or the list
+of collections, polling the collection for objects added since its previous
+poll (``added_after``, following every page), walking the whole collection a
+page at a time, or adding a bundle of objects. The run goes through stages
+with increasing numbers of clients, and reports the throughput, error rate and
+latency percentiles of each stage, which form the saturation curve of the
+server, and the number of clients beyond which the throughput stopped growing.
+
+The target is either a running server (``--url``) or the application in
+process, loaded with a synthetic collection. Clients share the interpreter of
+the driver, so against a fast server the driver itself may be the limit; run
+several drivers to rule that out.
+"""
+import argparse
+import base64
+import collections
+import datetime as dt
+import http.client
+import inspect
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from ..common import datetime_to_string
+from ..scripts.generate import CorpusGenerator, parse_weights, write_seed_file
+from ..views import MEDIA_TYPE_TAXII_V21
+from .endpoints import (
+    API_ROOT, COLLECTION_ID, MONGOMOCK_URI, PASSWORD, USERNAME,
+    benchmark_client, environment, percentile
+)
+
+log = logging.getLogger(__name__)
+
+ACTIONS = ("discovery", "collections", "poll", "page", "add")
+DEFAULT_MIX = {"discovery": 1, "collections": 1, "poll": 4, "page": 3, "add": 1}
+
+Reply = collections.namedtuple("Reply", ("status", "headers", "json"))
+
+
+class HTTPTransport(object):
+    """Sends requests to a running server, over one keep-alive connection per client thread"""
+
+    def __init__(self, url, username, password, timeout=30):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError("Unsupported URL scheme {!r}".format(parts.scheme))
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        token = base64.b64encode("{}:{}".format(username, password).encode("utf-8")).decode("ascii")
+        self.headers = {"Accept": MEDIA_TYPE_TAXII_V21, "Authorization": "Basic " + token}
+        self.local = threading.local()
+
+    def request(self, method, path, body=None):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.local.connection = self.connection_class(self.netloc, timeout=self.timeout)
+        headers = dict(self.headers)
+        if body is not None:
+            headers["Content-Type"] = MEDIA_TYPE_TAXII_V21
+        try:
+            connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+        except Exception:
+            # the connection is in an unknown state, the next request opens another one
+            connection.close()
+            self.local.connection = None
+            raise
+        try:
+            content = json.loads(data) if data else None
+        except ValueError:
+            content = None
+        return Reply(response.status, response.headers, content)
+
+
+class AppTransport(object):
+    """Sends requests to the application in process, through one test client per client thread"""
+
+    def __init__(self, app):
+        self.app = app
+        token = base64.b64encode("{}:{}".format(USERNAME, PASSWORD).encode("utf-8")).decode("ascii")
+        self.headers = {"Accept": MEDIA_TYPE_TAXII_V21, "Authorization": "Basic " + token}
+        self.local = threading.local()
+
+    def request(self, method, path, body=None):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        headers = dict(self.headers)
+        if body is not None:
+            headers["Content-Type"] = MEDIA_TYPE_TAXII_V21
+        response = client.open(path, method=method, data=body, headers=headers)
+        return Reply(response.status_code, response.headers, response.get_json(silent=True))
+
+
+def resolve_target(transport, api_root=None, collection_id=None):
+    """
+    Returns the path of the api root and the collection the clients use,
+    defaulting to the default api root of the server and to its first
+    collection which can be read and written.
+    """
+    if api_root is None:
+        discovery = transport.request("GET", "/taxii2/")
+        if discovery.status != 200 or not discovery.json:
+            raise RuntimeError("Discovery failed with status {}".format(discovery.status))
+        url = discovery.json.get("default") or next(iter(discovery.json.get("api_roots", [])), None)
+        if url is None:
+            raise RuntimeError("The server has no api root")
+        api_root = urllib.parse.urlsplit(url).path
+    api_root = "/{}/".format(api_root.strip("/"))
+    if collection_id is None:
+        collections_ = transport.request("GET", api_root + "collections/")
+        if collections_.status != 200 or not collections_.json:
+            raise RuntimeError("Get Collections failed with status {}".format(collections_.status))
+        collection_id = next(
+            (c["id"] for c in collections_.json.get("collections", []) if c.get("can_read") and c.get("can_write")), None,
+        )
+        if collection_id is None:
+            raise RuntimeError("The api root has no collection which can be read and written")
+    return api_root, collection_id
+
+
+class SimulatedClient(object):
+    """
+    One TAXII client. Its random choices come from its own seeded generator,
+    and the objects it adds from its own synthetic corpus, so runs with the
+    same settings send the same requests.
+    """
+
+    def __init__(self, number, transport, api_root, collection_id, mix, page_size=100, bundle_size=10,
+                 think_time=0.0, seed=0):
+        self.transport = transport
+        self.api_root = api_root
+        self.collection = "{}collections/{}/".format(api_root, collection_id)
+        self.actions, self.weights = zip(*mix.items())
+        self.page_size = page_size
+        self.bundle_size = bundle_size
+        self.think_time = think_time
+        self.rng = random.Random("{}-{}".format(seed, number))
+        self.new_objects = (obj for obj, _ in CorpusGenerator(seed="{}-{}-objects".format(seed, number)).objects(sys.maxsize))
+        # pollers start caught up, and only see the objects added while they run
+        self.added_after = datetime_to_string(dt.datetime.utcnow())
+        self.next_page = None
+        self.records = []
+
+    def _send(self, action, method, path, body=None):
+        """Sends a request and records its outcome, returns the reply or None on errors"""
+        start = time.perf_counter()
+        try:
+            reply = self.transport.request(method, path, body)
+        except Exception as e:
+            self.records.append((action, time.perf_counter() - start, type(e).__name__))
+            return None
+        error = str(reply.status) if reply.status >= 400 else None
+        self.records.append((action, time.perf_counter() - start, error))
+        return None if error else reply
+
+    def discovery(self):
+        self._send("discovery", "GET", "/taxii2/")
+
+    def collections(self):
+        self._send("collections", "GET", self.api_root + "collections/")
+
+    def poll(self):
+        path = "{}objects/?added_after={}&limit={}".format(self.collection, self.added_after, self.page_size)
+        next_id = None
+        while True:
+            reply = self._send("poll", "GET", path + ("&next=" + next_id if next_id else ""))
+            if reply is None:
+                return
+            self.added_after = reply.headers.get("X-TAXII-Date-Added-Last", self.added_after)
+            next_id = reply.json.get("next") if reply.json and reply.json.get("more") else None
+            if not next_id:
+                return
+
+    def page(self):
+        path = "{}objects/?limit={}".format(self.collection, self.page_size)
+        reply = self._send("page", "GET", path + ("&next=" + self.next_page if self.next_page else ""))
+        # starts over after the last page, or when the page could not be read
+        self.next_page = reply.json.get("next") if reply and reply.json and reply.json.get("more") else None
+
+    def add(self):
+        bundle = {"objects": list(itertools.islice(self.new_objects, self.bundle_size))}
+        self._send("add", "POST", self.collection + "objects/", json.dumps(bundle))
+
+    def run(self, stop):
+        while not stop.is_set():
+            getattr(self, self.rng.choices(self.actions, self.weights)[0])()
+            if self.think_time > 0:
+                stop.wait(self.rng.expovariate(1 / self.think_time))
+
+
+def summarize_records(records, elapsed):
+    """Throughput, error rate and latency percentiles of (action, seconds, error) records"""
+    latencies = sorted(seconds for _, seconds, _ in records)
+    errors = collections.Counter(error for _, _, error in records if error)
+    summary = {
+        "requests": len(records),
+        "errors": sum(errors.values()),
+        "error_rate": sum(errors.values()) / len(records) if records else 0.0,
+        "error_kinds": dict(errors),
+        "throughput": len(records) / elapsed if elapsed else None,
+    }
+    if latencies:
+        summary["latency_ms"] = {
+            "mean": sum(latencies) / len(latencies) * 1000,
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p90": percentile(latencies, 0.90) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "max": latencies[-1] * 1000,
+        }
+    return summary
+
+
+def run_stage(transport, api_root, collection_id, clients, duration, mix, page_size=100, bundle_size=10,
+              think_time=0.0, seed=0):
+    """Runs ``clients`` simulated clients for ``duration`` seconds and summarizes their requests"""
+    simulated = [
+        SimulatedClient(number, transport, api_root, collection_id, mix, page_size, bundle_size, think_time, seed)
+        for number in range(clients)
+    ]
+    stop = threading.Event()
+    threads = [threading.Thread(target=client.run, args=(stop,), daemon=True) for client in simulated]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    stop.wait(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    records = [record for client in simulated for record in client.records]
+    stage = summarize_records(records, elapsed)
+    stage["clients"] = clients
+    stage["actions"] = {
+        action: summarize_records([record for record in records if record[0] == action], elapsed)
+        for action in mix if any(record[0] == action for record in records)
+    }
+    return stage
+
+
+def saturation(stages, growth=0.1, max_error_rate=0.01):
+    """
+    Returns the number of clients of the last stage before the throughput
+    grew by less than ``growth`` or the error rate went over
+    ``max_error_rate``, or None if every stage scaled.
+    """
+    for before, stage in zip(stages, stages[1:]):
+        if stage["error_rate"] > max_error_rate or stage["throughput"] < before["throughput"] * (1 + growth):
+            return before["clients"]
+    return None
+
+
+def run(transport, api_root, collection_id, clients=(1, 2, 4, 8), duration=10.0, mix=None, page_size=100,
+        bundle_size=10, think_time=0.0, seed=0):
+    """
+    Runs a stage for each number of clients.
+
+    Returns:
+        the list of stages, the saturation curve
+
+    """
+    stages = []
+    for count in clients:
+        log.info("Running %d clients for %.1f seconds", count, duration)
+        stage = run_stage(
+            transport, api_root, collection_id, count, duration, mix or DEFAULT_MIX, page_size, bundle_size,
+            think_time, seed,
+        )
+        log.info(
+            "%d clients: %.1f requests/s, %.2f%% errors, median %.1f ms, p99 %.1f ms", count, stage["throughput"],
+            stage["error_rate"] * 100, stage.get("latency_ms", {}).get("p50", 0), stage.get("latency_ms", {}).get("p99", 0),
+        )
+        stages.append(stage)
+    return stages
+
+
+def _get_argparser():
+    parser = argparse.ArgumentParser(
+        description=inspect.cleandoc(__doc__),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--url", help="Base URL of a running server (default: the application in process).")
+    parser.add_argument("--username", help="User name for a running server.")
+    parser.add_argument("--password", help="Password for a running server.")
+    parser.add_argument("--timeout", type=float, default=30, help="Timeout of the requests to a running server (default: 30).")
+    parser.add_argument("--api-root", help="Name of the api root (default: the default api root of the server).")
+    parser.add_argument("--collection", help="Id of the collection (default: the first one which can be read and written).")
+    parser.add_argument(
+        "--backend", default="memory", choices=("memory", "mongo"),
+        help="Back-end of the application in process (default: memory).",
+    )
+    parser.add_argument(
+        "--objects", type=int, default=1000,
+        help="Objects of the synthetic collection of the application in process (default: 1000).",
+    )
+    parser.add_argument(
+        "--mongo-uri", default=MONGOMOCK_URI,
+        help="MongoDB server of the mongo back-end in process, whose databases are replaced (default: mongomock).",
+    )
+    parser.add_argument(
+        "--clients", default="1,2,4,8,16",
+        help="Comma separated numbers of simulated clients, one stage each (default: 1,2,4,8,16).",
+    )
+    parser.add_argument("--duration", type=float, default=10, help="Seconds each stage runs (default: 10).")
+    parser.add_argument(
+        "--mix", type=parse_weights, default=DEFAULT_MIX,
+        help="Relative weights of the client actions, as action=weight pairs separated by commas, among {} (default: {}).".format(
+            ", ".join(ACTIONS), ",".join("{}={}".format(k, v) for k, v in DEFAULT_MIX.items()),
+        ),
+    )
+    parser.add_argument("--page-size", type=int, default=100, help="limit of the object listings (default: 100).")
+    parser.add_argument("--bundle-size", type=int, default=10, help="Objects added by each POST (default: 10).")
+    parser.add_argument(
+        "--think-time", type=float, default=0,
+        help="Mean seconds a client waits between actions, 0 to send requests back to back (default: 0).",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the client choices and objects (default: 0).")
+    parser.add_argument(
+        "--growth", type=float, default=0.1,
+        help="Throughput growth between stages below which the server is reported saturated (default: 0.1).",
+    )
+    parser.add_argument(
+        "--max-error-rate", type=float, default=0.01,
+        help="Error rate above which the server is reported saturated (default: 0.01).",
+    )
+    parser.add_argument("--output", help="File the JSON results are written to (default: standard output).")
+    return parser
+
+
+def main():
+    parser = _get_argparser()
+    args = parser.parse_args()
+    unknown = set(args.mix) - set(ACTIONS)
+    if unknown:
+        parser.error("unknown actions in --mix: {}".format(", ".join(sorted(unknown))))
+    if args.url and (args.username is None or args.password is None):
+        parser.error("--username and --password are needed with --url")
+    logging.getLogger("medallion").setLevel(logging.INFO)
+
+    settings = {
+        key: getattr(args, key)
+        for key in ("url", "duration", "mix", "page_size", "bundle_size", "think_time", "seed")
+    }
+    clients = [int(count) for count in args.clients.split(",")]
+    if args.url:
+        transport = HTTPTransport(args.url, args.username, args.password, args.timeout)
+        api_root, collection_id = resolve_target(transport, args.api_root, args.collection)
+        stages = run(
+            transport, api_root, collection_id, clients, args.duration, args.mix, args.page_size, args.bundle_size,
+            args.think_time, args.seed,
+        )
+    else:
+        settings.update(backend=args.backend, objects=args.objects)
+        with tempfile.TemporaryDirectory() as directory:
+            seed_file = os.path.join(directory, "seed.json")
+            with open(seed_file, "w", encoding="utf-8") as f:
+                write_seed_file(f, CorpusGenerator(seed=args.seed).objects(args.objects), API_ROOT, COLLECTION_ID)
+            with benchmark_client(args.backend, seed_file, args.page_size, args.mongo_uri) as client:
+                stages = run(
+                    AppTransport(client.application), "/{}/".format(API_ROOT), COLLECTION_ID, clients, args.duration,
+                    args.mix, args.page_size, args.bundle_size, args.think_time, args.seed,
+                )
+
+    report = {
+        "environment": environment(),
+        "settings": settings,
+        "stages": stages,
+        "saturation": saturation(stages, args.growth, args.max_error_rate),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,18 @@
 import calendar
+import concurrent.futures
 import datetime as dt
+import functools
+import heapq
+import inspect
+import itertools
+import json
+import logging
+import random
+import sys
 import threading
+import time
 import uuid
+import weakref
 
 from flask import Flask
 import pytz
@@ -9,6 +20,9 @@ from six import iteritems
 
 APPLICATION_INSTANCE = Flask("medallion")
 
+# Module-level logger
+log = logging.getLogger(__name__)
+
 
 def create_resource(resource_name, items, more=False, next_id=None):
     """Generates a Resource Object given a resource name."""
@@ -153,8 +167,10 @@ def float_to_datetime(timestamp_float):
     return dt.datetime.utcfromtimestamp(timestamp_float)
 
 
+@functools.lru_cache(maxsize=2 ** 16)
 def string_to_datetime(timestamp_string):
-    """Convert string timestamp to datetime instance."""
+    """Convert string timestamp to datetime instance. Results are cached since
+    the same version and date_added strings are parsed on every filter pass."""
     try:
         return dt.datetime.strptime(timestamp_string, "%Y-%m-%dT%H:%M:%S.%fZ")
     except ValueError:
@@ -233,7 +249,9 @@ def find_att(obj):
         string value of the field from the object to use for versioning
 
     """
-    if "version" in obj:
+    if isinstance(obj, ManifestRecord):
+        return _version_datetime(obj.version)
+    elif "version" in obj:
         return string_to_datetime(obj["version"])
     elif "modified" in obj:
         return string_to_datetime(obj["modified"])
@@ -243,6 +261,76 @@ def find_att(obj):
         return string_to_datetime(obj["_date_added"])
 
 
+@functools.lru_cache(maxsize=2 ** 16)
+def _version_datetime(version):
+    """Cached ``float_to_datetime`` of the versions of manifest records, compared on every filter pass"""
+    return float_to_datetime(version)
+
+
+def date_added_to_float(entry):
+    """Return the date_added of a manifest entry (dict or ManifestRecord) as a float"""
+    if isinstance(entry, ManifestRecord):
+        return entry.date_added
+    return datetime_to_float(string_to_datetime(entry["date_added"]))
+
+
+class ManifestRecord(object):
+    """
+    Compact in-memory form of a manifest entry.
+
+    Timestamps are held as floats and the media type string is interned, so
+    large manifests do not repeat the same strings or re-parse timestamps. The
+    TAXII representation is produced by ``to_dict()`` when building responses.
+    Item access (``record["date_added"]``) is supported so records can be used
+    wherever a manifest dict is expected.
+    """
+    __slots__ = ("id", "date_added", "version", "media_type")
+
+    def __init__(self, id, date_added, version, media_type):
+        self.id = id
+        self.date_added = date_added
+        self.version = version
+        self.media_type = sys.intern(media_type)
+
+    @classmethod
+    def from_dict(cls, entry):
+        return cls(
+            entry["id"],
+            datetime_to_float(string_to_datetime(entry["date_added"])),
+            datetime_to_float(string_to_datetime(entry["version"])),
+            entry["media_type"],
+        )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "date_added": self["date_added"],
+            "version": self["version"],
+            "media_type": self.media_type,
+        }
+
+    def __getitem__(self, key):
+        if key == "date_added":
+            return datetime_to_string(float_to_datetime(self.date_added))
+        elif key == "version":
+            return datetime_to_string_stix(float_to_datetime(self.version))
+        elif key in self.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return "ManifestRecord({!r})".format(self.to_dict())
+
+
 def find_version_attribute(obj):
     """Depending on the object, modified, created or _date_added is used to store the
     object version"""
@@ -254,23 +342,334 @@ def find_version_attribute(obj):
         return "_date_added"
 
 
+class ScheduledJob(object):
+    """
+    A periodic job of a ``MaintenanceScheduler``, with the timing of its runs.
+    Bound methods are held through a weak reference, so scheduling a job does
+    not keep its object alive; the job is dropped once the object is gone.
+    """
+
+    def __init__(self, name, interval, target):
+        self.name = name
+        self.interval = interval
+        if inspect.ismethod(target):
+            self._target = weakref.WeakMethod(target)
+        else:
+            self._target = lambda: target
+        self.cancelled = False
+        self.runs = 0
+        self.failures = 0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+        self.last_duration = None
+
+    @property
+    def target(self):
+        return self._target()
+
+    def run(self, target):
+        start = time.perf_counter()
+        try:
+            target()
+        except Exception:
+            self.failures += 1
+            log.exception("Maintenance job %s failed", self.name)
+        finally:
+            duration = time.perf_counter() - start
+            self.runs += 1
+            self.total_duration += duration
+            self.max_duration = max(self.max_duration, duration)
+            self.last_duration = duration
+
+    def metrics(self):
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "total_duration": self.total_duration,
+            "max_duration": self.max_duration,
+            "last_duration": self.last_duration,
+        }
+
+
+class MaintenanceScheduler(object):
+    """
+    Runs periodic maintenance jobs, such as the session and status cleanup of
+    the backends, from a single scheduler thread. Each run is delayed by the job
+    interval, randomly stretched or shortened by up to ``jitter`` of it so jobs
+    of different backends and processes do not fire in lockstep, and a job is
+    only rescheduled once its run has finished.
+
+    With ``workers`` set to 0 the jobs run one after the other in the scheduler
+    thread itself; otherwise they are handed to a pool of that many threads.
+    """
+
+    def __init__(self, jitter=0.1, workers=0):
+        self.jitter = jitter
+        self.workers = workers
+        self._queue = []
+        # every job scheduled and not dropped yet, including those running
+        self._scheduled = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._executor = None
+        self._stopping = False
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def jobs(self):
+        with self._condition:
+            return [job for job in self._scheduled if not job.cancelled]
+
+    def metrics(self):
+        """Returns the run counts and durations of the scheduled jobs"""
+        return [job.metrics() for job in self.jobs]
+
+    def configure(self, jitter=None, workers=None):
+        """Changes the jitter and number of workers, restarting the scheduler if needed"""
+        if jitter is not None:
+            self.jitter = jitter
+        if workers is not None and workers != self.workers:
+            self.workers = workers
+            if self.running:
+                self.stop()
+                self.start()
+
+    def schedule(self, interval, target, name=None):
+        """Runs ``target`` every ``interval`` seconds, returns the ScheduledJob"""
+        job = ScheduledJob(name or getattr(target, "__qualname__", repr(target)), interval, target)
+        with self._condition:
+            self._scheduled[job] = None
+        self._push(job)
+        return job
+
+    def cancel(self, job):
+        # the job is dropped from the queue when it comes up
+        job.cancelled = True
+
+    def start(self):
+        with self._condition:
+            if self.running:
+                return
+            self._stopping = False
+            if self.workers:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="medallion-maintenance",
+                )
+            self._thread = threading.Thread(target=self._run, name="medallion-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stops the scheduler thread, the jobs stay scheduled for the next start"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _push(self, job):
+        delay = job.interval * (1 + random.uniform(-self.jitter, self.jitter))
+        with self._condition:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._counter), job))
+            self._condition.notify_all()
+
+    def _next_job(self):
+        with self._condition:
+            while not self._stopping:
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+                delay = self._queue[0][0] - time.monotonic()
+                if delay <= 0:
+                    return heapq.heappop(self._queue)[2]
+                self._condition.wait(delay)
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            target = job.target
+            if job.cancelled or target is None:
+                self._drop(job)
+                continue
+            if self._executor is not None:
+                self._executor.submit(self._execute, job, target)
+            else:
+                self._execute(job, target)
+            # do not keep the target alive while waiting for the next job
+            del target
+
+    def _execute(self, job, target):
+        job.run(target)
+        if job.cancelled:
+            self._drop(job)
+        else:
+            self._push(job)
+
+    def _drop(self, job):
+        with self._condition:
+            self._scheduled.pop(job, None)
+
+
+# The scheduler shared by all the backends of the process
+MAINTENANCE_SCHEDULER = MaintenanceScheduler()
+
+
 class TaskChecker(object):
-    """Calls a target method every X seconds to perform a task."""
+    """Calls a target method every X seconds to perform a task, using the shared maintenance scheduler."""
 
     def __init__(self, interval, target_function):
         self.interval = interval
         self.target_function = target_function
-        self.thread = threading.Timer(interval=self.interval, function=self.handle_function)
-        self.thread.daemon = True
-
-    def handle_function(self):
-        self.target_function()
-        self.thread = threading.Timer(interval=self.interval, function=self.handle_function)
-        self.thread.daemon = True
-        self.thread.start()
+        self.job = None
 
     def start(self):
-        self.thread.start()
+        self.job = MAINTENANCE_SCHEDULER.schedule(self.interval, self.target_function)
+        MAINTENANCE_SCHEDULER.start()
+
+    def stop(self):
+        if self.job is not None:
+            MAINTENANCE_SCHEDULER.cancel(self.job)
+
+
+class ExpiryHeap(object):
+    """
+    Min-heap of (timestamp, item) pairs, so the items older than a boundary are
+    found without looking at the younger ones.
+    """
+
+    def __init__(self):
+        self.heap = []
+        # tie breaker, so items themselves are never compared
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, timestamp, item):
+        heapq.heappush(self.heap, (timestamp, next(self.counter), item))
+
+    def pop_older_than(self, boundary):
+        """Removes and yields the (timestamp, item) pairs with a timestamp before ``boundary``"""
+        while self.heap and self.heap[0][0] < boundary:
+            timestamp, _, item = heapq.heappop(self.heap)
+            yield timestamp, item
+
+
+class JSONStreamReader(object):
+    """
+    Reads a JSON document from a text file a chunk at a time, so large seed
+    files and bundles are walked without being loaded whole. ``members`` and
+    ``items`` step through an object or array at the current position; the
+    caller reads each member or item with ``value`` (or walks into it) or
+    passes over it with ``skip`` before asking for the next one.
+    """
+
+    WHITESPACE = " \t\n\r"
+    DELIMITERS = WHITESPACE + ",:]}"
+    DECODER = json.JSONDecoder()
+
+    def __init__(self, infile, chunk_size=64 * 1024):
+        self.infile = infile
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+
+    def _fill(self):
+        # chunks grow with the value being decoded, which keeps decoding a
+        # value larger than a chunk linear
+        chunk = self.infile.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Returns the next character which is not whitespace, an empty string at the end of the file"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError("Expected {!r} in the JSON document, found {!r}".format(char, found or "the end of the file"))
+        self.pos += 1
+
+    def value(self):
+        """Decodes the complete value at the current position"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.DECODER.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number cut by the end of the buffer may go on in the next chunk
+            if (end < len(self.buffer) and self.buffer[end] in self.DELIMITERS) or not self._fill():
+                self.pos = end
+                return value
+
+    def skip(self):
+        """Passes over the value at the current position, without decoding its containers whole"""
+        char = self.peek()
+        if char == "{":
+            for _ in self.members():
+                self.skip()
+        elif char == "[":
+            for _ in self.items():
+                self.skip()
+        else:
+            self.value()
+
+    def members(self):
+        """Yields the names of the members of the object at the current position"""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            name = self.value()
+            self.expect(":")
+            yield name
+            if self.peek() != ",":
+                self.expect("}")
+                return
+            self.pos += 1
+
+    def items(self):
+        """Yields the positions of the items of the array at the current position"""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        for position in itertools.count():
+            yield position
+            if self.peek() != ",":
+                self.expect("]")
+                return
+            self.pos += 1
+
+    def values(self):
+        """Yields the decoded items of the array at the current position"""
+        for _ in self.items():
+            yield self.value()
 
 
 def get_application_instance_config_values(flask_application_instance, config_group, config_key=None):
@@ -64,6 +64,12 @@ class _LazyJSONDumper(object):
 @environ.config(prefix="TAXII")
 class TAXIIConfig(object):
     max_page_size = environ.var(None, converter=lambda i: int(i) if i else i)
+    max_change_feed_wait = environ.var(None, converter=lambda i: float(i) if i else i)
+    max_bulk_size = environ.var(None, converter=lambda i: int(i) if i else i)
+    credential_cache_ttl = environ.var(None, converter=lambda i: float(i) if i else i)
+    credential_cache_size = environ.var(None, converter=lambda i: int(i) if i else i)
+    server_timing = environ.var(None, converter=lambda i: i.strip().lower() in ("1", "true", "yes") if i else i)
+    metrics = environ.var(None, converter=lambda i: i.strip().lower() in ("1", "true", "yes") if i else i)
 
 
 @environ.config(prefix="MEDALLION")
@@ -0,0 +1,136 @@
+import collections
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+from werkzeug.security import check_password_hash
+
+from .exceptions import InitializationError
+
+try:
+    import bcrypt
+except ImportError:
+    bcrypt = None
+
+try:
+    import argon2
+    import argon2.exceptions
+except ImportError:
+    argon2 = None
+
+# Prefixes of the hashes made by werkzeug.security.generate_password_hash
+WERKZEUG_HASH_PREFIXES = ("pbkdf2:", "scrypt:")
+BCRYPT_HASH_PREFIXES = ("$2a$", "$2b$", "$2y$")
+ARGON2_HASH_PREFIXES = ("$argon2",)
+
+
+def is_password_hash(credential):
+    """Tells whether a credential of the users configuration is a password hash"""
+    return credential.startswith(WERKZEUG_HASH_PREFIXES + BCRYPT_HASH_PREFIXES + ARGON2_HASH_PREFIXES)
+
+
+def check_credentials(users):
+    """
+    Checks that every password hash of the users configuration can be
+    verified, as bcrypt and argon2 hashes need their optional packages.
+    """
+    for username, credential in users.items():
+        if credential.startswith(BCRYPT_HASH_PREFIXES) and bcrypt is None:
+            raise InitializationError(
+                "The password of user '{}' is a bcrypt hash, which needs the bcrypt package".format(username), 408,
+            )
+        if credential.startswith(ARGON2_HASH_PREFIXES) and argon2 is None:
+            raise InitializationError(
+                "The password of user '{}' is an argon2 hash, which needs the argon2-cffi package".format(username), 408,
+            )
+
+
+def check_password(credential, password):
+    """
+    Verifies a password against a credential of the users configuration,
+    either a password hash or a plaintext password.
+    """
+    if credential.startswith(WERKZEUG_HASH_PREFIXES):
+        return check_password_hash(credential, password)
+    if credential.startswith(BCRYPT_HASH_PREFIXES):
+        try:
+            return bcrypt.checkpw(password.encode("utf-8"), credential.encode("utf-8"))
+        except ValueError:
+            return False
+    if credential.startswith(ARGON2_HASH_PREFIXES):
+        try:
+            return argon2.PasswordHasher().verify(credential, password)
+        except argon2.exceptions.Argon2Error:
+            return False
+    return hmac.compare_digest(credential.encode("utf-8"), password.encode("utf-8"))
+
+
+class VerificationCache(object):
+    """
+    Bounded cache of the successful password hash verifications, so a client
+    sending the same credentials with every request costs one (deliberately
+    slow) hash verification per ``ttl`` seconds instead of one per request.
+
+    Entries are keyed by the user name and an HMAC of the configured hash and
+    the password under a key drawn when the process starts, so neither the
+    password nor a fast hash of it is kept, and changing the configured hash
+    of a user invalidates its entries. Failed verifications are never cached,
+    and plaintext credentials are compared directly. The least recently used
+    entries are dropped beyond ``size`` entries; a ``ttl`` or ``size`` of 0
+    disables the cache.
+    """
+
+    def __init__(self, ttl=60, size=1024):
+        self.ttl = ttl
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self._key = os.urandom(32)
+
+    def configure(self, ttl=None, size=None):
+        """Changes the settings given, and drops the entries"""
+        with self.lock:
+            if ttl is not None:
+                self.ttl = ttl
+            if size is not None:
+                self.size = size
+            self.entries.clear()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def _digest(self, credential, password):
+        message = credential.encode("utf-8") + b"\0" + password.encode("utf-8")
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def verify(self, username, password, credential):
+        """Verifies the password of a user against its configured credential"""
+        if not is_password_hash(credential):
+            return check_password(credential, password)
+        if self.ttl <= 0 or self.size <= 0:
+            return check_password(credential, password)
+
+        key = (username, self._digest(credential, password))
+        now = time.monotonic()
+        with self.lock:
+            expiry = self.entries.get(key)
+            if expiry is not None:
+                if expiry > now:
+                    self.entries.move_to_end(key)
+                    return True
+                del self.entries[key]
+
+        if not check_password(credential, password):
+            return False
+        with self.lock:
+            self.entries[key] = now + self.ttl
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return True
+
+
+CREDENTIAL_CACHE = VerificationCache()
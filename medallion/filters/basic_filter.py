@@ -1,19 +1,50 @@
 import bisect
 import operator
 
-from ..common import determine_spec_version, find_att, string_to_datetime
+from ..common import (
+    ManifestRecord, date_added_to_float, datetime_to_float,
+    determine_spec_version, find_att, string_to_datetime
+)
+
+
+def object_id(obj):
+    """Id of an object or manifest entry, read without the item access of ManifestRecord"""
+    if isinstance(obj, ManifestRecord):
+        return obj.id
+    return obj["id"]
+
+
+def spec_version_of(obj):
+    """STIX spec version of an object, or of the object a manifest entry describes"""
+    if isinstance(obj, ManifestRecord):
+        return obj.media_type.split("version=")[1]
+    if "media_type" in obj:
+        return obj["media_type"].split("version=")[1]
+    return determine_spec_version(obj)
+
+
+def highest_spec_versions(data):
+    """Highest spec version of each id in data"""
+    highest = {}
+    for obj in data:
+        spec_version = spec_version_of(obj)
+        obj_id = object_id(obj)
+        if spec_version > highest.get(obj_id, ""):
+            highest[obj_id] = spec_version
+    return highest
 
 
 def check_for_dupes(final_match, final_track, res):
     for obj in res:
         found = 0
-        pos = bisect.bisect_left(final_track, obj["id"])
-        if not final_match or pos > len(final_track) - 1 or final_track[pos] != obj["id"]:
-            final_track.insert(pos, obj["id"])
+        obj_id = object_id(obj)
+        pos = bisect.bisect_left(final_track, obj_id)
+        if not final_match or pos > len(final_track) - 1 or final_track[pos] != obj_id:
+            final_track.insert(pos, obj_id)
             final_match.insert(pos, obj)
         else:
             obj_time = find_att(obj)
-            while pos != len(final_track) and obj["id"] == final_track[pos]:
+            while pos != len(final_track) and obj_id == final_track[pos]:
                 if find_att(final_match[pos]) == obj_time:
                     found = 1
                     break
@@ -22,7 +53,7 @@ def check_for_dupes(final_match, final_track, res):
             if found == 1:
                 continue
             else:
-                final_track.insert(pos, obj["id"])
+                final_track.insert(pos, obj_id)
                 final_match.insert(pos, obj)
 
 
@@ -30,9 +61,10 @@ def check_version(data, relate):
     id_track = []
     res = []
     for obj in data:
-        pos = bisect.bisect_left(id_track, obj["id"])
-        if not res or pos >= len(id_track) or id_track[pos] != obj["id"]:
-            id_track.insert(pos, obj["id"])
+        obj_id = object_id(obj)
+        pos = bisect.bisect_left(id_track, obj_id)
+        if not res or pos >= len(id_track) or id_track[pos] != obj_id:
+            id_track.insert(pos, obj_id)
             res.insert(pos, obj)
         else:
             if relate(find_att(obj), find_att(res[pos])):
@@ -63,26 +95,28 @@ class BasicFilter(object):
         if len(data) == 0:
             return new, next_save, headers
         if manifest:
-            manifest.sort(key=lambda x: x['date_added'])
+            # the backend keeps manifests in ingest order, no sort is needed.
+            # The first object of each version is looked up once, rather than
+            # scanning the objects for every manifest entry
+            by_version = {}
+            for check in data:
+                by_version.setdefault((object_id(check), find_att(check)), check)
             for man in manifest:
-                man_time = find_att(man)
-                for check in data:
-                    check_time = find_att(check)
-                    if check['id'] == man['id'] and check_time == man_time:
-                        if len(headers) == 0:
-                            headers["X-TAXII-Date-Added-First"] = man["date_added"]
-                        new.append(check)
-                        temp = man
-                        if len(new) == limit:
-                            headers["X-TAXII-Date-Added-Last"] = man["date_added"]
-                        break
+                check = by_version.get((object_id(man), find_att(man)))
+                if check is not None:
+                    if len(headers) == 0:
+                        headers["X-TAXII-Date-Added-First"] = man["date_added"]
+                    new.append(check)
+                    temp = man
+                    if len(new) == limit:
+                        headers["X-TAXII-Date-Added-Last"] = man["date_added"]
             if limit and limit < len(data):
                 next_save = new[limit:]
                 new = new[:limit]
             else:
                 headers["X-TAXII-Date-Added-Last"] = temp["date_added"]
         else:
-            data.sort(key=lambda x: x['date_added'])
+            data = sorted(data, key=date_added_to_float)
             if limit and limit < len(data):
                 next_save = data[limit:]
                 data = data[:limit]
@@ -92,21 +126,26 @@ class BasicFilter(object):
         return new, next_save, headers
 
     @staticmethod
-    def check_added_after(obj, manifest_info, added_after_date):
-        added_after_timestamp = string_to_datetime(added_after_date)
+    def versions_added_after(manifest_info, added_after_date):
+        """(id, version) of the manifest entries added after added_after_date"""
+        added_after_timestamp = datetime_to_float(string_to_datetime(added_after_date))
+        return {
+            (object_id(item), find_att(item))
+            for item in manifest_info
+            if date_added_to_float(item) > added_after_timestamp
+        }
+
+    @staticmethod
+    def check_added_after(obj, added_versions, added_after_date):
         # for manifest objects and versions
-        if manifest_info is None:
-            if string_to_datetime(obj["date_added"]) > added_after_timestamp:
+        if added_versions is None:
+            added_after_timestamp = datetime_to_float(string_to_datetime(added_after_date))
+            if date_added_to_float(obj) > added_after_timestamp:
                 return True
             return False
-        # for other objects with manifests
+        # for other objects with manifests, see versions_added_after
         else:
-            obj_time = find_att(obj)
-            for item in manifest_info:
-                item_time = find_att(item)
-                if item["id"] == obj["id"] and item_time == obj_time and string_to_datetime(item["date_added"]) > added_after_timestamp:
-                    return True
-            return False
+            return (object_id(obj), find_att(obj)) in added_versions
 
     @staticmethod
     def filter_by_version(data, version):
@@ -132,8 +171,9 @@ class BasicFilter(object):
             for obj in data:
                 obj_time = find_att(obj)
                 if obj_time in actual_dates:
-                    pos = bisect.bisect_left(id_track, obj["id"])
-                    id_track.insert(pos, obj["id"])
+                    obj_id = object_id(obj)
+                    pos = bisect.bisect_left(id_track, obj_id)
+                    id_track.insert(pos, obj_id)
                     res.insert(pos, obj)
             final_match = res
             final_track = id_track
@@ -149,29 +189,15 @@ class BasicFilter(object):
         return final_match
 
     @staticmethod
-    def check_by_spec_version(obj, spec_, data):
+    def check_by_spec_version(obj, spec_, highest):
+        """
+        Without spec_, keeps the objects at the highest spec version of their
+        id, as given by ``highest_spec_versions`` of the data
+        """
+        spec_version = spec_version_of(obj)
         if spec_:
-            if "media_type" in obj:
-                if any(s == obj["media_type"].split("version=")[1] for s in spec_):
-                    return True
-            elif any(s == determine_spec_version(obj) for s in spec_):
-                return True
-        else:
-            add = True
-            if "media_type" in obj:
-                s1 = obj["media_type"].split("version=")[1]
-            else:
-                s1 = determine_spec_version(obj)
-            for match in data:
-                if "media_type" in match:
-                    s2 = match["media_type"].split("version=")[1]
-                else:
-                    s2 = determine_spec_version(match)
-                if obj["id"] == match["id"] and s2 > s1:
-                    add = False
-            if add:
-                return True
-        return False
+            return any(s == spec_version for s in spec_)
+        return spec_version >= highest[object_id(obj)]
 
     def process_filter(self, data, allowed=(), manifest_info=(), limit=None):
         filtered_by_version = []
@@ -181,20 +207,28 @@ class BasicFilter(object):
         match_objects = []
         if (self.match_type and "type" in allowed) or (self.match_id and "id" in allowed) \
            or (self.added_after_date) or ("spec_version" in allowed):
+            added_versions = None
+            if self.added_after_date and manifest_info is not None:
+                added_versions = self.versions_added_after(manifest_info, self.added_after_date)
+            highest = None
+            if "spec_version" in allowed and not self.match_spec_version:
+                highest = highest_spec_versions(data)
             for obj in data:
+                obj_id = object_id(obj)
                 if self.match_type and "type" in allowed:
-                    if not (any(s == obj.get("type") for s in self.match_type)) and not (any(s == obj.get("id").split("--")[0] for s in self.match_type)):
+                    obj_type = None if isinstance(obj, ManifestRecord) else obj.get("type")
+                    if not (any(s == obj_type for s in self.match_type)) and not (any(s == obj_id.split("--")[0] for s in self.match_type)):
                         continue
                 if self.match_id and "id" in allowed:
-                    if not ("id" in obj and any(s == obj["id"] for s in self.match_id)):
+                    if not any(s == obj_id for s in self.match_id):
                         continue
 
                 if self.added_after_date:
-                    if not self.check_added_after(obj, manifest_info, self.added_after_date):
+                    if not self.check_added_after(obj, added_versions, self.added_after_date):
                         continue
 
                 if "spec_version" in allowed:
-                    if not self.check_by_spec_version(obj, self.match_spec_version, data):
+                    if not self.check_by_spec_version(obj, self.match_spec_version, highest):
                         continue
                 match_objects.append(obj)
         else:
@@ -1,9 +1,83 @@
+import logging
+import time
+
+from bson import json_util
 from bson.son import SON
 from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
 
 from ..common import datetime_to_float, string_to_datetime
+from ..instrumentation import INSTRUMENTATION
 from .basic_filter import BasicFilter
 
+# Module-level logger
+log = logging.getLogger(__name__)
+
+
+def plan_stages(plan):
+    """Returns the names of all the stages of an explain output"""
+    stages = set()
+    if isinstance(plan, dict):
+        for key, value in plan.items():
+            if key == "stage" and isinstance(value, str):
+                stages.add(value)
+            else:
+                stages.update(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.update(plan_stages(item))
+    return stages
+
+
+class PipelineProfiler(object):
+    """
+    Debugging aid for the MongoDB back-ends: when enabled, every aggregation
+    pipeline run by ``MongoDBFilter`` is logged with its duration and number
+    of results, at the warning level when it took longer than ``slow_ms``.
+    With ``explain``, the query plan of each pipeline is also requested from
+    the server and the pipelines which scan a whole collection are reported,
+    at the cost of one more round trip per aggregation.
+
+    The number and duration of the aggregations of each request are reported
+    as the ``mongodb.aggregate`` phase by the request instrumentation.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.explain = False
+        self.slow_ms = None
+
+    def configure(self, enabled=None, explain=None, slow_ms=None):
+        """Changes the settings given"""
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if explain is not None:
+            self.explain = bool(explain)
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+
+    @staticmethod
+    def explain_command(collection, pipeline):
+        return SON([
+            ("explain", SON([("aggregate", collection.name), ("pipeline", pipeline), ("cursor", {})])),
+            ("verbosity", "queryPlanner"),
+        ])
+
+    def report(self, collection, pipeline, seconds, count, plan=None):
+        namespace = "{}.{}".format(collection.database.name, collection.name)
+        milliseconds = seconds * 1000
+        slow = self.slow_ms is not None and milliseconds > self.slow_ms
+        log.log(
+            logging.WARNING if slow else logging.INFO,
+            "%saggregation on %s took %.3f ms and returned %d documents: %s",
+            "slow " if slow else "", namespace, milliseconds, count, json_util.dumps(pipeline),
+        )
+        if plan is not None and "COLLSCAN" in plan_stages(plan):
+            log.warning("aggregation on %s scanned the whole collection: %s", namespace, json_util.dumps(pipeline))
+
+
+PIPELINE_PROFILER = PipelineProfiler()
+
 
 class MongoDBFilter(BasicFilter):
 
@@ -12,6 +86,8 @@ class MongoDBFilter(BasicFilter):
         self.basic_filter = basic_filter
         self.full_query = self._query_parameters(allowed)
         self.record = record
+        # ingest sequence number of the last result, where the next page starts
+        self.last_sequence = None
 
     def _query_parameters(self, allowed):
         parameters = self.basic_filter
@@ -50,7 +126,36 @@ class MongoDBFilter(BasicFilter):
                 }
         return parameters
 
-    def process_filter(self, data, allowed, manifest_info):
+    def process_filter(self, data, allowed, manifest_info, with_count=True):
+        """Runs the filter pipelines against a pymongo collection, returns the total count and the page of results"""
+        steps = self.filter_steps(allowed, manifest_info, with_count)
+        try:
+            pipeline = next(steps)
+            while True:
+                start = time.perf_counter()
+                with INSTRUMENTATION.phase("mongodb.aggregate"):
+                    results = list(data.aggregate(pipeline))
+                if PIPELINE_PROFILER.enabled:
+                    seconds = time.perf_counter() - start
+                    plan = None
+                    if PIPELINE_PROFILER.explain:
+                        try:
+                            plan = data.database.command(PIPELINE_PROFILER.explain_command(data, pipeline))
+                        except PyMongoError as e:
+                            log.warning("Unable to explain aggregation: %s", e)
+                    PIPELINE_PROFILER.report(data, pipeline, seconds, len(results), plan)
+                pipeline = steps.send(results)
+        except StopIteration as stop:
+            return stop.value
+
+    def filter_steps(self, allowed, manifest_info, with_count=True):
+        """
+        Generator which yields each aggregation pipeline the filter needs and
+        expects the list of resulting documents to be sent back, so every
+        pipeline run is timed and profiled in one place. The generator returns a
+        tuple of the total count and the requested page of results; without
+        ``with_count`` the count pipeline is not run and the count is None.
+        """
         pipeline = [
             {"$match": {"$and": [self.full_query]}},
         ]
@@ -64,7 +169,7 @@ class MongoDBFilter(BasicFilter):
 
             query = [
                 {"id": x["_id"], "_manifest.media_type": x["media_type"]}
-                for x in list(data.aggregate(latest_pipeline))
+                for x in (yield latest_pipeline)
             ]
             if query:
                 pipeline.append({"$match": {"$or": query}})
@@ -95,46 +200,60 @@ class MongoDBFilter(BasicFilter):
 
                 query = [
                     {"id": x["_id"], "_manifest.version": {"$in": x["versions"]}}
-                    for x in list(data.aggregate(latest_pipeline))
+                    for x in (yield latest_pipeline)
                 ]
                 if query:
                     pipeline.append({"$match": {"$or": query}})
 
-        pipeline.append({"$sort": SON([("_manifest.date_added", ASCENDING), ("created", ASCENDING), ("modified", ASCENDING)])})
+        count = None
+        if with_count:
+            count = self.get_result_count((yield self.get_count_pipeline(pipeline)))
+
+        # results are in ingest order, the sort and page ranges are served by
+        # the (_collection_id, _sequence) index
+        self.add_pagination_operations(pipeline)
 
         if manifest_info == "manifests":
             # Project the final results
-            pipeline.append({"$project": {"_manifest": 1}})
+            pipeline.append({"$project": {"_manifest": 1, "_sequence": 1}})
+            pipeline.append({"$addFields": {"_manifest._sequence": "$_sequence"}})
             pipeline.append({"$replaceRoot": {"newRoot": "$_manifest"}})
-
-            count = self.get_result_count(pipeline, data)
-            self.add_pagination_operations(pipeline)
-            results = list(data.aggregate(pipeline))
         elif manifest_info == "objects":
             # Project the final results
             pipeline.append({"$project": {"_id": 0, "_collection_id": 0, "_manifest": 0}})
+        # else: return raw data from Mongodb
 
-            count = self.get_result_count(pipeline, data)
-            self.add_pagination_operations(pipeline)
-            results = list(data.aggregate(pipeline))
-        else:
-            # Return raw data from Mongodb
-            count = self.get_result_count(pipeline, data)
-            self.add_pagination_operations(pipeline)
-            results = list(data.aggregate(pipeline))
+        results = yield pipeline
+        if results:
+            self.last_sequence = results[-1].get("_sequence")
+        if manifest_info in ("manifests", "objects"):
+            for result in results:
+                result.pop("_sequence", None)
 
         return count, results
 
     def add_pagination_operations(self, pipeline):
-        if self.record:
+        if self.record and self.record.get("after"):
+            # continue after the last object of the previous page rather than
+            # skipping over the objects of all the previous pages
+            pipeline.append({"$match": {"_sequence": {"$gt": self.record["after"]}}})
+            pipeline.append({"$sort": {"_sequence": ASCENDING}})
+            pipeline.append({"$limit": self.record["limit"]})
+        elif self.record:
+            pipeline.append({"$sort": {"_sequence": ASCENDING}})
             pipeline.append({"$skip": self.record["skip"]})
             pipeline.append({"$limit": self.record["limit"]})
+        else:
+            pipeline.append({"$sort": {"_sequence": ASCENDING}})
 
-    def get_result_count(self, pipeline, data):
+    @staticmethod
+    def get_count_pipeline(pipeline):
         count_pipeline = list(pipeline)
         count_pipeline.append({"$count": "total"})
-        count_result = list(data.aggregate(count_pipeline))
+        return count_pipeline
 
+    @staticmethod
+    def get_result_count(count_result):
         if len(count_result) == 0:
             # No results
             return 0
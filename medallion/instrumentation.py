@@ -0,0 +1,234 @@
+import bisect
+import collections
+import contextvars
+import functools
+import threading
+import time
+
+from flask import g, request
+
+# Phase timings of the request being handled, None outside of instrumented requests
+TIMINGS = contextvars.ContextVar("medallion_timings", default=None)
+
+# Upper bounds, in seconds, of the duration histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    "medallion_requests_total": ("counter", "Requests handled, by endpoint, method and status."),
+    "medallion_request_duration_seconds": ("histogram", "Time spent handling requests, by endpoint and method."),
+    "medallion_phase_duration_seconds": (
+        "histogram", "Time spent in each phase of the requests (auth, serialize, backend methods), by endpoint.",
+    ),
+    "medallion_phase_calls_total": ("counter", "Times each phase of the requests ran, by endpoint."),
+}
+
+
+class Histogram(object):
+    """Prometheus style histogram, holding the count of each bucket"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry(object):
+    """
+    Counters and histograms of the server, rendered in the Prometheus text
+    exposition format. Metrics are keyed by name and a tuple of label pairs.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.counters = collections.defaultdict(int)
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self.counters[(name, labels)] += value
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[(name, labels)] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (kind, description) in METRICS.items():
+                lines.append("# HELP {} {}".format(name, description))
+                lines.append("# TYPE {} {}".format(name, kind))
+                if kind == "counter":
+                    for (metric, labels), value in sorted(self.counters.items()):
+                        if metric == name:
+                            lines.append("{}{} {}".format(name, format_labels(labels), value))
+                    continue
+                for (metric, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append("{}_bucket{} {}".format(name, format_labels(labels + (("le", str(bound)),)), cumulative))
+                    lines.append("{}_sum{} {}".format(name, format_labels(labels), histogram.sum))
+                    lines.append("{}_count{} {}".format(name, format_labels(labels), histogram.count))
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in labels
+    ) + "}"
+
+
+class _Phase(object):
+    __slots__ = ("timings", "name", "start")
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timings.append((self.name, time.perf_counter() - self.start))
+
+
+class _NullPhase(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_PHASE = _NullPhase()
+
+
+class TimedBackend(object):
+    """
+    Proxy of the back-end of the application, timing each method the views
+    call as a ``backend.<method>`` phase of the request. Other attributes are
+    those of the back-end.
+    """
+
+    def __init__(self, backend, instrumentation):
+        self.backend = backend
+        self.instrumentation = instrumentation
+
+    def __getattr__(self, name):
+        attr = getattr(self.backend, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def timed(*args, **kwargs):
+            with self.instrumentation.phase("backend." + name):
+                return attr(*args, **kwargs)
+        return timed
+
+
+class Instrumentation(object):
+    """
+    Per-request timing of the views and back-end methods, reported as a
+    Server-Timing response header (``server_timing``) and as Prometheus
+    metrics served at ``/metrics`` (``metrics``). Both are off by default,
+    and the request hooks then return right away; ``phase`` returns a shared
+    no-op context manager outside of instrumented requests.
+    """
+
+    def __init__(self):
+        self.server_timing = False
+        self.metrics = False
+        self.registry = MetricsRegistry()
+
+    @property
+    def enabled(self):
+        return self.server_timing or self.metrics
+
+    def configure(self, server_timing=None, metrics=None):
+        """Changes the settings given"""
+        if server_timing is not None:
+            self.server_timing = bool(server_timing)
+        if metrics is not None:
+            self.metrics = bool(metrics)
+
+    def wrap(self, backend):
+        """
+        The back-end timed by a ``TimedBackend`` when instrumentation is
+        configured, the back-end itself otherwise
+        """
+        if self.enabled and not isinstance(backend, TimedBackend):
+            return TimedBackend(backend, self)
+        return backend
+
+    def start_request(self):
+        """Starts timing a request"""
+        if not self.enabled:
+            return
+        g.medallion_timings_token = TIMINGS.set([])
+        g.medallion_request_start = time.perf_counter()
+
+    def phase(self, name):
+        """Context manager timing a phase of the current request"""
+        timings = TIMINGS.get()
+        if timings is None:
+            return NULL_PHASE
+        return _Phase(timings, name)
+
+    def finish_request(self, response):
+        """Reports the timings of the request, in its response and in the metrics"""
+        if "medallion_timings_token" not in g:
+            return response
+        total = time.perf_counter() - g.medallion_request_start
+        timings = TIMINGS.get()
+        TIMINGS.reset(g.pop("medallion_timings_token"))
+        phases = {}
+        calls = collections.Counter()
+        for name, seconds in timings:
+            phases[name] = phases.get(name, 0.0) + seconds
+            calls[name] += 1
+
+        if self.server_timing:
+            response.headers["Server-Timing"] = ", ".join(
+                "{};dur={:.3f}".format(name, seconds * 1000) + (';desc="{} calls"'.format(calls[name]) if calls[name] > 1 else "")
+                for name, seconds in phases.items()
+            ) + ", total;dur={:.3f}".format(total * 1000)
+        if self.metrics:
+            endpoint = request.endpoint or "unmatched"
+            self.registry.inc(
+                "medallion_requests_total",
+                (("endpoint", endpoint), ("method", request.method), ("status", str(response.status_code))),
+            )
+            self.registry.observe(
+                "medallion_request_duration_seconds", (("endpoint", endpoint), ("method", request.method)), total,
+            )
+            for name, seconds in phases.items():
+                self.registry.observe(
+                    "medallion_phase_duration_seconds", (("endpoint", endpoint), ("phase", name)), seconds,
+                )
+                self.registry.inc("medallion_phase_calls_total", (("endpoint", endpoint), ("phase", name)), calls[name])
+        return response
+
+
+INSTRUMENTATION = Instrumentation()
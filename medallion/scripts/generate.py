@@ -0,0 +1,457 @@
+import argparse
+import collections
+import datetime as dt
+import inspect
+import ipaddress
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import uuid
+
+import pytz
+
+from medallion import __version__
+from medallion.common import (
+    datetime_to_string, datetime_to_string_stix, string_to_datetime
+)
+from medallion.scripts.run import NewlinesHelpFormatter
+
+log = logging.getLogger("medallion")
+
+# Default relative weights of the generated object types
+SDO_TYPES = {
+    "indicator": 5, "malware": 2, "attack-pattern": 1, "threat-actor": 1, "identity": 1, "relationship": 3,
+}
+SCO_TYPES = {"ipv4-addr": 3, "domain-name": 2, "url": 1, "file": 2}
+
+MEDIA_TYPE_STIX = "application/stix+json;version={}"
+
+DEFAULT_API_ROOT = "synthetic"
+DEFAULT_COLLECTION_ID = "8e8f2fb8-4c0b-4b7e-9a1c-0d4d1a1f8a21"
+DEFAULT_START = dt.datetime(2020, 1, 1, tzinfo=pytz.UTC)
+DEFAULT_END = dt.datetime(2021, 1, 1, tzinfo=pytz.UTC)
+
+DATE_ADDED_DISTRIBUTIONS = ("linear", "uniform", "recent")
+
+# How many recent object ids relationships pick their source and target from
+REFERENCE_POOL_SIZE = 1000
+
+
+class CorpusGenerator(object):
+    """
+    Produces a synthetic STIX corpus one object version at a time, so corpora
+    of any size can be written without holding them in memory.
+
+    Args:
+        sdo_types (dict): relative weights of the SDO and SRO types
+        sco_types (dict): relative weights of the SCO types
+        sco_ratio (float): fraction of the objects which are SCOs
+        versions (tuple): minimum and maximum number of versions of an object,
+            drawn uniformly; SCOs always have one
+        spec_versions (dict): relative weights of the STIX spec versions of the
+            SDOs and SROs; SCOs are always 2.1 objects
+        start, end (datetime): range of the ``date_added`` of the first
+            versions of the objects
+        date_added (str): how first versions are spread over that range:
+            ``linear`` (in generation order), ``uniform`` or ``recent``
+            (skewed towards ``end``, like a feed which keeps growing)
+        version_interval (timedelta): time between two versions of an object
+        seed (int): seed of the random choices, the same seed and settings
+            produce the same corpus
+
+    """
+
+    def __init__(
+        self, sdo_types=None, sco_types=None, sco_ratio=0.0, versions=(1, 1), spec_versions=None,
+        start=DEFAULT_START, end=DEFAULT_END, date_added="linear", version_interval=dt.timedelta(days=1), seed=0,
+    ):
+        if date_added not in DATE_ADDED_DISTRIBUTIONS:
+            raise ValueError("Unknown date_added distribution {!r}".format(date_added))
+        if not 0 <= sco_ratio <= 1:
+            raise ValueError("The SCO ratio must be between 0 and 1")
+        if versions[0] < 1 or versions[0] > versions[1]:
+            raise ValueError("Invalid range of versions {!r}".format(versions))
+        if start > end:
+            raise ValueError("The start of the date_added range must be before its end")
+        self.sdo_types = sdo_types or SDO_TYPES
+        self.sco_types = sco_types or SCO_TYPES
+        self.sco_ratio = sco_ratio
+        self.versions = versions
+        self.spec_versions = spec_versions or {"2.1": 1}
+        self.start = start
+        self.end = end
+        self.date_added = date_added
+        self.version_interval = version_interval
+        self.seed = seed
+
+    def _first_date_added(self, rng, index, count):
+        span = self.end - self.start
+        if self.date_added == "linear":
+            fraction = index / count
+        elif self.date_added == "uniform":
+            fraction = rng.random()
+        else:
+            fraction = 1 - min(1.0, rng.expovariate(5))
+        return self.start + span * fraction
+
+    def objects(self, count):
+        """
+        Yields every version of ``count`` objects, as (object, manifest entry)
+        pairs, the versions of an object one after the other.
+        """
+        rng = random.Random(self.seed)
+        sdo_types, sdo_weights = zip(*self.sdo_types.items())
+        sco_types, sco_weights = zip(*self.sco_types.items())
+        spec_versions, spec_weights = zip(*self.spec_versions.items())
+        references = collections.deque(maxlen=REFERENCE_POOL_SIZE)
+
+        for index in range(count):
+            object_uuid = uuid.UUID(int=rng.getrandbits(128), version=4)
+            date_added = self._first_date_added(rng, index, count)
+            if rng.random() < self.sco_ratio:
+                type_ = rng.choices(sco_types, sco_weights)[0]
+                obj = sco_object(rng, type_, "{}--{}".format(type_, object_uuid))
+                yield obj, manifest_entry(obj["id"], datetime_to_string(date_added), "2.1")
+                references.append(obj["id"])
+                continue
+
+            type_ = rng.choices(sdo_types, sdo_weights)[0]
+            spec_version = rng.choices(spec_versions, spec_weights)[0]
+            object_id = "{}--{}".format(type_, object_uuid)
+            created = date_added - dt.timedelta(hours=1)
+            for version in range(rng.randint(*self.versions)):
+                modified = created + self.version_interval * version
+                obj = sdo_object(rng, type_, object_id, spec_version, created, modified, references)
+                yield obj, manifest_entry(
+                    object_id, datetime_to_string(date_added + self.version_interval * version), spec_version,
+                    obj["modified"],
+                )
+            references.append(object_id)
+
+
+def manifest_entry(object_id, date_added, spec_version, version=None):
+    # SCOs are not versioned, their version is the time they were added
+    return {
+        "id": object_id,
+        "date_added": date_added,
+        "version": version or date_added,
+        "media_type": MEDIA_TYPE_STIX.format(spec_version),
+    }
+
+
+def sdo_object(rng, type_, object_id, spec_version, created, modified, references):
+    obj = {
+        "type": type_,
+        "id": object_id,
+        "created": datetime_to_string_stix(created),
+        "modified": datetime_to_string_stix(modified),
+    }
+    if spec_version != "2.0":
+        obj["spec_version"] = spec_version
+    if type_ == "relationship":
+        obj["relationship_type"] = rng.choice(("indicates", "uses", "related-to"))
+        obj["source_ref"] = rng.choice(references) if references else object_id
+        obj["target_ref"] = rng.choice(references) if references else object_id
+        return obj
+
+    obj["name"] = "{} {}".format(type_, object_id[-12:])
+    if type_ == "indicator":
+        obj["pattern"] = "[file:hashes.'SHA-256' = '{:064x}']".format(rng.getrandbits(256))
+        obj["valid_from"] = obj["created"]
+        if spec_version == "2.0":
+            obj["labels"] = ["malicious-activity"]
+        else:
+            obj["pattern_type"] = "stix"
+    elif type_ == "malware":
+        if spec_version == "2.0":
+            obj["labels"] = ["trojan"]
+        else:
+            obj["is_family"] = False
+    elif type_ == "threat-actor" and spec_version == "2.0":
+        obj["labels"] = ["criminal"]
+    elif type_ == "identity":
+        obj["identity_class"] = "organization"
+    return obj
+
+
+def sco_object(rng, type_, object_id):
+    obj = {"type": type_, "spec_version": "2.1", "id": object_id}
+    if type_ == "ipv4-addr":
+        obj["value"] = str(ipaddress.IPv4Address(rng.getrandbits(32)))
+    elif type_ == "domain-name":
+        obj["value"] = "host{:08x}.example.com".format(rng.getrandbits(32))
+    elif type_ == "url":
+        obj["value"] = "http://host{:08x}.example.com/{:08x}".format(rng.getrandbits(32), rng.getrandbits(32))
+    elif type_ == "file":
+        obj["hashes"] = {"SHA-256": "{:064x}".format(rng.getrandbits(256))}
+    else:
+        obj["value"] = "{:016x}".format(rng.getrandbits(64))
+    return obj
+
+
+def write_seed_file(outfile, pairs, api_root=DEFAULT_API_ROOT, collection_id=DEFAULT_COLLECTION_ID,
+                    url="http://localhost:5000/"):
+    """
+    Writes a medallion seed file (the layout of the Memory back-end
+    ``filename`` option and of ``medallion-load``) with one api root holding
+    one collection of the given (object, manifest entry) pairs. Objects are
+    written as they come, and the manifest is spooled to a temporary file.
+
+    Returns:
+        the number of object versions written
+
+    """
+    api_root_url = "{}{}/".format(url, api_root)
+    discovery = {
+        "title": "Synthetic TAXII Server",
+        "description": "Synthetic STIX corpus generated by medallion-generate",
+        "default": api_root_url,
+        "api_roots": [api_root_url],
+    }
+    information = {
+        "title": "Synthetic api root",
+        "versions": ["application/taxii+json;version=2.1"],
+        "max_content_length": 100 * 1024 * 1024,
+    }
+    written = 0
+    media_types = set()
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as manifest:
+        outfile.write('{{"/discovery": {}, {}: {{"information": {}, "status": [], "collections": [{{"objects": ['.format(
+            json.dumps(discovery), json.dumps(api_root), json.dumps(information),
+        ))
+        for obj, entry in pairs:
+            if "created" not in obj:
+                # the Memory back-end versions SCOs by the time they were added
+                obj = dict(obj, _date_added=entry["version"])
+            separator = ", " if written else ""
+            outfile.write(separator + json.dumps(obj))
+            manifest.write(separator + json.dumps(entry))
+            media_types.add(entry["media_type"])
+            written += 1
+        outfile.write('], "manifest": [')
+        manifest.seek(0)
+        shutil.copyfileobj(manifest, outfile)
+        collection = {
+            "id": collection_id,
+            "title": "Synthetic collection",
+            "can_read": True,
+            "can_write": True,
+            "media_types": sorted(media_types),
+        }
+        outfile.write("], {}}}]}}}}\n".format(json.dumps(collection)[1:-1]))
+    return written
+
+
+def write_bundles(directory, pairs, bundle_size=1000):
+    """
+    Writes the objects of the (object, manifest entry) pairs as envelopes of
+    ``bundle_size`` objects, ready to be POSTed to an Add Objects endpoint or
+    loaded with ``medallion-load``, in files named in generation order.
+
+    Returns:
+        the number of object versions written
+
+    """
+    os.makedirs(directory, exist_ok=True)
+    written = 0
+    objects = (obj for obj, _ in pairs)
+    for number in itertools.count(1):
+        batch = list(itertools.islice(objects, bundle_size))
+        if not batch:
+            break
+        with open(os.path.join(directory, "bundle-{:06d}.json".format(number)), "w", encoding="utf-8") as outfile:
+            json.dump({"objects": batch}, outfile)
+        written += len(batch)
+    return written
+
+
+def parse_weights(value):
+    """Parses ``name=weight`` pairs separated by commas, weights default to 1"""
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        try:
+            weights[name.strip()] = float(weight) if weight else 1.0
+        except ValueError:
+            raise argparse.ArgumentTypeError("invalid weight in {!r}".format(item))
+    return weights
+
+
+def parse_versions(value):
+    """Parses a number of versions, or a ``min-max`` range of them"""
+    low, _, high = value.partition("-")
+    try:
+        return int(low), int(high or low)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid number of versions {!r}".format(value))
+
+
+def parse_date(value):
+    try:
+        return pytz.UTC.localize(string_to_datetime(value))
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid timestamp {!r}".format(value))
+
+
+def _get_argparser():
+    """Create and return an ArgumentParser for the corpus generator."""
+    desc = inspect.cleandoc("""
+        medallion-generate v{0}
+
+        Generate a synthetic STIX corpus for load testing, either as a seed
+        file (the layout used by the MemoryBackend `filename` option and by
+        medallion-load) or as a directory of bundles to POST to a collection.
+        Output is written as it is generated, so corpora larger than memory
+        can be produced.
+    """).format(__version__)
+    parser = argparse.ArgumentParser(
+        description=desc,
+        formatter_class=NewlinesHelpFormatter,
+    )
+
+    parser.add_argument(
+        "PATH",
+        type=str,
+        help="The seed file to write, - for standard output, or the directory of the bundles.",
+    )
+    parser.add_argument(
+        "--format",
+        default="seed",
+        choices=["seed", "bundles"],
+        help="Write a seed file or a directory of bundles.",
+    )
+    parser.add_argument(
+        "--objects",
+        default=1000,
+        type=int,
+        help="The number of objects to generate, not counting their extra versions.",
+    )
+    parser.add_argument(
+        "--versions",
+        default=(1, 1),
+        type=parse_versions,
+        help="The number of versions of each SDO and SRO, or a min-max range to draw them from.",
+    )
+    parser.add_argument(
+        "--sdo-types",
+        default=SDO_TYPES,
+        type=parse_weights,
+        help=inspect.cleandoc("""
+            The SDO and SRO types to generate with their relative weights, as
+            type=weight pairs separated by commas. Defaults to {}.
+        """).format(",".join("{}={}".format(k, v) for k, v in SDO_TYPES.items())),
+    )
+    parser.add_argument(
+        "--sco-types",
+        default=SCO_TYPES,
+        type=parse_weights,
+        help=inspect.cleandoc("""
+            The SCO types to generate with their relative weights. Defaults to
+            {}.
+        """).format(",".join("{}={}".format(k, v) for k, v in SCO_TYPES.items())),
+    )
+    parser.add_argument(
+        "--sco-ratio",
+        default=0.0,
+        type=float,
+        help="The fraction of the objects which are SCOs.",
+    )
+    parser.add_argument(
+        "--spec-versions",
+        default={"2.1": 1},
+        type=parse_weights,
+        help="The STIX spec versions of the SDOs and SROs with their relative weights, e.g. 2.0=1,2.1=3.",
+    )
+    parser.add_argument(
+        "--start",
+        default=DEFAULT_START,
+        type=parse_date,
+        help="The earliest date_added of the objects.",
+    )
+    parser.add_argument(
+        "--end",
+        default=DEFAULT_END,
+        type=parse_date,
+        help="The latest date_added of the first versions of the objects.",
+    )
+    parser.add_argument(
+        "--date-added",
+        default="linear",
+        choices=DATE_ADDED_DISTRIBUTIONS,
+        help=inspect.cleandoc("""
+            How the date_added of the objects is spread between --start and
+            --end: linear in generation order, uniform, or recent to skew it
+            towards --end.
+        """),
+    )
+    parser.add_argument(
+        "--version-interval",
+        default=1.0,
+        type=float,
+        help="The number of days between two versions of an object.",
+    )
+    parser.add_argument(
+        "--seed",
+        default=0,
+        type=int,
+        help="The seed of the random choices; a seed and settings always produce the same corpus.",
+    )
+    parser.add_argument(
+        "--api-root",
+        default=DEFAULT_API_ROOT,
+        help="The name of the api root of the seed file.",
+    )
+    parser.add_argument(
+        "--collection",
+        default=DEFAULT_COLLECTION_ID,
+        help="The id of the collection of the seed file.",
+    )
+    parser.add_argument(
+        "--bundle-size",
+        default=1000,
+        type=int,
+        help="The number of objects in each bundle.",
+    )
+    return parser
+
+
+def main():
+    generator_parser = _get_argparser()
+    generator_args = generator_parser.parse_args()
+    if generator_args.bundle_size <= 0:
+        generator_parser.error("--bundle-size must be a positive integer")
+
+    try:
+        generator = CorpusGenerator(
+            sdo_types=generator_args.sdo_types,
+            sco_types=generator_args.sco_types,
+            sco_ratio=generator_args.sco_ratio,
+            versions=generator_args.versions,
+            spec_versions=generator_args.spec_versions,
+            start=generator_args.start,
+            end=generator_args.end,
+            date_added=generator_args.date_added,
+            version_interval=dt.timedelta(days=generator_args.version_interval),
+            seed=generator_args.seed,
+        )
+    except ValueError as e:
+        generator_parser.error(str(e))
+    pairs = generator.objects(generator_args.objects)
+
+    if generator_args.format == "bundles":
+        written = write_bundles(generator_args.PATH, pairs, generator_args.bundle_size)
+    elif generator_args.PATH == "-":
+        written = write_seed_file(sys.stdout, pairs, generator_args.api_root, generator_args.collection)
+    else:
+        with open(generator_args.PATH, "w", encoding="utf-8") as outfile:
+            written = write_seed_file(outfile, pairs, generator_args.api_root, generator_args.collection)
+    print("Generated {} object versions".format(written), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
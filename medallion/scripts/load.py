@@ -0,0 +1,219 @@
+import argparse
+import inspect
+import io
+import logging
+import os
+import pathlib
+import time
+
+from medallion import __version__
+from medallion.common import JSONStreamReader, get_timestamp
+import medallion.config
+from medallion.exceptions import ProcessingError
+from medallion.scripts.run import NewlinesHelpFormatter
+
+log = logging.getLogger("medallion")
+
+
+def _get_argparser():
+    """Create and return an ArgumentParser for the bulk loader."""
+    desc = inspect.cleandoc("""
+        medallion-load v{0}
+
+        Bulk load data into the MongoDB backend. Given a single seed file (the
+        same layout used by the MemoryBackend `filename` option) an empty
+        database is populated from it. Given `--api-root` and `--collection`,
+        STIX bundles from the provided files or directories are added to that
+        collection.
+    """).format(__version__)
+    parser = argparse.ArgumentParser(
+        description=desc,
+        formatter_class=NewlinesHelpFormatter,
+    )
+
+    parser.add_argument(
+        "PATH",
+        nargs="+",
+        type=str,
+        help=inspect.cleandoc("""
+            A seed file, or bundle files and directories containing bundle
+            files with names ending in .json when loading into a collection.
+        """),
+    )
+
+    parser.add_argument(
+        "--uri",
+        default=None,
+        type=str,
+        help=inspect.cleandoc("""
+            The MongoDB connection URI. Defaults to the `uri` option of the
+            backend in the medallion configuration.
+        """),
+    )
+
+    parser.add_argument(
+        "--api-root",
+        default=None,
+        type=str,
+        help="The name of the API root the bundles are loaded into.",
+    )
+
+    parser.add_argument(
+        "--collection",
+        default=None,
+        type=str,
+        help="The id of the collection the bundles are loaded into.",
+    )
+
+    parser.add_argument(
+        "--batch-size",
+        default=1000,
+        type=int,
+        help="The number of objects sent to MongoDB in each insert_many call.",
+    )
+
+    parser.add_argument(
+        "--clear-db",
+        default=False,
+        action="store_true",
+        help=inspect.cleandoc("""
+            If set, an existing medallion database is dropped before loading a
+            seed file. Without it loading a seed file into an established
+            database is refused.
+        """),
+    )
+
+    parser.add_argument(
+        "--log-level",
+        default="WARN",
+        type=str,
+        help="The logging output level for medallion.",
+        choices=["DEBUG", "INFO", "WARN", "ERROR", "CRITICAL"],
+    )
+
+    parser.add_argument(
+        "-c", "--conf-file",
+        default=os.environ.get(
+            "MEDALLION_CONFFILE", medallion.config.DEFAULT_CONFFILE
+        ),
+        help=inspect.cleandoc(f"""
+            Path to a single configuration file, used when `--uri` is not
+            given. Defaults to the value of the MEDALLION_CONFFILE environment
+            variable or {medallion.config.DEFAULT_CONFFILE}.
+        """),
+    )
+    config_dir_group = parser.add_mutually_exclusive_group()
+    config_dir_group.add_argument(
+        "--conf-dir",
+        default=os.environ.get(
+            "MEDALLION_CONFDIR", medallion.config.DEFAULT_CONFDIR
+        ),
+        help=inspect.cleandoc(f"""
+            Path to a directory containing JSON configuration files, used when
+            `--uri` is not given. Defaults to the value of the MEDALLION_CONFDIR
+            environment variable or {medallion.config.DEFAULT_CONFDIR}.
+        """),
+    )
+    config_dir_group.add_argument(
+        "--no-conf-dir",
+        action="store_true",
+        help="Disable the use of any configuration directory.",
+    )
+
+    return parser
+
+
+def iter_bundle_paths(paths):
+    """Yield bundle files from the given paths, expanding directories in name order."""
+    for path in paths:
+        path = pathlib.Path(path)
+        if path.is_dir():
+            yield from sorted(
+                (p for p in path.iterdir() if p.suffix == ".json" and p.is_file()),
+                key=lambda p: p.name,
+            )
+        else:
+            yield path
+
+
+def iter_bundle_objects(path):
+    """Yield the objects of a bundle file one at a time, without loading the file whole."""
+    with io.open(path, "r", encoding="utf-8") as infile:
+        reader = JSONStreamReader(infile)
+        for name in reader.members():
+            if name == "objects":
+                yield from reader.values()
+            else:
+                reader.skip()
+
+
+def _report(loaded, skipped, elapsed):
+    rate = loaded / elapsed if elapsed > 0 else float(loaded)
+    print(
+        "Loaded {} objects ({} already present) in {:.2f}s: {:.1f} objects/s".format(
+            loaded, skipped, elapsed, rate,
+        )
+    )
+
+
+def main():
+    # imported here so the parser can be built without pymongo installed
+    from pymongo import MongoClient
+
+    from medallion.backends import mongodb_backend
+
+    loader_parser = _get_argparser()
+    loader_args = loader_parser.parse_args()
+    log.setLevel(loader_args.log_level)
+
+    if bool(loader_args.api_root) != bool(loader_args.collection):
+        loader_parser.error("--api-root and --collection must be given together")
+    if not loader_args.api_root and len(loader_args.PATH) != 1:
+        loader_parser.error("exactly one seed file must be given without --api-root and --collection")
+    if loader_args.batch_size <= 0:
+        loader_parser.error("--batch-size must be a positive integer")
+
+    uri = loader_args.uri
+    if uri is None:
+        configuration = medallion.config.load_config(
+            loader_args.conf_file,
+            loader_args.conf_dir if not loader_args.no_conf_dir else None,
+        )
+        uri = configuration.get("backend", {}).get("uri")
+        if uri is None:
+            loader_parser.error("no MongoDB URI given with --uri or in the configuration")
+
+    client = MongoClient(uri)
+    start = time.perf_counter()
+    skipped = 0
+
+    if loader_args.api_root:
+        try:
+            mongodb_backend.check_collection_exists(client, loader_args.api_root, loader_args.collection)
+        except ProcessingError as e:
+            loader_parser.error(e.message)
+        loaded = 0
+        for bundle_path in iter_bundle_paths(loader_args.PATH):
+            log.info("Loading bundle %s", bundle_path)
+            inserted, already_present = mongodb_backend.load_bundle_objects(
+                client, loader_args.api_root, loader_args.collection,
+                iter_bundle_objects(bundle_path), get_timestamp(), loader_args.batch_size,
+            )
+            loaded += inserted
+            skipped += already_present
+        mongodb_backend.create_missing_indexes(
+            client[loader_args.api_root], mongodb_backend.API_ROOT_INDEXES,
+        )
+    else:
+        if "discovery_database" in client.list_database_names() and not loader_args.clear_db:
+            loader_parser.error("a medallion database already exists, use --clear-db to replace it")
+        mongodb_backend.clear_database(client)
+        loaded = mongodb_backend.load_seed_file(
+            client, loader_args.PATH[0], loader_args.batch_size,
+        )
+
+    _report(loaded, skipped, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import inspect
+import logging
+import os
+
+from medallion import __version__
+import medallion.config
+from medallion.scripts.run import NewlinesHelpFormatter
+
+log = logging.getLogger("medallion")
+
+
+def _get_argparser():
+    """Create and return an ArgumentParser for the database migration."""
+    desc = inspect.cleandoc("""
+        medallion-migrate v{0}
+
+        Upgrade a MongoDB backend database written by an older version of
+        medallion, or by other tools. The objects without an ingest sequence
+        number are numbered in date_added order, after the objects of their
+        collection already numbered. Run it once after upgrading, preferably
+        before the medallion servers are started again.
+    """).format(__version__)
+    parser = argparse.ArgumentParser(
+        description=desc,
+        formatter_class=NewlinesHelpFormatter,
+    )
+
+    parser.add_argument(
+        "--uri",
+        default=None,
+        type=str,
+        help=inspect.cleandoc("""
+            The MongoDB connection URI. Defaults to the `uri` option of the
+            backend in the medallion configuration.
+        """),
+    )
+
+    parser.add_argument(
+        "--batch-size",
+        default=1000,
+        type=int,
+        help="The number of objects updated in each bulk_write call.",
+    )
+
+    parser.add_argument(
+        "--log-level",
+        default="WARN",
+        type=str,
+        help="The logging output level for medallion.",
+        choices=["DEBUG", "INFO", "WARN", "ERROR", "CRITICAL"],
+    )
+
+    parser.add_argument(
+        "-c", "--conf-file",
+        default=os.environ.get(
+            "MEDALLION_CONFFILE", medallion.config.DEFAULT_CONFFILE
+        ),
+        help=inspect.cleandoc(f"""
+            Path to a single configuration file, used when `--uri` is not
+            given. Defaults to the value of the MEDALLION_CONFFILE environment
+            variable or {medallion.config.DEFAULT_CONFFILE}.
+        """),
+    )
+    config_dir_group = parser.add_mutually_exclusive_group()
+    config_dir_group.add_argument(
+        "--conf-dir",
+        default=os.environ.get(
+            "MEDALLION_CONFDIR", medallion.config.DEFAULT_CONFDIR
+        ),
+        help=inspect.cleandoc(f"""
+            Path to a directory containing JSON configuration files, used when
+            `--uri` is not given. Defaults to the value of the MEDALLION_CONFDIR
+            environment variable or {medallion.config.DEFAULT_CONFDIR}.
+        """),
+    )
+    config_dir_group.add_argument(
+        "--no-conf-dir",
+        action="store_true",
+        help="Disable the use of any configuration directory.",
+    )
+
+    return parser
+
+
+def main():
+    # imported here so the parser can be built without pymongo installed
+    from pymongo import MongoClient
+
+    from medallion.backends import mongodb_backend
+
+    migrate_parser = _get_argparser()
+    migrate_args = migrate_parser.parse_args()
+    log.setLevel(migrate_args.log_level)
+
+    if migrate_args.batch_size <= 0:
+        migrate_parser.error("--batch-size must be a positive integer")
+
+    uri = migrate_args.uri
+    if uri is None:
+        configuration = medallion.config.load_config(
+            migrate_args.conf_file,
+            migrate_args.conf_dir if not migrate_args.no_conf_dir else None,
+        )
+        uri = configuration.get("backend", {}).get("uri")
+        if uri is None:
+            migrate_parser.error("no MongoDB URI given with --uri or in the configuration")
+
+    numbered = mongodb_backend.migrate_object_sequences(MongoClient(uri), migrate_args.batch_size)
+    for api_root, count in sorted(numbered.items()):
+        print("Assigned ingest sequence numbers to {} objects of {}".format(count, api_root))
+
+
+if __name__ == "__main__":
+    main()
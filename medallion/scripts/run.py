@@ -11,6 +11,7 @@ from medallion.common import (
     APPLICATION_INSTANCE, get_application_instance_config_values
 )
 import medallion.config
+import medallion.serving
 
 log = logging.getLogger("medallion")
 
@@ -54,6 +55,63 @@ def _get_argparser():
         help="If set, start application in debug mode.",
     )
 
+    parser.add_argument(
+        "--server",
+        default="development",
+        choices=["development", "gunicorn", "waitress", "uvicorn"],
+        help=inspect.cleandoc("""
+            The web server. The Flask development server is not meant for
+            production, where gunicorn, waitress or uvicorn should be used,
+            installed with the extra of the same name, e.g. `pip install
+            medallion[gunicorn]`.
+        """),
+    )
+
+    parser.add_argument(
+        "--workers",
+        default=None,
+        type=int,
+        help=inspect.cleandoc("""
+            The number of worker processes of the gunicorn and uvicorn
+            servers, each with its own connection to the backend. Defaults
+            to 1.
+        """),
+    )
+
+    parser.add_argument(
+        "--threads",
+        default=None,
+        type=int,
+        help=inspect.cleandoc("""
+            The number of threads handling requests in each worker. Defaults
+            to 1 for gunicorn, 4 for waitress and 10 for uvicorn. uvicorn
+            runs medallion on this thread pool rather than asynchronously, so
+            it is also the most requests, change feed long-polls included,
+            a uvicorn worker handles at once.
+        """),
+    )
+
+    parser.add_argument(
+        "--keep-alive",
+        default=None,
+        type=int,
+        help=inspect.cleandoc("""
+            The number of seconds an idle keep-alive connection is kept open.
+            Defaults to that of the server.
+        """),
+    )
+
+    parser.add_argument(
+        "--graceful-timeout",
+        default=None,
+        type=int,
+        help=inspect.cleandoc("""
+            The number of seconds workers have to finish their requests when
+            the gunicorn or uvicorn server is stopped or reloaded with
+            SIGHUP. Defaults to 30.
+        """),
+    )
+
     parser.add_argument(
         "--log-level",
         default="WARN",
@@ -122,10 +180,38 @@ def main():
         medallion_args.log_level = logging.DEBUG
     log.setLevel(medallion_args.log_level)
 
-    configuration = medallion.config.load_config(
-        medallion_args.CONFIG_PATH or medallion_args.conf_file,
-        medallion_args.conf_dir if not medallion_args.no_conf_dir else None,
-    )
+    server_options = {
+        "workers": medallion_args.workers,
+        "threads": medallion_args.threads,
+        "keep_alive": medallion_args.keep_alive,
+        "graceful_timeout": medallion_args.graceful_timeout,
+    }
+    if medallion_args.server == "development":
+        if any(value is not None for value in server_options.values()):
+            medallion_parser.error("--workers, --threads, --keep-alive and --graceful-timeout need a production --server")
+    else:
+        if medallion_args.debug_mode:
+            medallion_parser.error("--debug-mode is only available with the development server")
+        server_options["workers"] = server_options["workers"] or 1
+        server_options["graceful_timeout"] = server_options["graceful_timeout"] or 30
+        try:
+            medallion.serving.check_server_options(
+                medallion_args.server, server_options["workers"], server_options["threads"],
+            )
+        except ValueError as e:
+            medallion_parser.error(str(e))
+
+    conf_file = medallion_args.CONFIG_PATH or medallion_args.conf_file
+    conf_dir = medallion_args.conf_dir if not medallion_args.no_conf_dir else None
+    configuration = medallion.config.load_config(conf_file, conf_dir)
+
+    if medallion_args.server != "development" and not medallion_args.conf_check:
+        # the workers set the backend up once they have started
+        medallion.serving.serve(
+            medallion_args.server, conf_file, conf_dir, host=medallion_args.host, port=medallion_args.port,
+            log_level=medallion_args.log_level, **server_options
+        )
+        return
 
     set_config(APPLICATION_INSTANCE, "users", configuration)
     set_config(APPLICATION_INSTANCE, "taxii", configuration)
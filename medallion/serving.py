@@ -0,0 +1,190 @@
+"""
+Production serving of medallion by gunicorn, waitress or uvicorn, instead of
+the Flask development server.
+
+The back-end is set up in each worker process once it has started, never in
+the process which starts the server, so connection pools and maintenance
+threads belong to the worker using them. Servers started on their own use the ``create_app`` (WSGI) and
+``create_asgi_app`` (ASGI) factories, which read the configuration paths from
+the ``MEDALLION_CONFFILE`` and ``MEDALLION_CONFDIR`` environment variables.
+
+The ASGI application is the WSGI application running on a pool of threads, not
+an asynchronous one: each request, including a change feed long-poll, holds
+one of the threads until it completes.
+"""
+import importlib.util
+import logging
+import os
+
+from . import config, connect_to_backend, register_blueprints, set_config
+from .common import (
+    APPLICATION_INSTANCE, get_application_instance_config_values
+)
+
+log = logging.getLogger(__name__)
+
+# Servers, with the packages they need and the extra installing them
+SERVERS = {
+    "gunicorn": (("gunicorn",), "gunicorn"),
+    "waitress": (("waitress",), "waitress"),
+    "uvicorn": (("uvicorn", "a2wsgi"), "uvicorn"),
+}
+
+# Thread pool size of the WSGI adapter of the ASGI server, unless given
+DEFAULT_ASGI_THREADS = 10
+
+
+def setup_application(configuration, workers=None, server=None):
+    """
+    Configures the application and connects its back-end, in the process
+    serving it. ``workers`` is the number of processes serving the application
+    and ``server`` the kind of server, given to the back-end as its ``workers``
+    and ``server`` options.
+    """
+    if "backend" in configuration:
+        if workers is not None:
+            configuration["backend"]["workers"] = workers
+        if server is not None:
+            configuration["backend"]["server"] = server
+    set_config(APPLICATION_INSTANCE, "users", configuration)
+    set_config(APPLICATION_INSTANCE, "taxii", configuration)
+    set_config(APPLICATION_INSTANCE, "backend", configuration)
+
+    APPLICATION_INSTANCE.medallion_backend = connect_to_backend(get_application_instance_config_values(APPLICATION_INSTANCE, "backend"))
+    if not APPLICATION_INSTANCE.blueprints:
+        register_blueprints(APPLICATION_INSTANCE)
+    return APPLICATION_INSTANCE
+
+
+def create_app(server="wsgi"):
+    """
+    WSGI application factory, e.g. ``gunicorn 'medallion.serving:create_app()'``.
+    An empty ``MEDALLION_CONFDIR`` disables the configuration directory,
+    ``MEDALLION_LOG_LEVEL`` sets the logging level of medallion and
+    ``MEDALLION_WORKERS`` the number of worker processes of the server.
+    """
+    if os.environ.get("MEDALLION_LOG_LEVEL"):
+        logging.getLogger("medallion").setLevel(os.environ["MEDALLION_LOG_LEVEL"])
+    workers = os.environ.get("MEDALLION_WORKERS")
+    return setup_application(config.load_config(
+        os.environ.get("MEDALLION_CONFFILE", config.DEFAULT_CONFFILE),
+        os.environ.get("MEDALLION_CONFDIR", config.DEFAULT_CONFDIR) or None,
+    ), int(workers) if workers else None, server)
+
+
+def create_asgi_app():
+    """
+    ASGI application factory, e.g. ``uvicorn --factory medallion.serving:create_asgi_app``.
+    It wraps the WSGI application: requests are handled on a pool of
+    ``MEDALLION_THREADS`` threads, 10 by default, which also bounds the number
+    of concurrent change feed long-polls of each worker.
+    """
+    from a2wsgi import WSGIMiddleware
+
+    return WSGIMiddleware(create_app("asgi"), workers=int(os.environ.get("MEDALLION_THREADS") or DEFAULT_ASGI_THREADS))
+
+
+def check_server_options(server, workers=1, threads=None):
+    """Raises ValueError for servers which are not installed or options they do not support"""
+    if server not in SERVERS:
+        raise ValueError("Unknown server {!r}".format(server))
+    packages, extra = SERVERS[server]
+    for package in packages:
+        if importlib.util.find_spec(package) is None:
+            raise ValueError(
+                "The {} server needs the {} package, install it with: pip install medallion[{}]".format(server, package, extra)
+            )
+    if workers < 1 or (threads is not None and threads < 1):
+        raise ValueError("The numbers of workers and threads must be positive")
+    if server == "waitress" and workers > 1:
+        raise ValueError("The waitress server runs a single process, use threads to handle concurrent requests")
+
+
+def _log_level_name(log_level):
+    if isinstance(log_level, int):
+        log_level = logging.getLevelName(log_level)
+    return {"WARN": "warning"}.get(log_level, log_level).lower()
+
+
+def gunicorn_application(conf_file, conf_dir, options):
+    """
+    Returns a gunicorn application with the given settings. Its workers load
+    the configuration when they start, so the new workers started by a
+    graceful reload (``SIGHUP``) use the current configuration files.
+    """
+    import gunicorn.app.base
+
+    class MedallionApplication(gunicorn.app.base.BaseApplication):
+
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return setup_application(config.load_config(conf_file, conf_dir), self.cfg.workers, "gunicorn")
+
+    return MedallionApplication()
+
+
+def serve(server, conf_file, conf_dir, host="127.0.0.1", port=5000, workers=1, threads=None, keep_alive=None,
+          graceful_timeout=30, log_level="WARN"):
+    """
+    Serves medallion with a production server until it is stopped.
+
+    Args:
+        server (str): ``gunicorn`` (pre-fork workers, each running ``threads``
+            threads), ``waitress`` (a single process running ``threads``
+            threads) or ``uvicorn`` (ASGI workers running the WSGI application
+            on a pool of ``threads`` threads, so no more than ``threads``
+            requests, long-polls included, are handled at once by a worker)
+        conf_file, conf_dir: the configuration paths, ``conf_dir`` may be None
+        workers (int): the number of worker processes
+        threads (int): the number of threads of each worker, defaults to that
+            of the server
+        keep_alive (int): seconds an idle keep-alive connection is kept open,
+            defaults to that of the server
+        graceful_timeout (int): seconds the workers have to finish their
+            requests when they are stopped or reloaded
+
+    """
+    check_server_options(server, workers, threads)
+    log.info("Serving medallion with %s on %s:%s", server, host, port)
+
+    if server == "gunicorn":
+        options = {
+            "bind": "{}:{}".format(host, port),
+            "workers": workers,
+            "graceful_timeout": graceful_timeout,
+            "loglevel": _log_level_name(log_level),
+        }
+        if threads is not None:
+            options["threads"] = threads
+        if keep_alive is not None:
+            options["keepalive"] = keep_alive
+        gunicorn_application(conf_file, conf_dir, options).run()
+    elif server == "waitress":
+        import waitress
+
+        options = {"host": host, "port": port, "ident": "medallion"}
+        if threads is not None:
+            options["threads"] = threads
+        if keep_alive is not None:
+            options["channel_timeout"] = keep_alive
+        waitress.serve(setup_application(config.load_config(conf_file, conf_dir), 1, "waitress"), **options)
+    else:
+        import uvicorn
+
+        # the workers are new processes, which find their settings in the environment
+        os.environ["MEDALLION_CONFFILE"] = str(conf_file)
+        os.environ["MEDALLION_CONFDIR"] = str(conf_dir) if conf_dir else ""
+        os.environ["MEDALLION_WORKERS"] = str(workers)
+        os.environ["MEDALLION_LOG_LEVEL"] = logging.getLevelName(log_level) if isinstance(log_level, int) else log_level
+        if threads is not None:
+            os.environ["MEDALLION_THREADS"] = str(threads)
+        options = {"timeout_graceful_shutdown": graceful_timeout}
+        if keep_alive is not None:
+            options["timeout_keep_alive"] = keep_alive
+        uvicorn.run(
+            "medallion.serving:create_asgi_app", factory=True, host=host, port=port, workers=workers,
+            log_level=_log_level_name(log_level), **options
+        )
@@ -25,6 +25,9 @@ class TaxiiTest():
         ]
     }
 
+    # modified timestamps of the objects built by indicator_versions
+    INDICATOR_VERSIONS = ["2021-01-0{}T00:00:00.000Z".format(day) for day in (1, 2, 3)]
+
     no_config = {}
 
     config_no_taxii = {
@@ -74,7 +77,7 @@ class TaxiiTest():
             "module_class": "MongoBackend",
             "uri": "mongodb://127.0.0.1:27017/",
             "filename": DATA_FILE,
-            "clear_db": True
+            "clear_db": True,
         },
         "users": {
             "root": "example",
@@ -84,6 +87,24 @@ class TaxiiTest():
         },
     }
 
+    def indicator_versions(self, *object_ids):
+        """Envelope of three versions, the INDICATOR_VERSIONS, of an indicator for each of the ids"""
+        return {
+            "objects": [
+                {
+                    "type": "indicator",
+                    "spec_version": "2.1",
+                    "id": object_id,
+                    "created": self.INDICATOR_VERSIONS[0],
+                    "modified": version,
+                    "pattern": "[file:name = 'x']",
+                    "pattern_type": "stix",
+                    "valid_from": self.INDICATOR_VERSIONS[0],
+                }
+                for object_id in object_ids for version in self.INDICATOR_VERSIONS
+            ]
+        }
+
     def setUp(self, start_threads=True):
         self.__name__ = self.type
         self.app = APPLICATION_INSTANCE
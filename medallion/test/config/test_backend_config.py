@@ -5,6 +5,9 @@ import pytest
 import medallion
 from medallion.backends import base as mbe_base
 from medallion.backends import memory_backend as mbe_mem
+from medallion.backends import mongodb_backend as mbe_mongo
+from medallion.exceptions import InitializationError
+from medallion.instrumentation import TimedBackend
 
 
 class SavesArgs(object):
@@ -103,6 +106,20 @@ class TestBackendConfig:
         assert be_obj.args == tuple()
         assert be_obj.kwargs == cfg
 
+    def test_instrumented_backend(self):
+        cfg = {
+            "module": __name__,
+            "module_class": "SavesArgs",
+        }
+        medallion.INSTRUMENTATION.configure(server_timing=True)
+        try:
+            be_obj = medallion.connect_to_backend(cfg)
+        finally:
+            medallion.INSTRUMENTATION.configure(server_timing=False)
+        assert isinstance(be_obj, TimedBackend)
+        assert be_obj.kwargs == cfg
+        assert isinstance(medallion.connect_to_backend(cfg), SavesArgs)
+
     def test_backend_module_path_nonexistent(self):
         cfg = {
             "module": "nonexistent.module.path",
@@ -118,3 +135,28 @@ class TestBackendConfig:
         }
         with pytest.raises(AttributeError):
             medallion.connect_to_backend(cfg)
+
+
+def test_mongo_client_options():
+    cfg = {
+        "module_class": "MongoBackend",
+        "uri": "mongodb://localhost:27017/",
+        "max_pool_size": 200,
+        "server_selection_timeout_ms": 5000,
+        "write_concern": "majority",
+        "read_preference": "secondaryPreferred",
+        "socket_timeout_ms": None,
+    }
+    assert mbe_mongo.get_client_options(cfg) == {
+        "maxPoolSize": 200,
+        "serverSelectionTimeoutMS": 5000,
+        "w": "majority",
+    }
+
+
+def test_mongo_read_preference():
+    assert mbe_mongo.get_read_preference(None) is None
+    assert mbe_mongo.get_read_preference("secondaryPreferred").mongos_mode == "secondaryPreferred"
+    assert mbe_mongo.get_read_preference("nearest").mongos_mode == "nearest"
+    with pytest.raises(InitializationError):
+        mbe_mongo.get_read_preference("everywhere")
@@ -351,3 +351,39 @@ def test_env_config_backend_mongo(subtests):
         with mock.patch.dict("os.environ", **env, clear=True):
             config_data = m_cfg.load_config(conf_file=None, conf_dir=None)
         assert config_data == expected_flat
+
+
+def test_env_config_backend_mongo_client_options(subtests):
+    """
+    Confirm that the `MedallionConfig` can get `MongoBackend` client options.
+    """
+    env = {
+        "MEDALLION_BACKEND_MODULE_CLASS": "MongoBackend",
+        "MEDALLION_BACKEND_MONGO_URI": "mongodb://localhost:27017/",
+        "MEDALLION_BACKEND_MONGO_MAX_POOL_SIZE": "200",
+        "MEDALLION_BACKEND_MONGO_SERVER_SELECTION_TIMEOUT_MS": "5000",
+        "MEDALLION_BACKEND_MONGO_READ_PREFERENCE": "secondaryPreferred",
+        "MEDALLION_BACKEND_MONGO_WRITE_CONCERN": "majority",
+        "MEDALLION_BACKEND_MONGO_COMPRESSORS": "zstd,zlib",
+    }
+    expected_flat = {
+        "backend": {
+            "module_class": "MongoBackend",
+            "uri": "mongodb://localhost:27017/",
+            "max_pool_size": 200,
+            "server_selection_timeout_ms": 5000,
+            "read_preference": "secondaryPreferred",
+            "write_concern": "majority",
+            "compressors": "zstd,zlib",
+        },
+    }
+    with subtests.test(msg="Loading config via loader"):
+        with mock.patch.dict("os.environ", **env, clear=True):
+            config_data = m_cfg.load_config(conf_file=None, conf_dir=None)
+        assert config_data == expected_flat
+
+    with subtests.test(msg="Numeric write concern"):
+        env["MEDALLION_BACKEND_MONGO_WRITE_CONCERN"] = "2"
+        with mock.patch.dict("os.environ", **env, clear=True):
+            config_data = m_cfg.load_config(conf_file=None, conf_dir=None)
+        assert config_data["backend"]["write_concern"] == 2
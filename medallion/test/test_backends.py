@@ -1,17 +1,38 @@
+import base64
 import copy
 import datetime
+import gc
 import json
+import logging
 import tempfile
+import threading
+import time
+from unittest import mock
+import uuid
 
 import pytest
+from werkzeug.security import generate_password_hash
 
-from medallion import common, exceptions, test
+from medallion import common, credentials, exceptions, test, views
+from medallion.backends import (
+    changes, memory_backend, mongodb_backend, sessions
+)
 from medallion.backends.base import SECONDS_IN_24_HOURS
+from medallion.filters import mongodb_filter
+from medallion.instrumentation import INSTRUMENTATION
 from medallion.views import MEDIA_TYPE_TAXII_V21
 
 from .base_test import TaxiiTest
 
 
+def without_status_expiry(configuration):
+    """
+    The seed statuses are years old, so the TTL index of the default status
+    retention would expire them at any point during the tests
+    """
+    return dict(configuration, backend=dict(configuration["backend"], status_retention=-1))
+
+
 class MemoryTestServer(TaxiiTest):
     type = "memory"
 
@@ -21,6 +42,7 @@ class MemoryTestServer(TaxiiTest):
 
 class MongoTestServer(TaxiiTest):
     type = "mongo"
+    mongodb_config = without_status_expiry(TaxiiTest.mongodb_config)
 
     def count(self, documents):
         return documents.count_documents({})
@@ -154,6 +176,74 @@ def test_get_object(backend):
     assert r.headers['X-TAXII-Date-Added-Last'] == "2017-01-27T13:49:59.997000Z"
 
 
+def test_get_object_without_filters(backend):
+    # the unfiltered lookup must agree with the full filter defaults
+    r = backend.client.get(test.GET_OBJECTS_EP + "?match[version]=all", headers=backend.headers)
+    for object_id in {obj["id"] for obj in r.json["objects"]}:
+        plain = backend.client.get(test.GET_OBJECTS_EP + object_id + "/", headers=backend.headers)
+        filtered = backend.client.get(
+            test.GET_OBJECTS_EP + object_id + "/?match[version]=last", headers=backend.headers,
+        )
+        assert plain.status_code == 200
+        assert plain.json == filtered.json
+        assert plain.headers["X-TAXII-Date-Added-First"] == filtered.headers["X-TAXII-Date-Added-First"]
+        assert plain.headers["X-TAXII-Date-Added-Last"] == filtered.headers["X-TAXII-Date-Added-Last"]
+
+    r = backend.client.get(test.GET_OBJECTS_EP + "malware--00000000-0000-4000-8000-000000000000/", headers=backend.headers)
+    assert r.status_code == 404
+
+
+def test_bulk_fetch_and_delete(backend):
+    object_id = "indicator--" + str(uuid.uuid4())
+    other_id = "indicator--" + str(uuid.uuid4())
+    missing_id = "malware--00000000-0000-4000-8000-000000000000"
+    versions = backend.INDICATOR_VERSIONS
+    new_objects = backend.indicator_versions(object_id, other_id)
+    r_post = backend.client.post(test.ADD_OBJECTS_EP, data=json.dumps(new_objects), headers=backend.post_headers)
+    assert r_post.status_code == 202
+
+    r = backend.client.post(
+        test.BULK_FETCH_EP,
+        data=json.dumps({"objects": [object_id, {"id": other_id, "version": "first"}, missing_id]}),
+        headers=backend.post_headers,
+    )
+    assert r.status_code == 200
+    assert r.content_type == MEDIA_TYPE_TAXII_V21
+    assert sorted((obj["id"], obj["modified"]) for obj in r.json["objects"]) == sorted(
+        [(object_id, versions[2]), (other_id, versions[0])],
+    )
+    assert r.json["not_found"] == [missing_id]
+
+    r = backend.client.post(
+        test.BULK_DELETE_EP,
+        data=json.dumps({"objects": [
+            {"id": object_id, "version": "all"}, {"id": other_id, "version": versions[1]}, missing_id,
+        ]}),
+        headers=backend.post_headers,
+    )
+    assert r.status_code == 200
+    assert r.json == {"not_found": [missing_id]}
+
+    r = backend.client.get(test.ADD_OBJECTS_EP + object_id + "/", headers=backend.headers)
+    assert r.status_code == 404
+    r = backend.client.get(test.ADD_OBJECTS_EP + other_id + "/?match[version]=all", headers=backend.headers)
+    assert sorted(obj["modified"] for obj in r.json["objects"]) == [versions[0], versions[2]]
+
+    for entry in ({"version": "last"}, {"id": other_id, "version": "garbage"}, {"id": other_id, "version": "last,2021-13-01"}):
+        r = backend.client.post(
+            test.BULK_FETCH_EP, data=json.dumps({"objects": [entry]}), headers=backend.post_headers,
+        )
+        assert r.status_code == 400
+    backend.app.taxii_config["max_bulk_size"] = 1
+    try:
+        r = backend.client.post(
+            test.BULK_DELETE_EP, data=json.dumps({"objects": [object_id, other_id]}), headers=backend.post_headers,
+        )
+        assert r.status_code == 413
+    finally:
+        del backend.app.taxii_config["max_bulk_size"]
+
+
 def test_add_and_delete_object(backend):
     # ------------- BEGIN: add object section ------------- #
 
@@ -247,6 +337,128 @@ def test_add_and_delete_object(backend):
     # assert r.content_type == MEDIA_TYPE_TAXII_V21
 
 
+def test_change_feed(backend):
+    r = backend.client.get(test.CHANGES_EP, headers=backend.headers)
+    assert r.status_code == 200
+    assert r.content_type == MEDIA_TYPE_TAXII_V21
+    sequence = r.json["sequence"]
+    assert "objects" not in r.json
+
+    new_object = {
+        "type": "indicator",
+        "spec_version": "2.1",
+        "id": "indicator--" + str(uuid.uuid4()),
+        "created": "2020-01-27T13:49:53.935Z",
+        "modified": "2020-01-27T13:49:53.935Z",
+        "name": "Change feed test",
+        "pattern": "[file:name = 'changes.exe']",
+        "pattern_type": "stix",
+        "valid_from": "2020-01-27T13:49:53.935Z",
+    }
+    for _ in range(2):
+        # the second post stores nothing and publishes no change
+        r_post = backend.client.post(
+            test.ADD_OBJECTS_EP,
+            data=json.dumps({"objects": [new_object]}),
+            headers=backend.post_headers,
+        )
+        assert r_post.status_code == 202
+
+    r = backend.client.get(test.CHANGES_EP + "?since={}".format(sequence), headers=backend.headers)
+    assert r.status_code == 200
+    assert r.json["sequence"] == sequence + 1
+    assert r.json["objects"] == [new_object]
+
+    r = backend.client.get(test.CHANGES_EP + "?since={}&timeout=0".format(sequence + 1), headers=backend.headers)
+    assert r.status_code == 200
+    assert r.json == {"sequence": sequence + 1}
+
+    r = backend.client.get(test.CHANGES_EP + "?since={}".format(sequence + 2), headers=backend.headers)
+    assert r.status_code == 410
+
+    for timeout in ("soon", "nan", "inf", "-1"):
+        r = backend.client.get(test.CHANGES_EP + "?since={}&timeout={}".format(sequence + 1, timeout), headers=backend.headers)
+        assert r.status_code == 400
+
+
+def test_change_feed_wait():
+    feed = changes.ChangeFeed(size=3)
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(feed.wait("root", "coll", 0, 5)))
+    waiter.start()
+    feed.publish("root", "coll", [{"id": "a"}])
+    waiter.join()
+    assert results == [(1, [{"id": "a"}])]
+
+    assert feed.wait("root", "coll", 1, 0) == (1, [])
+    assert feed.wait("root", "other", None, 0) == (0, [])
+    feed.publish("root", "coll", [{"id": "b"}])
+    feed.publish("root", "coll", [{"id": "c"}, {"id": "d"}])
+    assert feed.wait("root", "coll", 1, 0) == (3, [{"id": "b"}, {"id": "c"}, {"id": "d"}])
+    # the first batch is no longer kept, the feed holds three objects
+    assert feed.wait("root", "coll", 0, 0) == (3, None)
+    # the latest batch is kept whatever its size
+    feed.publish("root", "coll", [{"id": "e"}, {"id": "f"}, {"id": "g"}, {"id": "h"}])
+    assert feed.wait("root", "coll", 3, 0) == (4, [{"id": "e"}, {"id": "f"}, {"id": "g"}, {"id": "h"}])
+    assert feed.wait("root", "coll", 2, 0) == (4, None)
+
+
+def test_mongo_change_feed_reads_the_database(backend):
+    """
+    The MongoDB change feed returns the objects stored by any process, here
+    written straight to the database while a client waits.
+    """
+    if backend.type != "mongo":
+        pytest.skip("only the MongoDB backend reads the change feed from the database")
+    mongo = backend.app.medallion_backend
+    database = mongo.client["trustgroup1"]
+    sequence, objects = mongo.get_changes("trustgroup1", test.ADD_COLLECTION_ID, None, 0)
+    assert objects == []
+
+    new_objects = []
+    for name in ("first", "second"):
+        new_objects.append({
+            "type": "indicator",
+            "spec_version": "2.1",
+            "id": "indicator--" + str(uuid.uuid4()),
+            "created": "2020-01-27T13:49:53.935Z",
+            "modified": "2020-01-27T13:49:53.935Z",
+            "name": name,
+            "pattern": "[file:name = 'changes.exe']",
+            "pattern_type": "stix",
+            "valid_from": "2020-01-27T13:49:53.935Z",
+        })
+
+    def store():
+        request_time = common.get_timestamp()
+        for new_object in new_objects:
+            doc = mongodb_backend.prepare_new_object(copy.deepcopy(new_object), test.ADD_COLLECTION_ID, request_time)
+            doc["_sequence"] = mongodb_backend.reserve_sequences(database, test.ADD_COLLECTION_ID)
+            database["objects"].insert_one(doc)
+
+    writer = threading.Timer(0.2, store)
+    writer.start()
+    try:
+        with mock.patch.object(mongo, "change_feed_poll_interval", 0.05), mock.patch.object(mongo, "change_feed_size", 1):
+            assert mongo.get_changes("trustgroup1", test.ADD_COLLECTION_ID, sequence, 5) == (sequence + 1, new_objects[:1])
+            writer.join()
+            assert mongo.get_changes("trustgroup1", test.ADD_COLLECTION_ID, sequence + 1, 0) == (sequence + 2, new_objects[1:])
+        assert mongo.get_changes("trustgroup1", test.ADD_COLLECTION_ID, sequence + 2, 0) == (sequence + 2, [])
+        assert mongo.get_changes("trustgroup1", test.ADD_COLLECTION_ID, sequence + 3, 0) == (sequence + 2, None)
+    finally:
+        writer.join()
+        database["objects"].delete_many({"id": {"$in": [new_object["id"] for new_object in new_objects]}})
+
+
+def test_change_feed_refused_with_several_workers():
+    assert isinstance(changes.create_change_feed({}), changes.ChangeFeed)
+    feed = changes.create_change_feed({"workers": 4})
+    feed.publish("root", "coll", [{"id": "a"}])
+    with pytest.raises(exceptions.ProcessingError) as e:
+        feed.wait("root", "coll", None, 0)
+    assert e.value.status == 501
+
+
 def test_get_object_manifests(backend):
 
     r = backend.client.get(
@@ -1150,6 +1362,134 @@ def test_get_collections_401(backend):
     assert r.status_code == 401
 
 
+def test_parse_taxii_media_type():
+    views.parse_taxii_media_type.cache_clear()
+    assert views.parse_taxii_media_type("application/taxii+json;version=2.1") == (True, "2.1")
+    assert views.parse_taxii_media_type("text/html, application/taxii+json; version=2.0") == (True, "2.0")
+    assert views.parse_taxii_media_type("application/taxii+json") == (True, None)
+    assert views.parse_taxii_media_type("application/json") == (False, None)
+    assert views.parse_taxii_media_type("application/taxii+json;version=2.1") == (True, "2.1")
+    assert views.parse_taxii_media_type.cache_info().hits == 1
+
+
+def test_server_timing_and_metrics(backend):
+    r = backend.client.get(test.GET_OBJECTS_EP, headers=backend.headers)
+    assert "Server-Timing" not in r.headers
+    r = backend.client.get("/metrics", headers=backend.headers)
+    assert r.status_code == 404
+
+    INSTRUMENTATION.registry.clear()
+    INSTRUMENTATION.configure(server_timing=True, metrics=True)
+    untimed = backend.app.medallion_backend
+    try:
+        r = backend.client.get(test.GET_OBJECTS_EP, headers=backend.headers)
+        assert r.status_code == 200
+        # the back-end is only timed once wrapped, at startup in connect_to_backend
+        assert backend.app.medallion_backend is untimed
+        assert "backend.get_objects" not in r.headers["Server-Timing"]
+        backend.app.medallion_backend = INSTRUMENTATION.wrap(untimed)
+        assert INSTRUMENTATION.wrap(backend.app.medallion_backend) is backend.app.medallion_backend
+        INSTRUMENTATION.registry.clear()
+
+        r = backend.client.get(test.GET_OBJECTS_EP, headers=backend.headers)
+        assert r.status_code == 200
+        timings = {item.split(";")[0]: item for item in r.headers["Server-Timing"].split(", ")}
+        assert list(timings)[0] == "auth"
+        assert list(timings)[-1] == "total"
+        assert {"backend.get_api_root_information", "backend.get_collection", "backend.get_objects", "serialize"} <= set(timings)
+        if backend.type == "mongo":
+            # spec version, version, count and page pipelines, for the objects
+            # and again for the date added headers from their manifests
+            assert timings["mongodb.aggregate"].endswith(';desc="8 calls"')
+
+        r = backend.client.get("/metrics", headers=backend.headers)
+        assert r.status_code == 200
+        assert r.content_type.startswith("text/plain")
+        metrics = r.get_data(as_text=True).splitlines()
+        assert 'medallion_requests_total{endpoint="objects.get_or_add_objects",method="GET",status="200"} 1' in metrics
+        assert 'medallion_request_duration_seconds_count{endpoint="objects.get_or_add_objects",method="GET"} 1' in metrics
+        assert 'medallion_phase_duration_seconds_count{endpoint="objects.get_or_add_objects",phase="backend.get_objects"} 1' in metrics
+        assert any(line.startswith('medallion_phase_duration_seconds_bucket{endpoint="objects.get_or_add_objects",phase="auth",le="+Inf"}') for line in metrics)
+    finally:
+        INSTRUMENTATION.configure(server_timing=False, metrics=False)
+        INSTRUMENTATION.registry.clear()
+        backend.app.medallion_backend = untimed
+    assert INSTRUMENTATION.wrap(untimed) is untimed
+
+
+def test_mongo_pipeline_profiler(backend, caplog):
+    if backend.type != "mongo":
+        pytest.skip("only tested with the pymongo backend")
+    profiler = mongodb_filter.PIPELINE_PROFILER
+    database = backend.app.medallion_backend.client["trustgroup1"]
+    plan = {"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "COLLSCAN"}}}}
+    profiler.configure(enabled=True, explain=True, slow_ms=0)
+    try:
+        with mock.patch.object(type(database), "command", return_value=plan) as command:
+            with caplog.at_level(logging.INFO, logger="medallion.filters.mongodb_filter"):
+                r = backend.client.get(test.GET_OBJECTS_EP + "?match[type]=indicator", headers=backend.headers)
+    finally:
+        profiler.configure(enabled=False, explain=False)
+        profiler.slow_ms = None
+    assert r.status_code == 200
+    assert command.call_count == 8
+    assert all(call.args[0]["explain"]["aggregate"] == "objects" for call in command.call_args_list)
+    messages = [record.getMessage() for record in caplog.records]
+    assert len([m for m in messages if m.startswith("slow aggregation on trustgroup1.objects")]) == 8
+    assert len([m for m in messages if "scanned the whole collection" in m]) == 8
+
+
+def test_hashed_credentials(backend):
+    def basic_auth(username, password):
+        token = base64.b64encode("{}:{}".format(username, password).encode("utf-8")).decode("ascii")
+        return {"Accept": "application/taxii+json;version=2.1", "Authorization": "Basic " + token}
+
+    backend.app.users_config["hashed"] = generate_password_hash("Secret1")
+    try:
+        with mock.patch.object(credentials, "check_password", wraps=credentials.check_password) as check_password:
+            for _ in range(3):
+                r = backend.client.get(test.COLLECTIONS_EP, headers=basic_auth("hashed", "Secret1"))
+                assert r.status_code == 200
+            # the hash was verified once, for the first request
+            assert check_password.call_count == 1
+
+            for _ in range(2):
+                r = backend.client.get(test.COLLECTIONS_EP, headers=basic_auth("hashed", "Secret2"))
+                assert r.status_code == 401
+            assert check_password.call_count == 3
+    finally:
+        del backend.app.users_config["hashed"]
+        credentials.CREDENTIAL_CACHE.clear()
+
+
+def test_credential_cache():
+    credential = generate_password_hash("Secret1")
+    cache = credentials.VerificationCache(ttl=60, size=2)
+    now = time.monotonic()
+    with mock.patch("time.monotonic", return_value=now):
+        assert cache.verify("a", "Secret1", credential)
+        assert cache.verify("b", "Secret1", credential)
+        assert not cache.verify("c", "Secret2", credential)
+        assert len(cache.entries) == 2
+        assert cache.verify("c", "Secret1", credential)
+        # the least recently used entry made room for the new one
+        assert [username for username, _ in cache.entries] == ["b", "c"]
+        assert cache.verify("plain", "Secret1", "Secret1")
+        assert not cache.verify("plain", "Secret1", "Secret2")
+        assert len(cache.entries) == 2
+
+    with mock.patch.object(credentials, "check_password", return_value=False):
+        with mock.patch("time.monotonic", return_value=now + 30):
+            assert cache.verify("c", "Secret1", credential)
+        with mock.patch("time.monotonic", return_value=now + 61):
+            # expired entries must be verified again
+            assert not cache.verify("c", "Secret1", credential)
+
+    with pytest.raises(exceptions.InitializationError):
+        with mock.patch.object(credentials, "bcrypt", None):
+            credentials.check_credentials({"admin": "$2b$12$" + "a" * 53})
+
+
 def test_get_collections_404(backend):
     # note that the api root "carbon1" is nonexistent
     r = backend.client.get("/carbon1/collections/", headers=backend.headers)
@@ -1456,6 +1796,67 @@ def test_save_to_file(backend):
         assert data['trustgroup1']['collections'][3]['id'] == "52892447-4d7e-4f70-b94d-d7f22742ff63"
 
 
+def test_manifest_records(backend):
+    if backend.type != "memory":
+        pytest.skip()
+    backend_app = backend.app.medallion_backend
+    collection = backend_app.get_collection("trustgroup1", "91a7b528-80eb-42ed-a74d-c6fbd5a26116")
+    assert collection is not None
+    for c in backend_app._get("trustgroup1")["collections"]:
+        for man in c.get("manifest", []):
+            assert isinstance(man, common.ManifestRecord)
+            assert isinstance(man.date_added, float)
+            assert isinstance(man.version, float)
+
+    entry = {
+        "id": "indicator--cd981c25-8042-4166-8945-51178443bdac",
+        "date_added": "2016-11-03T12:30:59.001000Z",
+        "version": "2016-11-03T12:30:59.000Z",
+        "media_type": "application/stix+json;version=2.1",
+    }
+    record = common.ManifestRecord.from_dict(entry)
+    assert record.to_dict() == entry
+    assert record["date_added"] == entry["date_added"]
+    assert "media_type" in record
+    other = dict(entry, media_type="application/stix+json;version={}".format("2.1"))
+    assert record.media_type is common.ManifestRecord.from_dict(other).media_type
+
+
+def test_mongo_indexes(backend):
+    if backend.type != "mongo":
+        pytest.skip()
+    backend_app = backend.app.medallion_backend
+    api_root_db = backend_app.client["trustgroup1"]
+    assert backend_app.ensure_indexes() == []
+
+    # a database without indexes gets them at startup
+    api_root_db["objects"].drop_indexes()
+    created = backend_app.ensure_indexes()
+    assert len(created) == len(mongodb_backend.API_ROOT_INDEXES["objects"])
+    assert backend_app.ensure_indexes() == []
+
+
+@pytest.mark.parametrize("collection_name, query, sort", [
+    ("objects", {"_collection_id": "91a7b528-80eb-42ed-a74d-c6fbd5a26116", "id": "indicator--cd981c25-8042-4166-8945-51178443bdac"}, None),
+    ("objects", {"_collection_id": "91a7b528-80eb-42ed-a74d-c6fbd5a26116", "id": "indicator--cd981c25-8042-4166-8945-51178443bdac",
+                 "_manifest.version": 1478176259.0}, None),
+    ("objects", {"_collection_id": "91a7b528-80eb-42ed-a74d-c6fbd5a26116", "id": "indicator--cd981c25-8042-4166-8945-51178443bdac",
+                 "_manifest.media_type": "application/stix+json;version=2.1"}, None),
+    ("objects", {"_collection_id": "91a7b528-80eb-42ed-a74d-c6fbd5a26116"}, "_manifest.date_added"),
+    ("objects", {"_collection_id": "91a7b528-80eb-42ed-a74d-c6fbd5a26116", "_manifest.date_added": {"$gt": 1478176259.0}}, "_manifest.date_added"),
+    ("collections", {"id": "91a7b528-80eb-42ed-a74d-c6fbd5a26116"}, None),
+    ("status", {"id": "2d086da7-4bdc-4f91-900e-d77486753710"}, None),
+])
+def test_mongo_query_uses_index(backend, collection_name, query, sort):
+    if backend.type != "mongo":
+        pytest.skip()
+    cursor = backend.app.medallion_backend.client["trustgroup1"][collection_name].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    winning_plan = cursor.explain()["queryPlanner"]["winningPlan"]
+    assert "COLLSCAN" not in json.dumps(winning_plan)
+
+
 def test_status_cleanup(backend_without_threads):
     backend_app = backend_without_threads.app.medallion_backend
     # add a status with the current time, which should not be deleted.
@@ -1530,3 +1931,457 @@ def test_get_objects_match_type_spec_version(backend):
     assert obj['objects'][0]['type'] == "indicator"
     assert obj['objects'][0]['id'] == object_id
     assert obj['objects'][0]['spec_version'] == "2.0"
+
+
+@pytest.mark.parametrize("store_config", [
+    {"session_store": "mongo"},
+    {"session_store": "signed", "session_secret": "shared secret"},
+])
+def test_mongo_shared_pagination_sessions(backend, store_config):
+    if backend.type != "mongo":
+        pytest.skip("only the MongoDB backend shares pagination sessions")
+    config = dict(backend.configuration["backend"], clear_db=False, run_cleanup_threads=False, **store_config)
+    first, second = mongodb_backend.MongoBackend(**config), mongodb_backend.MongoBackend(**config)
+    original = backend.app.medallion_backend
+    try:
+        # the first page is served by one server process, the next by another
+        backend.app.medallion_backend = first
+        r = backend.client.get(test.GET_OBJECTS_EP + "?match[version]=all&limit=2", headers=backend.headers)
+        assert r.status_code == 200
+        page_one = r.json
+        assert page_one["more"]
+
+        backend.app.medallion_backend = second
+        r = backend.client.get(
+            test.GET_OBJECTS_EP + "?match[version]=all&limit=2&next=" + page_one["next"],
+            headers=backend.headers,
+        )
+        assert r.status_code == 200
+        page_two = r.json
+        assert not {obj["id"] + obj["modified"] for obj in page_one["objects"] if "modified" in obj} & \
+            {obj["id"] + obj["modified"] for obj in page_two["objects"] if "modified" in obj}
+
+        r = backend.client.get(
+            test.GET_OBJECTS_EP + "?match[version]=first&limit=2&next=" + page_one["next"],
+            headers=backend.headers,
+        )
+        assert r.status_code == 400
+    finally:
+        backend.app.medallion_backend = original
+
+
+def test_create_session_store():
+    create = mongodb_backend.create_session_store
+    assert isinstance(create({}), sessions.MemorySessionStore)
+    assert isinstance(create({"session_secret": "shared secret"}), sessions.SignedTokenStore)
+    assert isinstance(create({"session_store": "memory", "session_secret": "shared secret"}), sessions.MemorySessionStore)
+    with pytest.raises(exceptions.InitializationError):
+        create({"session_store": "signed"})
+    with pytest.raises(exceptions.InitializationError):
+        create({"session_store": "redis"})
+
+
+def test_memory_session_store_expiry():
+    store = sessions.MemorySessionStore()
+    now = common.datetime_to_float(common.get_timestamp())
+    fresh = store.save(None, {"request_time": now})
+    stale = store.save(None, {"request_time": now - 60})
+    store.expire(30)
+    assert store.get(fresh) is not None
+    assert store.get(stale) is None
+    store.pop(fresh)
+    store.pop(fresh)
+    assert len(store) == 0
+
+
+def test_memory_session_store_refreshed_session():
+    store = sessions.MemorySessionStore()
+    now = common.datetime_to_float(common.get_timestamp())
+    record = {"request_time": now - 60}
+    next_id = store.save(None, record)
+    # the session is used again, after its heap entry was pushed
+    record["request_time"] = now
+    store.save(next_id, record)
+    assert len(store.deadlines) == 1
+    store.expire(30)
+    assert store.get(next_id) is record
+    assert len(store.deadlines) == 1
+
+
+def test_memory_object_index(backend):
+    if backend.type != "memory":
+        pytest.skip("only the memory backend keeps an object index")
+    memory = backend.app.medallion_backend
+    object_id = backend.TEST_OBJECT["objects"][0]["id"]
+    collection_id = test.ADD_COLLECTION_ID
+    r_post = backend.client.post(
+        test.ADD_OBJECTS_EP,
+        data=json.dumps(copy.deepcopy(backend.TEST_OBJECT)),
+        headers=backend.post_headers,
+    )
+    assert r_post.status_code == 202
+    objs, manifests = memory.object_index[("trustgroup1", collection_id)][object_id]
+    assert [obj["id"] for obj in objs] == [object_id]
+    assert [man.id for man in manifests] == [object_id]
+
+    r = backend.client.delete(test.ADD_OBJECTS_EP + object_id + "/", headers=backend.headers)
+    assert r.status_code == 200
+    assert memory.object_index[("trustgroup1", collection_id)][object_id] == ([], [])
+    r = backend.client.get(test.ADD_OBJECTS_EP + object_id + "/", headers=backend.headers)
+    assert r.status_code == 404
+
+
+def test_memory_delete_object_versions(backend):
+    if backend.type != "memory":
+        pytest.skip("only the memory backend keeps an object index")
+    memory = backend.app.medallion_backend
+    collection_id = test.ADD_COLLECTION_ID
+    object_id = "indicator--" + str(uuid.uuid4())
+    versions = backend.INDICATOR_VERSIONS
+    new_objects = backend.indicator_versions(object_id)
+    r_post = backend.client.post(test.ADD_OBJECTS_EP, data=json.dumps(new_objects), headers=backend.post_headers)
+    assert r_post.status_code == 202
+
+    r = backend.client.delete(test.ADD_OBJECTS_EP + object_id + "/?match[version]=first,last", headers=backend.headers)
+    assert r.status_code == 200
+    objs, manifests = memory.object_index[("trustgroup1", collection_id)][object_id]
+    assert [obj["modified"] for obj in objs] == [versions[1]]
+    assert [man.version for man in manifests] == [common.datetime_to_float(common.string_to_datetime(versions[1]))]
+    collection = next(c for c in memory.data["trustgroup1"]["collections"] if c["id"] == collection_id)
+    assert [obj for obj in collection["objects"] if obj["id"] == object_id] == objs
+    assert [man for man in collection["manifest"] if man.id == object_id] == manifests
+
+
+def test_collection_entries():
+    items = [{"id": str(i)} for i in range(6)]
+    entries = memory_backend.CollectionEntries(items[:4])
+    entries.remove(items[1])
+    entries.append(items[4])
+    # the removed entry is a tombstone until half the list is
+    assert entries.items == [items[0], None, items[2], items[3], items[4]]
+    assert list(entries) == [items[0], items[2], items[3], items[4]]
+    assert len(entries) == 4
+    reader = iter(entries)
+    entries.remove(items[3])
+    entries.remove(items[0])
+    assert entries.items == [items[2], items[4]]
+    entries.append(items[5])
+    entries.remove(items[2])
+    assert list(entries) == [items[4], items[5]]
+    # a reader goes on with the list it started on once it is compacted
+    assert list(reader) == [items[2], items[4]]
+    assert json.loads(json.dumps({"objects": entries}, default=memory_backend.manifest_to_serializable)) == {"objects": items[4:]}
+
+    # entries appended by concurrent requests are all removed from their positions
+    batches = [[{"id": "{}-{}".format(n, i)} for i in range(500)] for n in range(4)]
+    entries = memory_backend.CollectionEntries()
+    writers = [threading.Thread(target=lambda batch=batch: [entries.append(item) for item in batch]) for batch in batches]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    for batch in batches:
+        for item in batch[::2]:
+            entries.remove(item)
+    assert sorted(item["id"] for item in entries) == sorted(item["id"] for batch in batches for item in batch[1::2])
+
+
+def test_memory_responses_leave_stored_data_untouched(backend):
+    if backend.type != "memory":
+        pytest.skip("only the memory backend serves objects from its own data")
+    memory = backend.app.medallion_backend
+    collection_id = test.ADD_COLLECTION_ID
+    # no created or modified, so the backend stores a hidden _date_added
+    sco = {"type": "file", "spec_version": "2.1", "id": "file--" + str(uuid.uuid4()), "name": "a.exe"}
+    r_post = backend.client.post(test.ADD_OBJECTS_EP, data=json.dumps({"objects": [sco]}), headers=backend.post_headers)
+    assert r_post.status_code == 202
+
+    r = backend.client.get(test.ADD_OBJECTS_EP + "?match[id]=" + sco["id"], headers=backend.headers)
+    assert r.json["objects"] == [sco]
+    stored, _ = memory.object_index[("trustgroup1", collection_id)][sco["id"]]
+    assert "_date_added" in stored[0]
+
+    collection = memory.get_collection("trustgroup1", collection_id)
+    assert "objects" not in collection and "manifest" not in collection
+    collection["title"] = "changed"
+    assert memory.get_collection("trustgroup1", collection_id)["title"] != "changed"
+    assert all("objects" not in c for c in memory.get_collections("trustgroup1")["collections"])
+
+
+def test_expiry_heap():
+    heap = common.ExpiryHeap()
+    for timestamp, item in ((30, "c"), (10, "a"), (20, "b"), (10, "a2")):
+        heap.push(timestamp, item)
+    assert list(heap.pop_older_than(20)) == [(10, "a"), (10, "a2")]
+    assert len(heap) == 2
+    assert list(heap.pop_older_than(100)) == [(20, "b"), (30, "c")]
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_maintenance_scheduler(workers):
+    scheduler = common.MaintenanceScheduler(jitter=0.5, workers=workers)
+    calls = []
+    job = scheduler.schedule(0.02, lambda: calls.append(1), name="append")
+    failing = scheduler.schedule(0.02, lambda: 1 / 0, name="fail")
+    scheduler.start()
+    try:
+        _wait_for(lambda: len(calls) >= 3 and failing.failures >= 2)
+        metrics = {m["name"]: m for m in scheduler.metrics()}
+        assert metrics["append"]["runs"] >= 3
+        assert metrics["append"]["failures"] == 0
+        assert metrics["fail"]["failures"] == metrics["fail"]["runs"]
+        scheduler.cancel(job)
+        _wait_for(lambda: job not in scheduler.jobs)
+        # a run already under way when the job was cancelled still completes
+        time.sleep(0.05)
+        runs = job.runs
+        time.sleep(0.1)
+        assert job.runs == runs
+    finally:
+        scheduler.stop()
+    assert not scheduler.running
+    runs = failing.runs
+    time.sleep(0.1)
+    assert failing.runs == runs
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_maintenance_scheduler_lists_running_jobs(workers):
+    scheduler = common.MaintenanceScheduler(workers=workers)
+    running = threading.Event()
+    release = threading.Event()
+
+    def block():
+        running.set()
+        release.wait(5)
+
+    job = scheduler.schedule(0.01, block, name="block")
+    scheduler.start()
+    try:
+        assert running.wait(5)
+        assert scheduler.jobs == [job]
+        assert [m["name"] for m in scheduler.metrics()] == ["block"]
+    finally:
+        scheduler.cancel(job)
+        release.set()
+        scheduler.stop()
+    assert scheduler.jobs == []
+
+
+def test_maintenance_scheduler_drops_collected_targets():
+    class Target(object):
+        def run(self):
+            pass
+
+    scheduler = common.MaintenanceScheduler()
+    target = Target()
+    job = scheduler.schedule(0.01, target.run)
+    scheduler.start()
+    try:
+        _wait_for(lambda: job.runs > 0)
+        del target
+        gc.collect()
+        _wait_for(lambda: not scheduler.jobs)
+    finally:
+        scheduler.stop()
+
+
+def test_signed_token_store():
+    store = sessions.SignedTokenStore("secret", 30)
+    now = common.datetime_to_float(common.get_timestamp())
+    fingerprint = sessions.args_fingerprint({"match[type]": {"indicator", "malware"}})
+    assert fingerprint == sessions.args_fingerprint({"match[type]": {"malware", "indicator"}})
+    record = {"skip": 40, "limit": 20, "after": 117, "fingerprint": fingerprint, "request_time": now}
+    token = store.save(None, record)
+    assert store.get(token) == dict(record, request_time=int(now))
+    # another process sharing the secret accepts the token, others do not
+    assert sessions.SignedTokenStore("secret", 30).get(token) is not None
+    assert sessions.SignedTokenStore("other", 30).get(token) is None
+    payload, _, signature = token.rpartition(".")
+    assert store.get(payload.replace("28", "14", 1) + "." + signature) is None
+    assert store.get("not-a-token") is None
+    assert store.get("caf\u00e9." + signature) is None
+    assert store.get("1.2." + store._sign("1.2")) is None
+    assert store.get(store.save(None, dict(record, request_time=now - 60))) is None
+    assert store.get(store.save(None, dict(record, after=None)))["after"] is None
+
+
+def test_mongo_status_expiry(backend):
+    if backend.type != "mongo":
+        pytest.skip("only the MongoDB backend expires statuses with a TTL index")
+    client = backend.app.medallion_backend.client
+    db = client["status_expiry_test"]
+    try:
+        request_timestamp = common.datetime_to_string(common.get_timestamp())
+        status = common.generate_status(request_timestamp, "complete", 1, 0, 0)
+        db["status"].insert_one(status)
+
+        mongodb_backend.ensure_status_expiry(db, SECONDS_IN_24_HOURS)
+        stored = db["status"].find_one({"id": status["id"]})
+        # BSON dates have millisecond precision
+        expected = common.string_to_datetime(request_timestamp)
+        assert abs((stored["_request_date"] - expected).total_seconds()) < 0.001
+        ttl_indexes = [
+            info for info in db["status"].index_information().values()
+            if info["key"] == mongodb_backend.STATUS_EXPIRY_KEY
+        ]
+        assert [info["expireAfterSeconds"] for info in ttl_indexes] == [SECONDS_IN_24_HOURS]
+
+        mongodb_backend.ensure_status_expiry(db, -1)
+        assert not any(
+            info["key"] == mongodb_backend.STATUS_EXPIRY_KEY
+            for info in db["status"].index_information().values()
+        )
+    finally:
+        client.drop_database("status_expiry_test")
+
+
+def test_mongo_status_expiry_without_cleanup_threads(backend):
+    if backend.type != "mongo":
+        pytest.skip("only the MongoDB backend expires statuses with a TTL index")
+    config = dict(TaxiiTest.mongodb_config["backend"], run_cleanup_threads=False, status_retention=2 * SECONDS_IN_24_HOURS)
+    del config["module_class"]
+    backend_app = mongodb_backend.MongoBackend(**config)
+    ttl_indexes = [
+        info for info in backend_app.client["trustgroup1"]["status"].index_information().values()
+        if info["key"] == mongodb_backend.STATUS_EXPIRY_KEY
+    ]
+    assert [info["expireAfterSeconds"] for info in ttl_indexes] == [2 * SECONDS_IN_24_HOURS]
+
+
+def test_mongo_object_sequences(backend):
+    if backend.type != "mongo":
+        pytest.skip("only the MongoDB backend stores ingest sequence numbers")
+    client = backend.app.medallion_backend.client
+    db = client["sequence_test"]
+    try:
+        db["objects"].insert_many([
+            {"id": "b", "_collection_id": "c1", "_manifest": {"date_added": 20.0}},
+            {"id": "a", "_collection_id": "c1", "_manifest": {"date_added": 10.0}},
+            {"id": "x", "_collection_id": "c2", "_manifest": {"date_added": 30.0}},
+        ])
+        db["collections"].insert_many([{"id": "c1"}, {"id": "c2"}, {"id": "c3"}])
+        unnumbered = mongodb_backend.find_unnumbered_collections(client, ["sequence_test", "missing_root"])
+        assert sorted(unnumbered) == [("sequence_test", "c1"), ("sequence_test", "c2")]
+        assert mongodb_backend.ensure_object_sequences(db) == 3
+        assert mongodb_backend.find_unnumbered_collections(client, ["sequence_test"]) == []
+        assert mongodb_backend.ensure_object_sequences(db) == 0
+        numbered = {doc["id"]: doc["_sequence"] for doc in db["objects"].find()}
+        assert numbered == {"a": 1, "b": 2, "x": 1}
+        assert mongodb_backend.reserve_sequences(db, "c1", 2) == 3
+        assert mongodb_backend.reserve_sequences(db, "c1") == 5
+    finally:
+        client.drop_database("sequence_test")
+
+
+def test_mongo_migrate_object_sequences(backend, caplog):
+    if backend.type != "mongo":
+        pytest.skip("only the MongoDB backend stores ingest sequence numbers")
+    client = backend.app.medallion_backend.client
+    objects_info = client["trustgroup1"]["objects"]
+    sequences = {doc["_id"]: doc["_sequence"] for doc in objects_info.find({}, {"_sequence": 1})}
+    counters = list(client["trustgroup1"]["sequences"].find())
+    objects_info.update_many({}, {"$unset": {"_sequence": ""}})
+    client["trustgroup1"]["sequences"].delete_many({})
+    try:
+        with caplog.at_level(logging.WARNING, logger="medallion.backends.mongodb_backend"):
+            assert ("trustgroup1", test.ADD_COLLECTION_ID) in backend.app.medallion_backend.check_object_sequences()
+        assert "medallion-migrate" in caplog.text
+        numbered = mongodb_backend.migrate_object_sequences(client)
+        assert numbered["trustgroup1"] == len(sequences)
+        assert backend.app.medallion_backend.check_object_sequences() == []
+        assert objects_info.count_documents({"_sequence": {"$exists": False}}) == 0
+        assert mongodb_backend.migrate_object_sequences(client)["trustgroup1"] == 0
+    finally:
+        # the other tests share the database
+        for _id, sequence in sequences.items():
+            objects_info.update_one({"_id": _id}, {"$set": {"_sequence": sequence}})
+        client["trustgroup1"]["sequences"].delete_many({})
+        client["trustgroup1"]["sequences"].insert_many(counters)
+
+
+def test_mongo_add_objects_reserves_one_block(backend):
+    if backend.type != "mongo":
+        pytest.skip("only the MongoDB backend stores ingest sequence numbers")
+    object_ids = ["indicator--" + str(uuid.uuid4()) for _ in range(2)]
+    new_objects = backend.indicator_versions(*object_ids)
+    # the same version twice in one request is stored once
+    new_objects["objects"].append(copy.deepcopy(new_objects["objects"][0]))
+    with mock.patch.object(mongodb_backend, "reserve_sequences", wraps=mongodb_backend.reserve_sequences) as reserve:
+        r_post = backend.client.post(test.ADD_OBJECTS_EP, data=json.dumps(new_objects), headers=backend.post_headers)
+    assert r_post.status_code == 202
+    assert r_post.json["success_count"] == 7
+    reserve.assert_called_once_with(mock.ANY, test.ADD_COLLECTION_ID, 6)
+    objects_info = backend.app.medallion_backend.client["trustgroup1"]["objects"]
+    sequences = [doc["_sequence"] for doc in objects_info.find({"id": {"$in": object_ids}}).sort("_sequence", 1)]
+    assert sequences == list(range(sequences[0], sequences[0] + 6))
+    for object_id in object_ids:
+        r = backend.client.delete(test.ADD_OBJECTS_EP + object_id + "/?match[version]=all", headers=backend.headers)
+        assert r.status_code == 200
+
+
+def test_mongo_pagination_continues_after_last_object(backend):
+    if backend.type != "mongo":
+        pytest.skip("only the MongoDB backend paginates by ingest sequence")
+
+    def versions(objects):
+        return [(obj["id"], obj.get("modified")) for obj in objects]
+
+    r = backend.client.get(test.GET_OBJECTS_EP + "?match[version]=all", headers=backend.headers)
+    everything = versions(r.json["objects"])
+    r = backend.client.get(test.GET_OBJECTS_EP + "?match[version]=all&limit=2", headers=backend.headers)
+    page_one = r.json
+    assert versions(page_one["objects"]) == everything[:2]
+
+    # removing an object already returned does not shift the next page
+    objects_info = backend.app.medallion_backend.client["trustgroup1"]["objects"]
+    removed = objects_info.find_one_and_delete({"id": page_one["objects"][0]["id"]})
+    try:
+        r = backend.client.get(
+            test.GET_OBJECTS_EP + "?match[version]=all&limit=2&next=" + page_one["next"],
+            headers=backend.headers,
+        )
+        assert r.status_code == 200
+        assert versions(r.json["objects"]) == everything[2:4]
+    finally:
+        objects_info.insert_one(removed)
+
+
+def test_mongo_delete_object_versions_at_once(backend):
+    if backend.type != "mongo":
+        pytest.skip("only checks the queries of the MongoDB backend")
+    object_id = "indicator--" + str(uuid.uuid4())
+    new_objects = backend.indicator_versions(object_id)
+    r_post = backend.client.post(test.ADD_OBJECTS_EP, data=json.dumps(new_objects), headers=backend.post_headers)
+    assert r_post.status_code == 202
+
+    objects_info = backend.app.medallion_backend.client["trustgroup1"]["objects"]
+    collection_cls = type(objects_info)
+    with mock.patch.object(collection_cls, "delete_one") as delete_one, \
+            mock.patch.object(collection_cls, "delete_many", autospec=True, side_effect=collection_cls.delete_many) as delete_many:
+        r = backend.client.delete(test.ADD_OBJECTS_EP + object_id + "/?match[version]=all", headers=backend.headers)
+    assert r.status_code == 200
+    delete_one.assert_not_called()
+    assert delete_many.call_count == 1
+    assert objects_info.count_documents({"id": object_id}) == 0
+
+
+def test_mongo_load_bundle_objects_unknown_collection(backend):
+    if backend.type != "mongo":
+        pytest.skip("only the MongoDB backend loads bundles")
+    client = backend.app.medallion_backend.client
+    mongodb_backend.check_collection_exists(client, "trustgroup1", test.ADD_COLLECTION_ID)
+    objects = [{"id": "indicator--" + str(uuid.uuid4()), "type": "indicator"}]
+    count = client["trustgroup1"]["objects"].count_documents({})
+    for api_root, collection_id in (("no-such-root", test.ADD_COLLECTION_ID), ("trustgroup1", "no-such-collection")):
+        with pytest.raises(exceptions.ProcessingError) as e:
+            mongodb_backend.load_bundle_objects(client, api_root, collection_id, objects, common.get_timestamp())
+        assert e.value.status == 404
+    assert client["trustgroup1"]["objects"].count_documents({}) == count
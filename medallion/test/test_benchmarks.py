@@ -0,0 +1,158 @@
+import copy
+import threading
+
+import pytest
+import werkzeug.serving
+
+from medallion.benchmarks import endpoints, loadgen
+from medallion.scripts.generate import CorpusGenerator, write_seed_file
+
+pytestmark = pytest.mark.usefixtures("empty_environ")
+
+
+def test_run_benchmark():
+    """
+    Confirm that every scenario runs without errors against a small collection.
+    """
+    results = endpoints.run(backends=("memory",), sizes=(20,), versions=2, requests=3, warmup=1, page_size=5)
+    assert len(results) == 1
+    assert results[0]["engine"] == "memory"
+    scenarios = results[0]["scenarios"]
+    assert set(scenarios) == set(endpoints.EXPECTED_RESOURCES)
+    for name, timing in scenarios.items():
+        assert timing["requests"] == 3
+        assert timing["errors"] == 0, (name, timing["error_kinds"])
+        assert timing["latency_ms"]["p50"] <= timing["latency_ms"]["max"]
+
+
+def test_response_error():
+    """
+    Confirm that responses without the expected resource are told apart.
+    """
+    class Response(object):
+        def __init__(self, json, status_code=200):
+            self.json = json
+            self.status_code = status_code
+
+    envelope = endpoints.EXPECTED_RESOURCES["objects"]
+    assert endpoints.response_error(Response({"more": False, "objects": [{}]}), envelope) is None
+    assert endpoints.response_error(Response({"more": True, "objects": [{}], "next": "1"}), envelope) is None
+    assert endpoints.response_error(Response({}), envelope) == "no bool more"
+    assert endpoints.response_error(Response({"more": True, "objects": [{}]}), envelope) == "more without next"
+    assert endpoints.response_error(Response(None, 404), envelope) == "404"
+    assert endpoints.response_error(Response({}), {}) is None
+    assert endpoints.engine("memory", endpoints.MONGOMOCK_URI) == "memory"
+    assert endpoints.engine("mongo", endpoints.MONGOMOCK_URI) == "mongomock"
+    assert endpoints.engine("mongo", "mongodb://localhost:27017/") == "mongodb"
+
+
+def test_manifest_latency():
+    """
+    Guard the Get Object Manifest latency of the Memory back-end: with 600
+    objects of two versions and spec versions, per entry filtering which
+    scans the whole manifest takes over a second, linear filtering a few
+    milliseconds.
+    """
+    results = endpoints.run(
+        backends=("memory",), sizes=(600,), versions=2, spec_versions=("2.0", "2.1"), requests=5, warmup=1,
+        page_size=1000, scenarios=("manifest",),
+    )
+    timing = results[0]["scenarios"]["manifest"]
+    assert timing["errors"] == 0
+    assert timing["latency_ms"]["p50"] < 150
+
+
+def test_compare():
+    """
+    Confirm that slower median latencies than the baseline are reported.
+    """
+    timing = {"latency_ms": {"p50": 10.0}}
+    result = {
+        "backend": "mongo", "engine": "mongodb", "objects": 20, "versions": 1, "spec_versions": ["2.1"],
+        "scenarios": {"objects": timing},
+    }
+    slower = copy.deepcopy(result)
+    slower["scenarios"]["objects"]["latency_ms"]["p50"] = 12.0
+    assert endpoints.compare({"results": [result]}, [result]) == []
+    assert endpoints.compare({"results": [result]}, [slower]) == [(("mongodb", 20, 1, ("2.1",)), "objects", 10.0, 12.0, 1.2)]
+    assert endpoints.compare({"results": [result]}, [slower], tolerance=0.5) == []
+
+    # mongomock results, or results of older runs without an engine, are not compared with MongoDB ones
+    mongomock = dict(slower, engine="mongomock")
+    assert endpoints.compare({"results": [result]}, [mongomock]) == []
+    unlabelled = {name: value for name, value in result.items() if name != "engine"}
+    assert endpoints.compare({"results": [unlabelled]}, [slower]) == []
+    assert endpoints.percentile([1, 2, 3, 4], 0.5) == 2
+
+
+@pytest.fixture
+def seeded_client(tmp_path):
+    seed_file = tmp_path / "seed.json"
+    with open(seed_file, "w", encoding="utf-8") as f:
+        write_seed_file(f, CorpusGenerator().objects(30), endpoints.API_ROOT, endpoints.COLLECTION_ID)
+    with endpoints.benchmark_client("memory", str(seed_file), 10, endpoints.MONGOMOCK_URI) as client:
+        yield client
+
+
+def test_load_generation(seeded_client):
+    """
+    Confirm that simulated clients run every action without errors, and that
+    pollers pick up the objects added after their previous poll.
+    """
+    transport = loadgen.AppTransport(seeded_client.application)
+    api_root, collection_id = loadgen.resolve_target(transport)
+    assert (api_root, collection_id) == ("/bench/", endpoints.COLLECTION_ID)
+
+    client = loadgen.SimulatedClient(0, transport, api_root, collection_id, loadgen.DEFAULT_MIX, page_size=10)
+    caught_up = client.added_after
+    client.add()
+    client.poll()
+    assert client.added_after > caught_up
+    assert [error for _, _, error in client.records] == [None, None]
+
+    stages = loadgen.run(transport, api_root, collection_id, clients=(1, 3), duration=0.3, page_size=10)
+    assert [stage["clients"] for stage in stages] == [1, 3]
+    for stage in stages:
+        assert stage["requests"] > 0
+        assert stage["errors"] == 0, stage["error_kinds"]
+        assert set(stage["actions"]) <= set(loadgen.ACTIONS)
+        assert sum(action["requests"] for action in stage["actions"].values()) == stage["requests"]
+
+
+def test_load_generation_http(seeded_client):
+    """
+    Confirm that simulated clients reach a running server over HTTP.
+    """
+    server = werkzeug.serving.make_server("127.0.0.1", 0, seeded_client.application, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        transport = loadgen.HTTPTransport(
+            "http://127.0.0.1:{}/".format(server.server_port), endpoints.USERNAME, endpoints.PASSWORD,
+        )
+        api_root, collection_id = loadgen.resolve_target(transport)
+        stage = loadgen.run_stage(transport, api_root, collection_id, 2, 0.3, loadgen.DEFAULT_MIX, page_size=10)
+        assert stage["requests"] > 0
+        assert stage["errors"] == 0, stage["error_kinds"]
+
+        bad = loadgen.HTTPTransport("http://127.0.0.1:{}/".format(server.server_port), endpoints.USERNAME, "wrong")
+        stage = loadgen.run_stage(bad, api_root, collection_id, 1, 0.1, {"discovery": 1})
+        assert stage["error_rate"] == 1.0
+        assert set(stage["error_kinds"]) == {"401"}
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def test_saturation():
+    """
+    Confirm that saturation is reported once the throughput stops growing or
+    errors appear.
+    """
+    def stage(clients, throughput, error_rate=0.0):
+        return {"clients": clients, "throughput": throughput, "error_rate": error_rate}
+
+    assert loadgen.saturation([stage(1, 100), stage(2, 190), stage(4, 360)]) is None
+    assert loadgen.saturation([stage(1, 100), stage(2, 190), stage(4, 200)]) == 2
+    assert loadgen.saturation([stage(1, 100), stage(2, 190, error_rate=0.05)]) == 1
+    assert loadgen.saturation([stage(1, 100), stage(2, 105)], growth=0.01) is None
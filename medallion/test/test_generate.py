@@ -0,0 +1,157 @@
+import datetime as dt
+import io
+import json
+from unittest import mock
+
+import pytest
+import pytz
+
+from medallion.backends import mongodb_backend
+from medallion.backends.memory_backend import MemoryBackend
+from medallion.common import APPLICATION_INSTANCE, string_to_datetime
+import medallion.scripts.generate
+
+pytestmark = pytest.mark.usefixtures("empty_environ")
+
+
+def date_added(entry):
+    return pytz.UTC.localize(string_to_datetime(entry["date_added"]))
+
+
+def test_parser_help(capsys):
+    """
+    Confirm that the generator parser help can be printed.
+    """
+    parser = medallion.scripts.generate._get_argparser()
+    parser.print_help()
+    (out, _) = capsys.readouterr()
+    assert "medallion-generate v" in out
+
+
+def test_parse_arguments():
+    """
+    Confirm that type weights and version ranges are parsed.
+    """
+    assert medallion.scripts.generate.parse_weights("2.0=1,2.1=3") == {"2.0": 1.0, "2.1": 3.0}
+    assert medallion.scripts.generate.parse_weights("indicator,malware=2") == {"indicator": 1.0, "malware": 2.0}
+    assert medallion.scripts.generate.parse_versions("3") == (3, 3)
+    assert medallion.scripts.generate.parse_versions("1-5") == (1, 5)
+
+
+def test_corpus_generator():
+    """
+    Confirm that the corpus is reproducible and follows the requested type
+    mix, versions, spec versions and date_added range.
+    """
+    generator = medallion.scripts.generate.CorpusGenerator(
+        sdo_types={"indicator": 1, "relationship": 1}, sco_types={"ipv4-addr": 1}, sco_ratio=0.5,
+        versions=(2, 3), spec_versions={"2.0": 1, "2.1": 1}, date_added="uniform", seed=1,
+    )
+    pairs = list(generator.objects(200))
+    assert pairs == list(generator.objects(200))
+
+    ids = {obj["id"] for obj, _ in pairs}
+    assert len(ids) == 200
+    assert {obj["type"] for obj, _ in pairs} == {"indicator", "relationship", "ipv4-addr"}
+    scos = [obj for obj, _ in pairs if obj["type"] == "ipv4-addr"]
+    assert 60 < len(scos) < 140
+    assert len(pairs) - len(scos) >= 2 * (200 - len(scos))
+
+    for obj, entry in pairs:
+        assert entry["id"] == obj["id"]
+        assert medallion.scripts.generate.DEFAULT_START <= date_added(entry)
+        if obj["type"] == "ipv4-addr":
+            assert "created" not in obj
+            assert entry["version"] == entry["date_added"]
+            assert entry["media_type"] == "application/stix+json;version=2.1"
+        else:
+            assert entry["version"] == obj["modified"]
+            assert entry["media_type"] == "application/stix+json;version={}".format(obj.get("spec_version", "2.0"))
+        if obj["type"] == "relationship":
+            assert obj["source_ref"] in ids and obj["target_ref"] in ids
+
+
+def test_recent_date_added():
+    """
+    Confirm that the recent distribution adds most objects near the end of the range.
+    """
+    generator = medallion.scripts.generate.CorpusGenerator(date_added="recent")
+    middle = medallion.scripts.generate.DEFAULT_START + (
+        medallion.scripts.generate.DEFAULT_END - medallion.scripts.generate.DEFAULT_START
+    ) / 2
+    recent = [date_added(entry) > middle for _, entry in generator.objects(200)]
+    assert sum(recent) > 180
+
+
+def test_invalid_settings():
+    """
+    Confirm that impossible settings are refused.
+    """
+    with pytest.raises(ValueError):
+        medallion.scripts.generate.CorpusGenerator(date_added="normal")
+    with pytest.raises(ValueError):
+        medallion.scripts.generate.CorpusGenerator(versions=(3, 2))
+    with pytest.raises(ValueError):
+        medallion.scripts.generate.CorpusGenerator(sco_ratio=2)
+
+
+def test_write_seed_file():
+    """
+    Confirm that a streamed seed file is loaded by the Memory back-end and
+    that its SCOs can be stored by the Mongo DB back-end.
+    """
+    generator = medallion.scripts.generate.CorpusGenerator(sco_ratio=0.5, versions=(1, 2), seed=2)
+    outfile = io.StringIO()
+    written = medallion.scripts.generate.write_seed_file(outfile, generator.objects(50))
+    assert written == len(list(generator.objects(50)))
+
+    outfile.seek(0)
+    with mock.patch.object(APPLICATION_INSTANCE, "taxii_config", {}, create=True):
+        backend = MemoryBackend(filename=outfile, run_cleanup_threads=False)
+    collection_id = medallion.scripts.generate.DEFAULT_COLLECTION_ID
+    resource, _ = backend.get_objects("synthetic", collection_id, {"match[version]": "all"}, ("version",), 1000)
+    assert len(resource["objects"]) == written
+    assert not any("_date_added" in obj for obj in resource["objects"])
+
+    outfile.seek(0)
+    seed = json.load(outfile)
+    collection = seed["synthetic"]["collections"][0]
+    sco, entry = next(
+        (obj, entry) for obj, entry in zip(collection["objects"], collection["manifest"]) if "created" not in obj
+    )
+    document = mongodb_backend.prepare_seed_object(dict(sco), collection_id, dict(entry))
+    assert "_date_added" not in document and "created" not in document
+    assert isinstance(document["_manifest"]["version"], float)
+
+
+def test_write_bundles(tmp_path):
+    """
+    Confirm that the corpus is split into bundles of the requested size.
+    """
+    generator = medallion.scripts.generate.CorpusGenerator(seed=3)
+    written = medallion.scripts.generate.write_bundles(str(tmp_path), generator.objects(25), 10)
+    assert written == 25
+    bundles = sorted(tmp_path.iterdir())
+    assert [p.name for p in bundles] == ["bundle-000001.json", "bundle-000002.json", "bundle-000003.json"]
+    assert [len(json.loads(p.read_text())["objects"]) for p in bundles] == [10, 10, 5]
+
+
+def test_main(tmp_path, capsys):
+    """
+    Confirm that the command writes a seed file with the requested settings.
+    """
+    seed_file = tmp_path / "seed.json"
+    with mock.patch("sys.argv", [
+        "ARGV0", "--objects", "20", "--versions", "2", "--spec-versions", "2.0", "--start", "2021-06-01T00:00:00Z",
+        "--end", "2021-07-01T00:00:00Z", "--api-root", "root", str(seed_file),
+    ]):
+        medallion.scripts.generate.main()
+    (_, err) = capsys.readouterr()
+    assert "Generated 40 object versions" in err
+
+    seed = json.loads(seed_file.read_text())
+    collection = seed["root"]["collections"][0]
+    assert len(collection["objects"]) == len(collection["manifest"]) == 40
+    assert collection["media_types"] == ["application/stix+json;version=2.0"]
+    assert all("spec_version" not in obj for obj in collection["objects"])
+    assert min(date_added(entry) for entry in collection["manifest"]) == dt.datetime(2021, 6, 1, tzinfo=pytz.UTC)
@@ -0,0 +1,207 @@
+import io
+import json
+from unittest import mock
+
+import pytest
+import pytest_subtests  # noqa: F401
+
+from medallion.backends import mongodb_backend
+from medallion.common import JSONStreamReader
+from medallion.exceptions import ProcessingError
+import medallion.scripts.load
+import medallion.scripts.migrate
+
+pytestmark = pytest.mark.usefixtures("empty_environ")
+
+SEED_FILE = "medallion/test/data/default_data.json"
+
+
+def test_parser_help(capsys):
+    """
+    Confirm that the loader parser help can be printed.
+    """
+    parser = medallion.scripts.load._get_argparser()
+    parser.print_help()
+    (out, _) = capsys.readouterr()
+    assert "medallion-load v" in out
+
+
+def test_iter_bundle_paths(tmp_path):
+    """
+    Confirm that directories are expanded to their JSON files in name order.
+    """
+    for name in ("b.json", "a.json", "notes.txt"):
+        (tmp_path / name).write_text("{}")
+    single = tmp_path / "single.bundle"
+    paths = list(medallion.scripts.load.iter_bundle_paths([str(tmp_path), str(single)]))
+    assert [p.name for p in paths] == ["a.json", "b.json", "single.bundle"]
+
+
+def test_insert_in_batches():
+    """
+    Confirm that documents are sent with one insert_many call per batch.
+    """
+    collection = mock.MagicMock()
+    inserted = mongodb_backend.insert_in_batches(collection, ({"n": i} for i in range(25)), 10)
+    assert inserted == 25
+    assert [len(c[0][0]) for c in collection.insert_many.call_args_list] == [10, 10, 5]
+
+
+def test_json_stream_reader():
+    """
+    Confirm that values read a chunk at a time, with numbers and strings cut
+    between chunks, are decoded as a whole document would be.
+    """
+    document = {"a": [1.25, "x\\\"y", {"b": None}, [], {}], "c": -12e3, "d": True, "e": "\u00e9"}
+    text = json.dumps(document, indent=1)
+    for chunk_size in (1, 2, 3, 7, 64 * 1024):
+        reader = JSONStreamReader(io.StringIO(text), chunk_size)
+        members = {}
+        for name in reader.members():
+            if name == "a":
+                members[name] = list(reader.values())
+            elif name == "d":
+                reader.skip()
+            else:
+                members[name] = reader.value()
+        assert members == {"a": document["a"], "c": -12e3, "e": "\u00e9"}
+        assert reader.peek() == ""
+
+    with pytest.raises(ValueError):
+        list(JSONStreamReader(io.StringIO("[1, 2")).values())
+
+
+def test_load_seed_file():
+    """
+    Confirm that a seed file streamed from disk is stored as when it is read whole.
+    """
+    def stored_documents(load, source):
+        client = mock.MagicMock()
+        with mock.patch.object(
+            mongodb_backend, "reserve_sequences", return_value=1,
+        ), mock.patch.object(mongodb_backend, "create_missing_indexes"):
+            inserted = load(client, source, 4)
+        insert_many = client.__getitem__.return_value.__getitem__.return_value.insert_many
+        documents = [json.dumps(doc, sort_keys=True, default=str) for c in insert_many.call_args_list for doc in c[0][0]]
+        return inserted, sorted(documents)
+
+    with open(SEED_FILE, "r", encoding="utf-8") as f:
+        expected = stored_documents(mongodb_backend.load_seed_data, json.load(f))
+    assert expected[0] > 0
+    assert stored_documents(mongodb_backend.load_seed_file, SEED_FILE) == expected
+
+
+@mock.patch("pymongo.MongoClient")
+def test_main_seed_file(mock_client, subtests):
+    """
+    Confirm that a seed file is loaded into an empty database.
+    """
+    client = mock_client.return_value
+    with subtests.test(msg="empty database"):
+        client.list_database_names.return_value = []
+        with mock.patch.object(
+            mongodb_backend, "clear_database",
+        ) as mock_clear, mock.patch.object(
+            mongodb_backend, "load_seed_file", return_value=9,
+        ) as mock_seed, mock.patch(
+            "sys.argv", ["ARGV0", "--uri", "mongodb://db/", "--batch-size", "3", SEED_FILE]
+        ):
+            medallion.scripts.load.main()
+        mock_client.assert_called_once_with("mongodb://db/")
+        mock_clear.assert_called_once_with(client)
+        mock_seed.assert_called_once_with(client, SEED_FILE, 3)
+
+    with subtests.test(msg="established database"):
+        client.list_database_names.return_value = ["discovery_database"]
+        with mock.patch.object(
+            mongodb_backend, "load_seed_file",
+        ) as mock_seed, mock.patch(
+            "sys.argv", ["ARGV0", "--uri", "mongodb://db/", SEED_FILE]
+        ), pytest.raises(SystemExit):
+            medallion.scripts.load.main()
+        mock_seed.assert_not_called()
+
+
+@mock.patch("pymongo.MongoClient")
+def test_main_bundles(mock_client, tmp_path, capsys):
+    """
+    Confirm that bundles are loaded into the collection and indexes are built once.
+    """
+    bundle = {"type": "bundle", "objects": [{"id": "indicator--1"}, {"id": "indicator--2"}], "id": "bundle--1"}
+    for name in ("one.json", "two.json"):
+        (tmp_path / name).write_text(json.dumps(bundle))
+    loaded_objects = []
+
+    def load_bundle_objects(client, api_root, collection_id, objects, request_time, batch_size):
+        loaded_objects.append(list(objects))
+        return 2, 0
+
+    with mock.patch.object(
+        mongodb_backend, "check_collection_exists",
+    ) as mock_check, mock.patch.object(
+        mongodb_backend, "load_bundle_objects", side_effect=load_bundle_objects,
+    ), mock.patch.object(
+        mongodb_backend, "create_missing_indexes",
+    ) as mock_indexes, mock.patch(
+        "sys.argv", [
+            "ARGV0", "--uri", "mongodb://db/",
+            "--api-root", "trustgroup1", "--collection", "some-id", str(tmp_path),
+        ]
+    ):
+        medallion.scripts.load.main()
+    mock_check.assert_called_once_with(mock_client.return_value, "trustgroup1", "some-id")
+    assert loaded_objects == [bundle["objects"], bundle["objects"]]
+    mock_indexes.assert_called_once_with(
+        mock_client.return_value["trustgroup1"], mongodb_backend.API_ROOT_INDEXES,
+    )
+    (out, _) = capsys.readouterr()
+    assert "Loaded 4 objects" in out
+
+
+@mock.patch("pymongo.MongoClient")
+def test_main_bundles_unknown_collection(mock_client, tmp_path, capsys):
+    """
+    Confirm that nothing is loaded into an api root or collection which does not exist.
+    """
+    (tmp_path / "one.json").write_text(json.dumps({"type": "bundle", "objects": [{"id": "indicator--1"}]}))
+    with mock.patch.object(
+        mongodb_backend, "check_collection_exists",
+        side_effect=ProcessingError("Collection 'some-id' not found in API root 'trustgroup1'", 404),
+    ), mock.patch.object(
+        mongodb_backend, "load_bundle_objects",
+    ) as mock_load, mock.patch(
+        "sys.argv", [
+            "ARGV0", "--uri", "mongodb://db/",
+            "--api-root", "trustgroup1", "--collection", "some-id", str(tmp_path),
+        ]
+    ), pytest.raises(SystemExit):
+        medallion.scripts.load.main()
+    mock_load.assert_not_called()
+    (_, err) = capsys.readouterr()
+    assert "Collection 'some-id' not found" in err
+
+
+def test_main_requires_collection_with_api_root():
+    """
+    Confirm that --api-root and --collection must be provided together.
+    """
+    with mock.patch(
+        "sys.argv", ["ARGV0", "--uri", "mongodb://db/", "--api-root", "trustgroup1", SEED_FILE]
+    ), pytest.raises(SystemExit):
+        medallion.scripts.load.main()
+
+
+@mock.patch("pymongo.MongoClient")
+def test_migrate(mock_client, capsys):
+    """
+    Confirm that the migration numbers the objects of every api root once.
+    """
+    with mock.patch.object(
+        mongodb_backend, "migrate_object_sequences", return_value={"trustgroup1": 5, "api2": 0},
+    ) as mock_migrate, mock.patch(
+        "sys.argv", ["ARGV0", "--uri", "mongodb://db/", "--batch-size", "50"]
+    ):
+        medallion.scripts.migrate.main()
+    mock_migrate.assert_called_once_with(mock_client.return_value, 50)
+    (out, _) = capsys.readouterr()
+    assert "5 objects of trustgroup1" in out
@@ -1,12 +1,15 @@
+import json
 import logging
 from unittest import mock
 
 import pytest
 import pytest_subtests  # noqa: F401
 
+import medallion.backends.memory_backend
 import medallion.common
 import medallion.config
 import medallion.scripts.run
+import medallion.serving
 
 pytestmark = pytest.mark.usefixtures("empty_environ")
 
@@ -340,3 +343,130 @@ def test_main_config_arg_handling(subtests):
             mock_app.run.assert_called_once_with(**default_medallion_kwargs)
         mock_app.reset_mock()
         mock_load_config.reset_mock()
+
+
+def test_production_server(subtests):
+    """
+    Confirm that a production server is started with the server options, and
+    that the backend is left for its workers to set up.
+    """
+    safe_config = {"backend": {"module_class": "MemoryBackend"}}
+
+    class ExpectedException(BaseException):
+        pass
+
+    with mock.patch(
+        "medallion.config.load_config", return_value=safe_config,
+    ) as mock_load_config, mock.patch(
+        "medallion.serving.check_server_options",
+    ) as mock_check, mock.patch(
+        "medallion.serving.serve",
+    ) as mock_serve, mock.patch(
+        "medallion.scripts.run.connect_to_backend",
+    ) as mock_connect:
+        with subtests.test(msg="defaults"):
+            with mock.patch(
+                "sys.argv", ["ARGV0", "--server", "gunicorn", "-c", "medallion.conf", "--no-conf-dir"]
+            ):
+                medallion.scripts.run.main()
+            mock_check.assert_called_once_with("gunicorn", 1, None)
+            mock_load_config.assert_called_once_with("medallion.conf", None)
+            mock_serve.assert_called_once_with(
+                "gunicorn", "medallion.conf", None, host="127.0.0.1", port=5000, log_level="WARN",
+                workers=1, threads=None, keep_alive=None, graceful_timeout=30,
+            )
+            mock_connect.assert_not_called()
+        mock_serve.reset_mock()
+
+        with subtests.test(msg="server options"):
+            with mock.patch(
+                "sys.argv", [
+                    "ARGV0", "--server", "uvicorn", "--workers", "4", "--threads", "8", "--keep-alive", "10",
+                    "--graceful-timeout", "60", "--no-conf-dir",
+                ]
+            ):
+                medallion.scripts.run.main()
+            assert mock_serve.call_args[1] == {
+                "host": "127.0.0.1", "port": 5000, "log_level": "WARN",
+                "workers": 4, "threads": 8, "keep_alive": 10, "graceful_timeout": 60,
+            }
+            mock_connect.assert_not_called()
+        mock_serve.reset_mock()
+
+        for argv, message in (
+            (["--workers", "2"], "need a production --server"),
+            (["--server", "waitress", "--debug-mode"], "only available with the development server"),
+        ):
+            with subtests.test(msg=" ".join(argv)):
+                with mock.patch(
+                    "sys.argv", ["ARGV0"] + argv,
+                ), mock.patch(
+                    "argparse.ArgumentParser.error", side_effect=ExpectedException,
+                ) as mock_error, pytest.raises(ExpectedException):
+                    medallion.scripts.run.main()
+                ((msg, ), _) = mock_error.call_args
+                assert message in msg
+                mock_serve.assert_not_called()
+
+
+def test_check_server_options(subtests):
+    """
+    Confirm that servers which are not installed, and options they do not
+    support, are refused.
+    """
+    with subtests.test(msg="server not installed"):
+        with mock.patch("importlib.util.find_spec", return_value=None):
+            with pytest.raises(ValueError, match=r"pip install medallion\[uvicorn\]"):
+                medallion.serving.check_server_options("uvicorn")
+    with mock.patch("importlib.util.find_spec"):
+        with subtests.test(msg="installed"):
+            medallion.serving.check_server_options("gunicorn", workers=4, threads=2)
+        with subtests.test(msg="waitress workers"):
+            with pytest.raises(ValueError, match="single process"):
+                medallion.serving.check_server_options("waitress", workers=2)
+        with subtests.test(msg="no workers"):
+            with pytest.raises(ValueError, match="positive"):
+                medallion.serving.check_server_options("gunicorn", workers=0)
+
+
+def test_create_app(tmp_path):
+    """
+    Confirm that the application factory configures the application and its
+    backend from the configuration paths in the environment, and that the
+    Memory backend refuses to be served unless forced.
+    """
+    with open("medallion/test/data/config.json") as f:
+        configuration = json.load(f)
+    conf_file = tmp_path / "config.json"
+    conf_file.write_text(json.dumps(configuration))
+    with mock.patch.dict("os.environ", {"MEDALLION_CONFFILE": str(conf_file), "MEDALLION_CONFDIR": ""}):
+        with pytest.raises(RuntimeError, match="force_wsgi"):
+            medallion.serving.create_app()
+
+        configuration["backend"]["force_wsgi"] = True
+        conf_file.write_text(json.dumps(configuration))
+        app = medallion.serving.create_app()
+    assert app is medallion.common.APPLICATION_INSTANCE
+    assert app.users_config["admin"] == "Password0"
+    assert isinstance(app.medallion_backend, medallion.backends.memory_backend.MemoryBackend)
+    assert app.blueprints
+
+
+def test_gunicorn_application():
+    """
+    Confirm that the gunicorn application takes the server options, and sets
+    the backend up with the number of workers when a worker loads it.
+    """
+    pytest.importorskip("gunicorn")
+    application = medallion.serving.gunicorn_application(
+        "medallion/test/data/config.json", None, {"bind": "127.0.0.1:5000", "workers": 3, "threads": 2},
+    )
+    assert application.cfg.workers == 3
+    assert application.cfg.threads == 2
+    with mock.patch("medallion.serving.connect_to_backend") as mock_connect:
+        assert application.load() is medallion.common.APPLICATION_INSTANCE
+    mock_connect.assert_called_once()
+    # the backend knows it is served by several processes
+    ((backend_config, ), _) = mock_connect.call_args
+    assert backend_config["workers"] == 3
+    assert backend_config["server"] == "gunicorn"
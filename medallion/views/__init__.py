@@ -1,27 +1,48 @@
+import functools
 import re
 
-from flask import request
+from flask import json, request
 
 from ..exceptions import ProcessingError
+from ..instrumentation import INSTRUMENTATION
 
 MEDIA_TYPE_TAXII_ANY = "application/taxii+json"
 MEDIA_TYPE_TAXII_V21 = "{media};version=2.1".format(media=MEDIA_TYPE_TAXII_ANY)
 
 
-def validate_version_parameter_in_accept_header():
-    """All endpoints need to check the Accept Header for the correct Media Type"""
-    accept_header = request.headers.get("accept", "").replace(" ", "").split(",")
-    found = False
+# Matches one item of an Accept or Content-Type header, without spaces
+TAXII_MEDIA_TYPE_PATTERN = re.compile(r"^application/taxii\+json(;version=(\d\.\d))?$")
+
+
+@functools.lru_cache(maxsize=128)
+def parse_taxii_media_type(header):
+    """
+    Finds the first TAXII media type of an Accept or Content-Type header.
+    Clients send the same few header values over and over, so the results are
+    kept in a small LRU cache.
+
+    Returns:
+        tuple of whether a TAXII media type was found, and its version
+        parameter (None if it has none)
 
-    for item in accept_header:
-        result = re.match(r"^application/taxii\+json(;version=(\d\.\d))?$", item)
+    """
+    for item in header.replace(" ", "").split(","):
+        result = TAXII_MEDIA_TYPE_PATTERN.match(item)
         if result:
-            if len(result.groups()) >= 1:
-                version_str = result.group(2)
-                if version_str != "2.1":  # The server only supports 2.1
-                    raise ProcessingError("The server does not support version {}".format(version_str), 406)
-            found = True
-            break
+            return True, result.group(2)
+    return False, None
 
+
+def validate_version_parameter_in_accept_header():
+    """All endpoints need to check the Accept Header for the correct Media Type"""
+    found, version_str = parse_taxii_media_type(request.headers.get("accept", ""))
     if found is False:
         raise ProcessingError("Media type in the Accept header is invalid or not found", 406)
+    if version_str != "2.1":  # The server only supports 2.1
+        raise ProcessingError("The server does not support version {}".format(version_str), 406)
+
+
+def dumps_resource(resource):
+    """Serializes a resource for a response, timed as the serialize phase of the request"""
+    with INSTRUMENTATION.phase("serialize"):
+        return json.dumps(resource)
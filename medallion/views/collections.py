@@ -1,6 +1,9 @@
-from flask import Blueprint, Response, current_app, json
+from flask import Blueprint, Response, current_app
 
-from . import MEDIA_TYPE_TAXII_V21, validate_version_parameter_in_accept_header
+from . import (
+    MEDIA_TYPE_TAXII_V21, dumps_resource,
+    validate_version_parameter_in_accept_header
+)
 from .. import auth
 from .discovery import api_root_exists
 from .objects import collection_exists
@@ -29,7 +32,7 @@ def get_collections(api_root):
     api_root_exists(api_root)
     collections = current_app.medallion_backend.get_collections(api_root)
     return Response(
-        response=json.dumps(collections),
+        response=dumps_resource(collections),
         status=200,
         mimetype=MEDIA_TYPE_TAXII_V21,
     )
@@ -59,7 +62,7 @@ def get_collection(api_root, collection_id):
     collection = current_app.medallion_backend.get_collection(api_root, collection_id)
 
     return Response(
-        response=json.dumps(collection),
+        response=dumps_resource(collection),
         status=200,
         mimetype=MEDIA_TYPE_TAXII_V21,
     )
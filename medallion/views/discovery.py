@@ -1,6 +1,9 @@
-from flask import Blueprint, Response, current_app, json
+from flask import Blueprint, Response, current_app
 
-from . import MEDIA_TYPE_TAXII_V21, validate_version_parameter_in_accept_header
+from . import (
+    MEDIA_TYPE_TAXII_V21, dumps_resource,
+    validate_version_parameter_in_accept_header
+)
 from .. import auth
 from ..exceptions import ProcessingError
 
@@ -33,7 +36,7 @@ def get_server_discovery():
 
     if server_discovery:
         return Response(
-            response=json.dumps(server_discovery),
+            response=dumps_resource(server_discovery),
             status=200,
             mimetype=MEDIA_TYPE_TAXII_V21,
         )
@@ -60,7 +63,7 @@ def get_api_root_information(api_root):
     api_root_exists(api_root)
     root_info = current_app.medallion_backend.get_api_root_information(api_root)
     return Response(
-        response=json.dumps(root_info),
+        response=dumps_resource(root_info),
         status=200,
         mimetype=MEDIA_TYPE_TAXII_V21,
     )
@@ -89,7 +92,7 @@ def get_status(api_root, status_id):
 
     if status:
         return Response(
-            response=json.dumps(status),
+            response=dumps_resource(status),
             status=200,
             mimetype=MEDIA_TYPE_TAXII_V21,
         )
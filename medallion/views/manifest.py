@@ -1,6 +1,9 @@
-from flask import Blueprint, Response, current_app, json, request
+from flask import Blueprint, Response, current_app, request
 
-from . import MEDIA_TYPE_TAXII_V21, validate_version_parameter_in_accept_header
+from . import (
+    MEDIA_TYPE_TAXII_V21, dumps_resource,
+    validate_version_parameter_in_accept_header
+)
 from .. import auth
 from .discovery import api_root_exists
 from .objects import (
@@ -37,7 +40,7 @@ def get_object_manifest(api_root, collection_id):
     )
 
     return Response(
-        response=json.dumps(manifests),
+        response=dumps_resource(manifests),
         status=200,
         headers=headers,
         mimetype=MEDIA_TYPE_TAXII_V21,
@@ -0,0 +1,28 @@
+from flask import Blueprint, Response
+
+from .. import auth
+from ..exceptions import ProcessingError
+from ..instrumentation import INSTRUMENTATION
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+@auth.login_required
+def get_metrics():
+    """
+    Request counts and the durations of the requests and of their phases, in
+    the Prometheus text exposition format. Only served when the ``metrics``
+    option of the "taxii" section is enabled.
+
+    Returns:
+        metrics: the metrics of this server process.
+
+    """
+    if not INSTRUMENTATION.metrics:
+        raise ProcessingError("Metrics are not enabled", 404)
+    return Response(
+        response=INSTRUMENTATION.registry.render(),
+        status=200,
+        mimetype="text/plain; version=0.0.4",
+    )
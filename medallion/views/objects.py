@@ -1,16 +1,25 @@
 import logging
-import re
+import math
 
-from flask import Blueprint, Response, current_app, json, request
+from flask import Blueprint, Response, current_app, request
 
-from . import MEDIA_TYPE_TAXII_V21, validate_version_parameter_in_accept_header
+from . import (
+    MEDIA_TYPE_TAXII_V21, dumps_resource, parse_taxii_media_type,
+    validate_version_parameter_in_accept_header
+)
 from .. import auth
-from ..common import get_timestamp
+from ..common import get_timestamp, string_to_datetime
 from ..exceptions import ProcessingError
 from .discovery import api_root_exists
 
 objects_bp = Blueprint("objects", __name__)
 
+# Longest wait of a change feed request, unless set by the taxii configuration
+DEFAULT_MAX_CHANGE_FEED_WAIT = 30
+
+# Most objects a bulk request may address, unless set by the taxii configuration
+DEFAULT_MAX_BULK_SIZE = 1000
+
 # Module-level logger
 log = logging.getLogger(__name__)
 
@@ -54,21 +63,11 @@ def validate_size_in_request_body(api_root):
 
 
 def validate_version_parameter_in_content_type_header():
-    content_type = request.headers.get("content_type", "").replace(" ", "").split(",")
-    found = False
-
-    for item in content_type:
-        result = re.match(r"^application/taxii\+json(;version=(\d\.\d))?$", item)
-        if result:
-            if len(result.groups()) >= 2:
-                version_str = result.group(2)
-                if version_str != "2.1":  # The server only supports 2.1
-                    raise ProcessingError("The server does not support version {}".format(version_str), 415)
-            found = True
-            break
-
+    found, version_str = parse_taxii_media_type(request.headers.get("content_type", ""))
     if found is False:
         raise ProcessingError("Media type in the Content-Type header is invalid or not found", 415)
+    if version_str != "2.1":  # The server only supports 2.1
+        raise ProcessingError("The server does not support version {}".format(version_str), 415)
 
 
 def validate_limit_parameter():
@@ -85,6 +84,55 @@ def validate_limit_parameter():
     return limit
 
 
+def validate_change_feed_parameters():
+    max_wait = current_app.taxii_config.get("max_change_feed_wait", DEFAULT_MAX_CHANGE_FEED_WAIT)
+    try:
+        since = request.args.get("since")
+        if since is not None:
+            since = int(since)
+        timeout = float(request.args.get("timeout", max_wait))
+    except ValueError:
+        raise ProcessingError("The server did not understand the request or filter parameters", 400)
+    if not math.isfinite(timeout):
+        raise ProcessingError("The timeout parameter must be a finite number", 400)
+    if (since is not None and since < 0) or timeout < 0:
+        raise ProcessingError("The since and timeout parameters cannot be negative", 400)
+    return since, min(timeout, max_wait)
+
+
+def valid_version_selector(version):
+    """True for an empty selector or one holding match[version] values: first, last, all or timestamps"""
+    for value in filter(None, version.split(",")):
+        if value not in ("first", "last", "all"):
+            try:
+                string_to_datetime(value)
+            except ValueError:
+                return False
+    return True
+
+
+def validate_bulk_request_body():
+    body = request.get_json(force=True, silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get("objects"), list):
+        raise ProcessingError("The bulk request body must have an 'objects' list", 400)
+    max_size = current_app.taxii_config.get("max_bulk_size", DEFAULT_MAX_BULK_SIZE)
+    if len(body["objects"]) > max_size:
+        raise ProcessingError("A bulk request cannot address more than {} objects".format(max_size), 413)
+
+    entries = []
+    for item in body["objects"]:
+        if isinstance(item, str):
+            item = {"id": item}
+        if (
+            not isinstance(item, dict) or not isinstance(item.get("id"), str)
+            or not isinstance(item.get("version", ""), str)
+            or not valid_version_selector(item.get("version", ""))
+        ):
+            raise ProcessingError("The server did not understand the bulk request entry {!r}".format(item), 400)
+        entries.append((item["id"], item.get("version") or None))
+    return entries
+
+
 @objects_bp.route("/<string:api_root>/collections/<string:collection_id>/objects/", methods=["GET", "POST"])
 @auth.login_required
 def get_or_add_objects(api_root, collection_id):
@@ -117,7 +165,7 @@ def get_or_add_objects(api_root, collection_id):
         )
 
         return Response(
-            response=json.dumps(objects),
+            response=dumps_resource(objects),
             status=200,
             headers=headers,
             mimetype=MEDIA_TYPE_TAXII_V21,
@@ -131,7 +179,7 @@ def get_or_add_objects(api_root, collection_id):
             api_root, collection_id, request.get_json(force=True), request_time
         )
         return Response(
-            response=json.dumps(status),
+            response=dumps_resource(status),
             status=202,
             mimetype=MEDIA_TYPE_TAXII_V21,
         )
@@ -169,7 +217,7 @@ def get_or_delete_object(api_root, collection_id, object_id):
         )
         if objects or request.args:
             return Response(
-                response=json.dumps(objects),
+                response=dumps_resource(objects),
                 status=200,
                 headers=headers,
                 mimetype=MEDIA_TYPE_TAXII_V21,
@@ -215,8 +263,130 @@ def get_object_versions(api_root, collection_id, object_id):
         api_root, collection_id, object_id, request.args.to_dict(), ("spec_version",), limit
     )
     return Response(
-        response=json.dumps(versions),
+        response=dumps_resource(versions),
         status=200,
         headers=headers,
         mimetype=MEDIA_TYPE_TAXII_V21,
     )
+
+
+@objects_bp.route("/<string:api_root>/collections/<string:collection_id>/changes/", methods=["GET"])
+@auth.login_required
+def get_changes(api_root, collection_id):
+    """
+    Change feed extension: long-polls for the objects added to a Collection.
+
+    The client passes the ``sequence`` of its previous response as ``since``;
+    the request returns as soon as objects were added after it, or after
+    ``timeout`` seconds (capped by the ``max_change_feed_wait`` taxii setting)
+    with no objects. Without ``since`` it returns the current sequence at once.
+    When the changes after ``since`` are no longer held by the server the
+    request fails with 410 and the client must catch up with Get Objects.
+
+    Args:
+        api_root (str): the base URL of the API Root
+        collection_id (str): the `identifier` of the Collection being requested
+
+    Returns:
+        resource: the current ``sequence`` of the Collection and the ``objects``
+            added after ``since``.
+
+    """
+    validate_version_parameter_in_accept_header()
+    api_root_exists(api_root)
+    collection_exists(api_root, collection_id)
+    permission_to_read(api_root, collection_id)
+
+    since, timeout = validate_change_feed_parameters()
+    sequence, objects = current_app.medallion_backend.get_changes(api_root, collection_id, since, timeout)
+    if objects is None:
+        raise ProcessingError("Changes after sequence {} are no longer available".format(since), 410)
+
+    resource = {"sequence": sequence}
+    if objects:
+        resource["objects"] = objects
+    return Response(
+        response=dumps_resource(resource),
+        status=200,
+        mimetype=MEDIA_TYPE_TAXII_V21,
+    )
+
+
+@objects_bp.route("/<string:api_root>/collections/<string:collection_id>/bulk/fetch/", methods=["POST"])
+@auth.login_required
+def bulk_fetch_objects(api_root, collection_id):
+    """
+    Bulk fetch extension: returns several objects of a Collection at once.
+
+    The request body lists the ``objects`` to return, each an object id or an
+    ``{"id": ..., "version": ...}`` entry whose ``version`` takes the values of
+    the ``match[version]`` parameter of Get Object (the latest version by
+    default). At most ``max_bulk_size`` objects, from the "taxii" section of
+    the configuration, may be addressed by one request.
+
+    Args:
+        api_root (str): the base URL of the API Root
+        collection_id (str): the `identifier` of the Collection being requested
+
+    Returns:
+        resource: the ``objects`` found and the ids which were ``not_found``.
+
+    """
+    validate_version_parameter_in_accept_header()
+    api_root_exists(api_root)
+    collection_exists(api_root, collection_id)
+    validate_version_parameter_in_content_type_header()
+    permission_to_read(api_root, collection_id)
+    validate_size_in_request_body(api_root)
+
+    entries = validate_bulk_request_body()
+    objects, missing = current_app.medallion_backend.fetch_objects(api_root, collection_id, entries)
+
+    resource = {}
+    if objects:
+        resource["objects"] = objects
+    if missing:
+        resource["not_found"] = missing
+    return Response(
+        response=dumps_resource(resource),
+        status=200,
+        mimetype=MEDIA_TYPE_TAXII_V21,
+    )
+
+
+@objects_bp.route("/<string:api_root>/collections/<string:collection_id>/bulk/delete/", methods=["POST"])
+@auth.login_required
+def bulk_delete_objects(api_root, collection_id):
+    """
+    Bulk delete extension: deletes several objects of a Collection at once.
+
+    The request body lists the ``objects`` to delete as for the bulk fetch
+    endpoint; each entry deletes the versions Delete An Object would delete
+    with that ``match[version]`` value.
+
+    Args:
+        api_root (str): the base URL of the API Root
+        collection_id (str): the `identifier` of the Collection being requested
+
+    Returns:
+        resource: the ids which were ``not_found``.
+
+    """
+    validate_version_parameter_in_accept_header()
+    api_root_exists(api_root)
+    collection_exists(api_root, collection_id)
+    validate_version_parameter_in_content_type_header()
+    permission_to_read_and_write(api_root, collection_id)
+    validate_size_in_request_body(api_root)
+
+    entries = validate_bulk_request_body()
+    missing = current_app.medallion_backend.delete_objects(api_root, collection_id, entries)
+
+    resource = {}
+    if missing:
+        resource["not_found"] = missing
+    return Response(
+        response=dumps_resource(resource),
+        status=200,
+        mimetype=MEDIA_TYPE_TAXII_V21,
+    )
@@ -40,13 +40,13 @@ setup(
         "Topic :: Security",
         "License :: OSI Approved :: BSD License",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",
     ],
     keywords="taxii taxii2 server json cti cyber threat intelligence",
     packages=find_packages(exclude=["*.test", "*.test.data"]),
+    python_requires=">=3.7",
     install_requires=[
         "appdirs>=1.4.4",
         "environ-config>=21.1",
@@ -60,6 +60,11 @@ setup(
     entry_points={
         "console_scripts": [
             "medallion = medallion.scripts.run:main",
+            "medallion-load = medallion.scripts.load:main",
+            "medallion-migrate = medallion.scripts.migrate:main",
+            "medallion-generate = medallion.scripts.generate:main",
+            "medallion-benchmark = medallion.benchmarks.endpoints:main",
+            "medallion-loadgen = medallion.benchmarks.loadgen:main",
         ],
     },
     extras_require={
@@ -77,6 +82,22 @@ setup(
         "mongo": [
             "pymongo",
         ],
+        "bcrypt": [
+            "bcrypt",
+        ],
+        "argon2": [
+            "argon2-cffi",
+        ],
+        "gunicorn": [
+            "gunicorn",
+        ],
+        "waitress": [
+            "waitress",
+        ],
+        "uvicorn": [
+            "a2wsgi",
+            "uvicorn",
+        ],
     },
     project_urls={
         'Documentation': 'https://medallion.readthedocs.io/',